@@ -13,40 +13,1481 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see https://www.gnu.org/licenses/
 
+import array
+import bisect
 import cmd
+import contextlib
+import functools
+import io
+import itertools
+import math
+import numbers
 import OSC
+import os
+import struct
+import sys
+import threading
 import time
+import weakref
 
-class BitBeats(cmd.Cmd):
-    def __init__(self, filename=None):
-        super().__init__()
+class RealClock:
+    """Wall clock used for live playback"""
+
+    def now(self):
+        """Returns the current time in seconds"""
+        return time.monotonic()
+
+    def sleep_until(self, deadline):
+        """Blocks until the given time is reached"""
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+class VirtualClock:
+    """Clock that jumps straight to every deadline, for time-compressed runs"""
+
+    def __init__(self, start=0.0):
+        self.time = start
+
+    def now(self):
+        """Returns the current virtual time in seconds"""
+        return self.time
+
+    def sleep_until(self, deadline):
+        """Advances the virtual time to the given deadline without blocking"""
+        if deadline > self.time:
+            self.time = deadline
+
+class OSCTransport:
+    """Sends OSC messages over UDP to the Pd patch
+
+    Every transport has its own OSC client and socket. Packets are written
+    one at a time under a lock, so the transport can be shared by threads.
+    """
+
+    def __init__(self, host="localhost", port=9999, client=None):
+        self.host = host
+        self.port = port
+        self.client = client or OSC.OSCSimpleUDPClient()
+        self._lock = threading.Lock()
+
+    def send(self, msg):
+        """Sends an OSCMessage (or OSCBundle), returning the packet size"""
+        with self._lock:
+            return self.client.sendto(msg, (self.host, self.port))
+
+    def set_capture(self, capture):
+        """Records every packet sent in capture, an OSC.OSCCaptureWriter (None stops)"""
+        self.client.setCapture(capture)
+
+class TargetHealth:
+    """Send counters and backoff state of one target of a MultiTransport"""
+
+    def __init__(self):
+        self.sent = 0
+        self.errors = 0
+        self.skipped = 0
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error = None
+
+    def error_rate(self):
+        """Returns the share of failed sends"""
+        attempts = self.sent + self.errors
+        return self.errors / attempts if attempts else 0.0
+
+class MultiTransport:
+    """Sends OSC messages to several Pd instances, on other ports or hosts
+
+    Targets are given as 'host:port[/prefix]' and kept in an
+    OSC.OSCMultiClient, which prepends the prefix and routes only the
+    channels given for a target (global messages like /tempo and /start
+    always reach all targets). Every target has its own connected UDP
+    socket, so a Pd instance that is not running shows up as an error of
+    that target only. A failing target is skipped for a backoff time that
+    doubles with every further error, while the others keep receiving
+    every message.
+    """
+
+    GLOBAL_ADDRESSES = ("/tempo", "/start", "/stop", "/master_vol")
+    min_backoff = 0.1
+    max_backoff = 5.0
+
+    def __init__(self, targets=(), clock=None):
+        self.clock = clock or RealClock()
+        self.routes = OSC.OSCMultiClient()
+        self.names = {}
+        self.channels = {}
+        self.clients = {}
+        self.health = {}
+        self.capture = None
+        self._lock = threading.Lock()
+        for target in targets:
+            self.add_target(target)
+
+    def add_target(self, url, channels=None):
+        """Adds (or changes) a target, receiving only the given channel names
+        ('square1', 'noise', ...) or all channels when None"""
+        address, prefix = OSC.parseUrlStr(url)
+        if not address[0] or address[1] is None:
+            raise BitBeatsError(f"Invalid target: {url}, use HOST:PORT[/PREFIX]", "url", url)
+        filters = None
+        if channels:
+            filters = dict.fromkeys(self.GLOBAL_ADDRESSES + tuple("/" + channel for channel in channels), True)
+        client = OSC.OSCClient()
+        client.connect(address)
+        client.setCapture(self.capture)
+        with self._lock:
+            if address in self.routes.targets:
+                self.routes.delOSCTarget(address)
+                self.clients[address].close()
+            self.routes.setOSCTarget(address, prefix, filters)
+            self.names[address] = url
+            self.channels[address] = list(channels) if channels else None
+            self.clients[address] = client
+            self.health[address] = TargetHealth()
+
+    def remove_target(self, url):
+        """Removes a target given as 'host:port'"""
+        address, _ = OSC.parseUrlStr(url)
+        with self._lock:
+            if address not in self.routes.targets:
+                raise BitBeatsError(f"No such target: {url}", "url", url)
+            self.routes.delOSCTarget(address)
+            self.clients.pop(address).close()
+            del self.names[address], self.channels[address], self.health[address]
+
+    def send(self, msg):
+        """Sends an OSCMessage (or OSCBundle) to every target it is routed to,
+        returning the size of the largest packet. Raises OSCClientError only
+        if none of the targets could be reached."""
+        now = self.clock.now()
+        size = 0
+        failed = []
+        with self._lock:
+            for address, health in self.health.items():
+                if now < health.retry_at:
+                    health.skipped += 1
+                    continue
+                out = self.routes.messageForTarget(address, msg)
+                if out is None:
+                    continue
+                try:
+                    size = max(size, self.clients[address].send(out, timeout=0))
+                except OSC.OSCClientError as e:
+                    health.errors += 1
+                    health.failures += 1
+                    health.last_error = str(e)
+                    health.retry_at = now + min(self.min_backoff * 2 ** (health.failures - 1), self.max_backoff)
+                    failed.append(f"{self.names[address]}: {e}")
+                else:
+                    health.sent += 1
+                    health.failures = 0
+        if failed and not size:
+            raise OSC.OSCClientError("; ".join(failed))
+        return size
+
+    def set_capture(self, capture):
+        """Records the packets sent to every target in capture, an
+        OSC.OSCCaptureWriter, each with its destination (None stops)"""
+        with self._lock:
+            self.capture = capture
+            for client in self.clients.values():
+                client.setCapture(capture)
+
+    def close(self):
+        """Closes the sockets of all targets"""
+        with self._lock:
+            for client in self.clients.values():
+                client.close()
+
+# returned by a transport's send() when it holds the message back and
+# reports the packet to its 'on_send' callback once it is really sent
+QUEUED = -1
+
+class CoalescingTransport:
+    """Holds back updates until the next bar and sends only the latest ones
+
+    While the sequencer runs, every message is queued by the part of the
+    state it sets (the 'values' or 'values_eff' of a channel, the tempo,
+    the master volume). A newer message replaces the queued one, so a
+    channel played five times within a bar is sent once. The queue is sent
+    as one bundle 'lookahead' seconds before the next bar starts, and holds
+    at most one message per channel and setting however slow the receiver
+    is. '/start' and '/stop' send what is queued and then go out at once;
+    while stopped, messages are not held back.
+
+    The bar grid follows the '/start' and '/tempo' messages passing
+    through, like bb_daemon. Errors of the wrapped transport are counted,
+    and the last one is kept in 'last_error'. Queued messages are not sent
+    yet, so send() returns QUEUED for them; the bundles sent before the
+    bars are reported to on_send(address, seconds, size, error) instead.
+
+    A background thread sends the queue before every bar. It exits when
+    the queue is closed or no longer used. Without the thread ('thread'
+    False, for virtual clocks), the queue is sent by flush_due() and by
+    the first send() after the flush time.
+    """
+
+    def __init__(self, transport, clock=None, lookahead=0.002, on_send=None, thread=True):
+        self.transport = transport
+        self.clock = clock or RealClock()
+        self.lookahead = lookahead
+        self.on_send = on_send
+        # 60 BPM until a '/tempo' passes through
+        self.bar_duration = 4.0
+        self.next_bar = None
+        self.pending = {}
+        self.queued = 0
+        self.superseded = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_error = None
+        self.running = True
+        self._condition = threading.Condition()
+        self._thread = None
+        if thread:
+            # the thread only holds a weak reference, so that it ends with the queue
+            self._thread = threading.Thread(target=CoalescingTransport._run, args=(weakref.ref(self),), daemon=True)
+            self._thread.start()
+
+    def send(self, msg):
+        """Queues an OSCMessage (or the messages of an OSCBundle) for the next
+        bar and returns QUEUED, or sends it straight away while the sequencer
+        is stopped"""
+        msgs = msg.values() if isinstance(msg, OSC.OSCBundle) else [msg]
+        with self._condition:
+            self._flush_due()
+            if self.next_bar is not None and not any(m.address in ("/start", "/stop") for m in msgs):
+                for m in msgs:
+                    key = _state_key(m)
+                    if self.pending.pop(key, None) is not None:
+                        self.superseded += 1
+                    self.pending[key] = m
+                    self.queued += 1
+                return QUEUED
+            self._flush()
+            for m in msgs:
+                if m.address == "/tempo":
+                    self.bar_duration = 8 * 60 / m.values()[0]
+                elif m.address == "/start":
+                    self.next_bar = self.clock.now() + self.bar_duration
+                    self._condition.notify()
+                elif m.address == "/stop":
+                    self.next_bar = None
+            return self.transport.send(msg)
+
+    def _flush(self):
+        """Sends the queued messages as one bundle; called with the condition held"""
+        msgs = list(self.pending.values())
+        self.pending.clear()
+        for msg in msgs:
+            if msg.address == "/tempo":
+                self.bar_duration = 8 * 60 / msg.values()[0]
+        if not msgs:
+            return
+        self.flushes += 1
+        started = time.perf_counter()
+        size, error = 0, None
+        try:
+            size = self.transport.send(_bundle(msgs)) or 0
+        except Exception as e:
+            self.errors += 1
+            self.last_error = _format_exception_message(e)
+            error = e
+        if self.on_send is not None:
+            self.on_send("#bundle", time.perf_counter() - started, size, error)
+
+    def _flush_due(self):
+        """Sends the queue if the flush time of the next bar has come and moves
+        on to the following bar; called with the condition held"""
+        if self.next_bar is None or self.clock.now() < self.next_bar - self.lookahead:
+            return
+        self._flush()
+        missed = math.floor((self.clock.now() - self.next_bar + self.lookahead) / self.bar_duration)
+        self.next_bar += (missed + 1) * self.bar_duration
+
+    def flush_due(self):
+        """Sends the queue if the flush time of the next bar has come. Returns
+        the next flush time, or None while the sequencer is stopped."""
+        with self._condition:
+            self._flush_due()
+            return None if self.next_bar is None or not self.running else self.next_bar - self.lookahead
+
+    @staticmethod
+    def _run(ref):
+        while True:
+            queue = ref()
+            if queue is None or not queue.running:
+                return
+            clock, condition = queue.clock, queue._condition
+            deadline = queue.flush_due()
+            if deadline is None:
+                with condition:
+                    if queue.running and queue.next_bar is None:
+                        del queue
+                        # woken by '/start' and close(); the timeout notices a discarded queue
+                        condition.wait(0.5)
+                continue
+            del queue
+            clock.sleep_until(deadline)
+
+    def set_capture(self, capture):
+        """Records what the wrapped transport sends in capture (None stops)"""
+        self.transport.set_capture(capture)
+
+    def summary(self):
+        """Returns the counters of the queue as a dict"""
+        with self._condition:
+            return {"queued": self.queued, "superseded": self.superseded, "flushes": self.flushes,
+                    "pending": len(self.pending), "errors": self.errors}
+
+    def close(self):
+        """Sends what is queued and stops the queue, leaving the wrapped transport open"""
+        with self._condition:
+            self.running = False
+            self._flush()
+            self._condition.notify()
+
+class MemoryTransport:
+    """Captures OSC messages in memory instead of sending them
+
+    Each packet is stored as a (timestamp, message) tuple, with the
+    timestamp taken from the given clock (None without a clock). Appending
+    to the list is atomic, so the transport can be shared by threads.
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock
+        self.packets = []
+
+    def send(self, msg):
+        """Records an OSCMessage (or OSCBundle)"""
+        stamp = self.clock.now() if self.clock else None
+        self.packets.append((stamp, msg))
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in seconds
+
+    The buckets grow by a factor of 2^(1/4) from 1 microsecond to about
+    half a minute, so percentiles are accurate to about 19 percent.
+    """
+
+    BOUNDS = [1e-6 * 2 ** (i / 4) for i in range(100)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        """Records one duration"""
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Returns the upper bound of the bucket holding the p-th percentile"""
+        rank = p / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+        return self.max
+
+class SessionStats:
+    """Latency histograms and counters of a BitBeats session
+
+    Updates are made under a lock, so several threads can record into the
+    same statistics.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clears all histograms and counters"""
+        self.histograms = {}
+        self.messages = 0
+        self.addresses = {}
+        self.send_errors = 0
+        self.late_bars = 0
+        self.started = time.perf_counter()
+
+    def record(self, name, seconds):
+        """Adds a duration to the named histogram"""
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.add(seconds)
+
+    def record_send(self, address, seconds, failed=False):
+        """Counts a packet sent to an OSC address and the time it took to write"""
+        with self.lock:
+            histogram = self.histograms.get("write")
+            if histogram is None:
+                histogram = self.histograms["write"] = LatencyHistogram()
+            histogram.add(seconds)
+            self.messages += 1
+            self.addresses[address] = self.addresses.get(address, 0) + 1
+            if failed:
+                self.send_errors += 1
+
+# numbers the flight recorder dumps of the process
+_flight_dumps = itertools.count(1)
+
+class FlightRecorder:
+    """Fixed-size ring buffer of the most recent events of a session
+
+    Every event has a kind, a time.perf_counter() timestamp, a duration (or
+    lateness) in seconds, a packet size and a text: the command line, OSC
+    address or exception. The numbers are kept in preallocated arrays, so
+    recording costs under a microsecond and no memory is allocated.
+    Threads claim slots from an itertools.count(), which is atomic, so
+    several threads can share a recorder without a lock. An event being
+    written while events() runs may show up half-written.
+    """
+
+    COMMAND, SEND, DEADLINE, ERROR = range(4)
+    KIND_NAMES = ("command", "send", "deadline", "error")
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.kinds = array.array("B", bytes(capacity))
+        self.stamps = array.array("d", bytes(8 * capacity))
+        self.values = array.array("d", bytes(8 * capacity))
+        self.sizes = array.array("L", [0]) * capacity
+        self.texts = [None] * capacity
+        self.total = 0
+        self._slots = itertools.count()
+
+    def record(self, kind, text, value=0.0, size=0):
+        """Adds an event, overwriting the oldest one when full"""
+        slot = next(self._slots)
+        index = slot % self.capacity
+        self.kinds[index] = kind
+        self.stamps[index] = time.perf_counter()
+        self.values[index] = value
+        self.sizes[index] = size
+        self.texts[index] = text
+        self.total = slot + 1
+
+    def events(self):
+        """Returns the recorded events from oldest to newest as
+        (kind name, timestamp, value, size, text) tuples"""
+        total = self.total
+        order = [i % self.capacity for i in range(max(0, total - self.capacity), total)]
+        return [(self.KIND_NAMES[self.kinds[i]], self.stamps[i], self.values[i], self.sizes[i], self.texts[i]) for i in order]
+
+    def copy(self):
+        """Returns a copy of the recorder, to dump while recording goes on"""
+        snapshot = FlightRecorder(self.capacity)
+        snapshot.total = total = self.total
+        snapshot.kinds[:] = self.kinds
+        snapshot.stamps[:] = self.stamps
+        snapshot.values[:] = self.values
+        snapshot.sizes[:] = self.sizes
+        snapshot.texts[:] = self.texts
+        snapshot._slots = itertools.count(total)
+        return snapshot
+
+    def dump(self, path, reason=""):
+        """Writes the recorded events to a tab-separated text file"""
+        events = self.events()
+        with open(path, "w") as f:
+            f.write(f"# BitBeats flight recorder: {reason}\n")
+            f.write("# kind\ttime\tseconds\tbytes\ttext\n")
+            for kind, stamp, value, size, text in events:
+                f.write(f"{kind}\t{stamp:.6f}\t{value:.6f}\t{size}\t{text if text is not None else ''}\n")
+        return path
+
+class BitBeatsError(ValueError):
+    """Invalid argument passed to the engine
+
+    'argument' names the offending parameter and 'value' holds what was
+    passed, so callers can react without parsing the message.
+    """
+
+    def __init__(self, message, argument=None, value=None):
+        super().__init__(message)
+        self.argument = argument
+        self.value = value
+
+_VALUES = OSC.OSCString("values")
+_VALUES_EFF = OSC.OSCString("values_eff")
+_FLOAT = struct.Struct(">f")
+_INT = struct.Struct(">i")
+
+@functools.lru_cache(maxsize=1024)
+def _encode_steps(steps):
+    """Returns a tuple of numbers encoded as one space-separated OSC string"""
+    return OSC.OSCString(" ".join(map(str, steps)))
+
+def _encoded_message(address, typetags, payload):
+    """Returns an OSCMessage from already encoded arguments"""
+    msg = OSC.OSCMessage(address)
+    msg.typetags = typetags
+    msg.message = payload
+    return msg
+
+_SILENT_STEPS = "0 0 0 0 0 0 0 0 0 0 0 0"
+
+def _check_number(value, argument):
+    """Raises BitBeatsError unless value is a real number (not a string)"""
+    if type(value) is not int and type(value) is not float and not isinstance(value, numbers.Real):
+        raise BitBeatsError(f"{argument} should be a number, not {value!r}", argument, value)
+
+class Param:
+    """One argument of the 'values' message of a channel type, sent as a float
+
+    Values outside low and high (None for no limit) raise BitBeatsError with
+    'error', formatted with the value. 'parse' converts the word of a 'play'
+    command line and 'silent' is sent when the channel is paused.
+    Automation only sends values that differ from the last one sent by at
+    least 'resolution' (a fraction of the value when 'relative'), by default
+    1/256 of the range.
+    """
+
+    typetag = "f"
+
+    def __init__(self, name, low=None, high=None, error=None, parse=float, silent=0.0, resolution=None, relative=False):
+        self.name = name
+        self.low = low
+        self.high = high
+        self.error = error
+        self.parse = parse
+        self.silent = silent
+        if resolution is None:
+            resolution = (high - low) / 256 if low is not None and high is not None else 0.001
+        self.resolution = resolution
+        self.relative = relative
+
+    def changed(self, value, last):
+        """Tells whether automation should send value after last"""
+        tolerance = self.resolution * abs(last) if self.relative else self.resolution
+        return abs(value - last) >= tolerance
+
+    def check(self, value):
+        """Raises BitBeatsError unless value can be sent for this param"""
+        low, high = self.low, self.high
+        try:
+            if (low is not None and not value >= low) or (high is not None and not value <= high):
+                raise BitBeatsError(self.error.format(value=value), self.name, value)
+        except TypeError:
+            _check_number(value, self.name)
+            raise
+
+    def pack(self, value):
+        """Returns the OSC encoding of a checked value"""
+        return _FLOAT.pack(value)
+
+    def encode(self, value):
+        self.check(value)
+        return self.pack(value)
+
+class IntParam(Param):
+    """Param sent as an int, only accepting whole numbers"""
+
+    typetag = "i"
+
+    def check(self, value):
+        _check_number(value, self.name)
+        if value != int(value):
+            raise BitBeatsError(self.error.format(value=value), self.name, value)
+        super().check(value)
+
+    def pack(self, value):
+        return _INT.pack(int(value))
+
+class PatternParam(Param):
+    """Param holding up to 'steps' bits (0 or 1), sent as one string padded with 0s"""
+
+    typetag = "s"
+
+    def __init__(self, name, steps=8):
+        super().__init__(name, parse=lambda word: [int(bit) for bit in word], silent=_SILENT_STEPS)
+        self.steps = steps
+
+    def check(self, value):
+        try:
+            bits = tuple(value)
+        except TypeError:
+            raise BitBeatsError("Binary pattern should be a sequence of 0s and 1s.", self.name, value) from None
+        if len(bits) > self.steps:
+            raise BitBeatsError(f"Binary pattern should have at most {self.steps} bits.", self.name, value)
+        if not all(bit in (0, 1) for bit in bits):
+            raise BitBeatsError("Binary pattern should only contain 0s and 1s.", self.name, value)
+
+    def pack(self, value):
+        bits = tuple(value)
+        return _encode_steps(bits + (0,) * (self.steps - len(bits)))
+
+class ChoiceParam(Param):
+    """Param selecting one of 'choices', sent as the string it maps to"""
+
+    typetag = "s"
+
+    def __init__(self, name, choices, error, parse=str, silent=0.0):
+        super().__init__(name, error=error, parse=parse, silent=silent)
+        self.choices = choices
+        self._encoded = {choice: OSC.OSCString(text) for choice, text in choices.items()}
+
+    def check(self, value):
+        try:
+            self._encoded[value]
+        except (KeyError, TypeError):
+            raise BitBeatsError(self.error.format(value=value), self.name, value) from None
+
+    def pack(self, value):
+        return self._encoded[value]
+
+class ChannelType:
+    """Declarative description of a kind of voice in the Pd patch
+
+    'params' are the arguments of its 'values' message, in order. Values
+    in 'fixed' replace whatever is passed for those params. 'arpeggio' tells
+    whether the voice plays the arpeggio set by 'values_eff' (reset on stop).
+    Validation, parsing and encoding of every channel of the type are
+    derived from the params.
+    """
+
+    def __init__(self, name, params, fixed=None, arpeggio=True):
+        self.name = name
+        self.params = tuple(params)
+        self.fixed = fixed or {}
+        self.arpeggio = arpeggio
+        self.typetags = ",s" + "".join(param.typetag for param in self.params)
+
+    def param(self, name):
+        return next(param for param in self.params if param.name == name)
+
+    def validate(self, values):
+        """Checks the values (a dict or a sequence in the order of the
+        params) and returns them as a list in the order of the params"""
+        if isinstance(values, dict):
+            values = {**values, **self.fixed}
+            missing = [param.name for param in self.params if param.name not in values]
+            if missing:
+                raise BitBeatsError(f"Missing value for {missing[0]}.", missing[0])
+            values = [values[param.name] for param in self.params]
+        elif not hasattr(values, "__len__"):
+            raise BitBeatsError(f"{self.name} channels take a dict or a sequence of values.", "values", values)
+        elif len(values) != len(self.params):
+            raise BitBeatsError(f"{self.name} channels take {len(self.params)} values: "
+                                f"{', '.join(param.name for param in self.params)}.", "values", values)
+        elif self.fixed:
+            values = [self.fixed.get(param.name, value) for param, value in zip(self.params, values)]
+        for param, value in zip(self.params, values):
+            param.check(value)
+        return values
+
+    def pack(self, values):
+        """Returns the encoded arguments of the 'values' message for validated values"""
+        return _VALUES + b"".join([param.pack(value) for param, value in zip(self.params, values)])
+
+    def encode(self, values):
+        """Validates the values and returns the encoded arguments of the 'values' message"""
+        return self.pack(self.validate(values))
+
+    def parse(self, words):
+        """Converts the words of a 'play' command line to a list of values"""
+        if len(words) != len(self.params):
+            raise BitBeatsError(f"{self.name} channels take {len(self.params)} arguments: "
+                                f"{' '.join(param.name for param in self.params)}.", "values", words)
+        return [param.parse(word) for param, word in zip(self.params, words)]
+
+    def silence(self, address):
+        """Returns the message pausing a channel of this type"""
+        return OSC.OSCMessage(address, {"values": [param.silent for param in self.params]})
+
+def _tone_params(duty_error):
+    return [
+        Param("vol", 0, 1, "Volume must be in the range of 0 to 1."),
+        PatternParam("pattern"),
+        IntParam("note", 0, 127, "Invalid MIDI note: {value}", parse=lambda word: note_to_midi(word), resolution=1),
+        Param("length", 1, 4, "Length must be in the range of 1 to 4."),
+        Param("duty", 0, 1, duty_error),
+    ]
+
+SQUARE = ChannelType("square", _tone_params("Duty cycle must be in the range of 0 to 1."))
+TRIANGLE = ChannelType("triangle", _tone_params(None), fixed={"duty": 0.0})
+NOISE = ChannelType("noise", [
+    Param("vol", 0, 1, "volume must be in the range of 0 to 1."),
+    PatternParam("pattern"),
+    ChoiceParam("filter", {None: "1 0 0", "lp": "0 1 0", "hp": "0 0 1"},
+                "invalid filter name. Available options are 0, lp, hp.",
+                parse=lambda word: None if word == "0" else word),
+    Param("cut_off", 0, error="Cut-off frequency must be at least 0.", resolution=0.005, relative=True),
+] + [Param(name, 0, 5000, "A, D, S, R must be in the range of 0 to 5000.", resolution=1) for name in ("attack", "decay", "sustain", "release")],
+    arpeggio=False)
+CHANNEL_TYPES = {channel_type.name: channel_type for channel_type in (SQUARE, TRIANGLE, NOISE)}
+
+class Channel:
+    """A voice of the Pd patch: its type and the OSC address it listens on
+
+    The messages pausing the channel and stopping its arpeggio are encoded
+    once, when the channel is created.
+    """
+
+    def __init__(self, name, channel_type, address=None):
+        self.name = name
+        self.type = channel_type
+        self.address = address or "/" + name
+        self.pause_message = channel_type.silence(self.address)
+        self.stop_effect_message = OSC.OSCMessage(self.address, {"values_eff": [0.0, _SILENT_STEPS]})
+
+class Scene:
+    """State of all channels and effects saved by Engine.save_scene(), with
+    the bundle recalling it encoded once"""
+
+    def __init__(self, name, state):
+        self.name = name
+        self.state = dict(state)
+        self.packet = _bundle(list(self.state.values()))
+
+class Lane:
+    """Automation of one numeric parameter of a channel: a ramp from 'start'
+    to 'end' over 'duration' seconds beginning at 'began', shaped by 'curve'
+
+    'linear' ramps evenly, 'exp' by a constant factor per second (for
+    frequencies, both ends above 0) and 'smooth' eases in and out.
+    'sent' and 'dropped' count the evaluated points that were sent and the
+    ones that did not change the value enough to be sent.
+    """
+
+    curves = ("linear", "exp", "smooth")
+
+    def __init__(self, channel, param, start, end, began, duration, curve="linear"):
+        self.channel = channel
+        self.param = param
+        self.index = channel.type.params.index(param)
+        self.start = start
+        self.end = end
+        self.began = began
+        self.duration = duration
+        self.curve = curve
+        self.last = None
+        self.encoded = None
+        self.sent = 0
+        self.dropped = 0
+
+    def value_at(self, now):
+        x = min(max((now - self.began) / self.duration, 0.0), 1.0) if self.duration > 0 else 1.0
+        if self.curve == "exp":
+            value = self.start * (self.end / self.start) ** x
+        elif self.curve == "smooth":
+            value = self.start + (self.end - self.start) * (1 - math.cos(math.pi * x)) / 2
+        else:
+            value = self.start + (self.end - self.start) * x
+        return round(value) if self.param.typetag == "i" else value
+
+    def finished(self, now):
+        return now >= self.began + self.duration
+
+def _arg_offset(msg, index):
+    """Returns the offset of the 4-byte argument 'index' (counted after the
+    selector) in the payload of an encoded 'values' message"""
+    payload = msg.message
+    offset = 0
+    for typetag in msg.typetags[1:index + 2]:
+        if typetag in "fi":
+            offset += 4
+        else:
+            offset += (payload.index(b"\0", offset) - offset) // 4 * 4 + 4
+    return offset
+
+def _replace_arg(msg, index, encoded):
+    """Returns a copy of an encoded 'values' message with the 4-byte argument
+    'index' (counted after the selector) replaced by 'encoded'"""
+    payload = msg.message
+    offset = _arg_offset(msg, index)
+    return _encoded_message(msg.address, msg.typetags, payload[:offset] + encoded + payload[offset + 4:])
+
+# the voices of BitBeats.pd
+DEFAULT_CHANNELS = (("triangle", TRIANGLE), ("square1", SQUARE), ("square2", SQUARE), ("noise", NOISE))
+
+class Engine:
+    """Typed core of BitBeats, driven with numbers instead of command lines
+
+    All methods validate their arguments and raise BitBeatsError instead of
+    printing, and encode their arguments straight into the OSC messages
+    sent through the transport. BitBeats wraps the engine in the command
+    shell; programs can use an Engine directly:
+
+        engine = Engine()
+        engine.set_tempo(120)
+        engine.start()
+        engine.play("square1", 0.7, [0, 1, 0, 1, 0, 1, 0, 1], 52, 1, 0.2)
+        engine.advance(4)
+
+    One engine can be driven by several threads at once, for example a
+    MIDI controller, a GUI and a script. Every call encodes its message
+    from its own arguments only, and the transport writes whole packets one
+    at a time, so messages are never mixed up. Messages of one thread are
+    sent in the order of its calls, messages of different threads in the
+    order they reach the transport. The tempo, bar counter, statistics and
+    flight recorder are updated under locks. Only the command shell around
+    the engine (BitBeats) is meant for a single thread.
+    """
+
+    # bars that start later than this (in seconds) are counted as late
+    late_threshold = 0.005
+    # a deadline later than this (in seconds) dumps the flight recorder to flight_dir
+    flight_threshold = 0.05
+    flight_dir = "."
+    # noise filter settings sent for play_noise(filter_=...)
+    filters = NOISE.param("filter").choices
+    # send the channel updates made inside batch() as one bundle
+    batch_updates = True
+    # automation points evaluated per second while waiting
+    control_rate = 50.0
+
+    def __init__(self, clock=None, transport=None):
+        self.clock = clock or RealClock()
+        self.transport = transport or OSCTransport()
+        self.channels = {name: Channel(name, channel_type) for name, channel_type in DEFAULT_CHANNELS}
+        self.oscillators = []
+        self.tempo = 60
+        self.bar_duration = None
+        self.bars = 0.0
+        self.stats = SessionStats()
+        self.flight = FlightRecorder()
+        self._flight_dumped = -self.flight.capacity
+        # guards the tempo, bar counter and list of playing oscillators
+        self._lock = threading.Lock()
+        # messages collected by batch(), per thread
+        self._batch = threading.local()
+        # last 'values' and 'values_eff' message of every channel, keyed like _state_key()
+        self.state = {}
+        self.scenes = {}
+        # automation lanes by (channel, param) name
+        self.lanes = {}
+        # bundles built once for the current channels: (channels, {key: bundle})
+        self._packets = (None, {})
+
+    def _channel(self, channel):
+        if channel not in self.channels:
+            raise BitBeatsError(f"Invalid oscillator name: {channel}. Available options are {', '.join(self.channels.keys())}.", "channel", channel)
+        return self.channels[channel]
+
+    def add_channel(self, name, channel_type, address=None):
+        """Adds a voice of a type in CHANNEL_TYPES ('square', 'triangle' or
+        'noise') or a ChannelType, listening on address ('/NAME' by default),
+        for example 'square3' on a second synth instance at '/synth2/square1'"""
+        if isinstance(channel_type, str):
+            if channel_type not in CHANNEL_TYPES:
+                raise BitBeatsError(f"Invalid channel type: {channel_type}. Available options are {', '.join(CHANNEL_TYPES)}.",
+                                    "channel_type", channel_type)
+            channel_type = CHANNEL_TYPES[channel_type]
+        if not name or not name.isidentifier():
+            raise BitBeatsError(f"Invalid channel name: {name}", "name", name)
+        if address is not None and not address.startswith("/"):
+            raise BitBeatsError(f"OSC addresses start with '/': {address}", "address", address)
+        channel = Channel(name, channel_type, address)
+        self.channels = {**self.channels, name: channel}
+        return channel
+
+    def remove_channel(self, name):
+        """Removes a voice, silencing it first"""
+        self.pause(name)
+        self.channels = {key: channel for key, channel in self.channels.items() if key != name}
+
+    def _packet(self, key, build):
+        """Returns the bundle build() returns, built once for the current channels"""
+        channels, packets = self._packets
+        if channels is not self.channels:
+            channels, packets = self._packets = (self.channels, {})
+        packet = packets.get(key)
+        if packet is None:
+            packet = packets[key] = build()
+        return packet
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Collects the messages sent by this thread inside the block and sends
+        them as one bundle at its end, so several channels change at once
+
+            with engine.batch():
+                engine.play("square1", 0.7, [0, 1, 0, 1], 52, 1, 0.2)
+                engine.play("square2", 0.5, [1, 0, 1, 0], 56, 2, 0.5)
+        """
+        if not self.batch_updates or getattr(self._batch, "msgs", None) is not None:
+            # nested blocks join the outer one
+            yield
+            return
+        self._batch.msgs = []
+        try:
+            yield
+        finally:
+            msgs, self._batch.msgs = self._batch.msgs, None
+            if msgs:
+                self._send_packet(_bundle(msgs))
+
+    def _wait_for_bar(self):
+        """Waits for the next bar on clocks shared by several processes (see
+        bb_ensemble) and returns its start, or the current time on other clocks"""
+        next_bar = getattr(self.clock, "next_bar", None)
+        if next_bar is None:
+            return self.clock.now()
+        stamp = next_bar()
+        self.clock.sleep_until(stamp)
+        return stamp
+
+    def start(self):
+        """Starts the sequencer, at the next bar of a shared ensemble clock"""
+        self._wait_for_bar()
+        with self._lock:
+            self._send("/start", 1)
+            self.bar_duration = (60 / self.tempo) * 4
+
+    def stop(self):
+        """Silences all channels and effects and stops the sequencer, with one packet"""
+        self.lanes = {}
+        self.state.clear()
+        self._send_packet(self._packet("stop", self._stop_bundle))
+
+    def _stop_bundle(self):
+        channels = self.channels.values()
+        return _bundle([OSC.OSCMessage("/master_vol", 0.0)]
+                       + [channel.pause_message for channel in channels]
+                       + [channel.stop_effect_message for channel in channels if channel.type.arpeggio]
+                       + [OSC.OSCMessage("/stop", 0)])
+
+    def set_tempo(self, bpm):
+        """Sets the tempo in beats per minute"""
+        _check_number(bpm, "bpm")
+        if not bpm > 0:
+            raise BitBeatsError("Tempo should be greater than zero.", "bpm", bpm)
+        with self._lock:
+            self.tempo = float(bpm)
+            self.bar_duration = (60 / self.tempo) * 4
+            self._send("/tempo", self.tempo * 2)
+
+    def set_master_vol(self, volume):
+        """Sets the master volume from 0 to 1"""
+        _check_number(volume, "volume")
+        if not 0 <= volume <= 1:
+            raise BitBeatsError("master volume should be between 0 and 1", "volume", volume)
+        self._send("/master_vol", float(volume))
+
+    def play(self, channel, vol, pattern, note, length, duty=0.0):
+        """Plays a tone channel (such as 'triangle', 'square1' or 'square2')
+
+        pattern is a sequence of up to 8 steps (0 or 1), note a MIDI note
+        number, length the note length in 8ths from 1 to 4 and duty the
+        duty cycle from 0 to 1 (always 0 for the triangle).
+        """
+        if channel not in self.channels or self.channels[channel].type not in (SQUARE, TRIANGLE):
+            raise BitBeatsError("Invalid channel specified.", "channel", channel)
+        self.set_values(channel, (vol, pattern, note, length, duty))
+
+    def play_noise(self, vol, pattern, filter_=None, cut_off=0.0, attack=0.0, decay=0.0, sustain=0.0, release=0.0,
+                   channel="noise"):
+        """Plays a noise channel
+
+        filter_ is None, 'lp' or 'hp' with the cut-off frequency in Hz,
+        attack, decay, sustain and release are in ms from 0 to 5000.
+        """
+        if channel not in self.channels or self.channels[channel].type is not NOISE:
+            raise BitBeatsError("Invalid channel specified.", "channel", channel)
+        self.set_values(channel, (vol, pattern, filter_, cut_off, attack, decay, sustain, release))
+
+    def set_values(self, channel, values):
+        """Sets all parameters of a channel of any type
+
+        values is a dict by parameter name, or a sequence in the order of
+        the params of the channel's type.
+        """
+        channel = self._channel(channel)
+        started = time.perf_counter()
+        values = channel.type.validate(values)
+        validated = time.perf_counter()
+        msg = _encoded_message(channel.address, channel.type.typetags, channel.type.pack(values))
+        self.stats.record("validate", validated - started)
+        self.stats.record("encode", time.perf_counter() - validated)
+        if channel.address not in self.oscillators:
+            with self._lock:
+                if channel.address not in self.oscillators:
+                    self.oscillators.append(channel.address)
+        self.state[(channel.address, "values")] = msg
+        self._send_packet(msg)
+
+    def pause(self, *channels):
+        """Silences channels until they are played again, with one packet"""
+        msgs = [self._channel(channel).pause_message for channel in channels]
+        for msg in msgs:
+            self.state.pop((msg.address, "values"), None)
+        self.lanes = {key: lane for key, lane in self.lanes.items() if key[0] not in channels}
+        self._send_packet(self._packet(("pause",) + channels, lambda: _bundle(msgs)))
+
+    def set_effect(self, channel, cycle_steps, semitones):
+        """Sets the arpeggio of a channel
+
+        cycle_steps is the modulo from 0 to 12 and semitones a sequence of
+        up to 12 semitone offsets.
+        """
+        address = self._channel(channel).address
+        started = time.perf_counter()
+        _check_number(cycle_steps, "cycle_steps")
+        if not 0 <= cycle_steps <= 12:
+            raise BitBeatsError("Modulo must be in the range of 0 to 12.", "cycle_steps", cycle_steps)
+        try:
+            semitones = tuple(semitones)
+        except TypeError:
+            raise BitBeatsError("Semitones should be a sequence of integers.", "semitones", semitones) from None
+        if len(semitones) > 12:
+            raise BitBeatsError("Semitones should have at most 12 intervals.", "semitones", semitones)
+        if not all(isinstance(semitone, int) for semitone in semitones):
+            raise BitBeatsError("Semitones should be integers.", "semitones", semitones)
+        validated = time.perf_counter()
+        payload = _VALUES_EFF + _FLOAT.pack(cycle_steps) + _encode_steps(semitones + (0,) * (12 - len(semitones)))
+        msg = _encoded_message(address, ",sfs", payload)
+        self.stats.record("validate", validated - started)
+        self.stats.record("encode", time.perf_counter() - validated)
+        self.state[(address, "values_eff")] = msg
+        self._send_packet(msg)
+
+    def stop_effect(self, channel):
+        """Stops the arpeggio of a channel"""
+        channel = self._channel(channel)
+        self.state.pop((channel.address, "values_eff"), None)
+        self._send_packet(channel.stop_effect_message)
+
+    def save_scene(self, name):
+        """Stores the state of all channels and effects as a scene, encoded
+        once into the bundle that recall_scene() sends. Channels that are not
+        playing are paused by the scene, and effects that are not set stopped."""
+        state = {}
+        for channel in self.channels.values():
+            key = (channel.address, "values")
+            state[key] = self.state.get(key, channel.pause_message)
+            key = (channel.address, "values_eff")
+            if key in self.state or channel.type.arpeggio:
+                state[key] = self.state.get(key, channel.stop_effect_message)
+        self.scenes[name] = Scene(name, state)
+        return self.scenes[name]
+
+    def recall_scene(self, name):
+        """Switches all channels and effects to a saved scene with one packet"""
+        if name not in self.scenes:
+            raise BitBeatsError(f"No such scene: {name}", "name", name)
+        scene = self.scenes[name]
+        self.state.update(scene.state)
+        self._send_packet(scene.packet)
+
+    def automate(self, channel, param, start, end, bars, curve="linear"):
+        """Ramps a numeric parameter of a playing channel from start to end
+        over a number of bars, with curve 'linear', 'exp' or 'smooth'
+
+        The lane is evaluated control_rate times per second while waiting
+        (advance()). A point is only sent when the value changed by at least
+        the param's resolution, and then as the channel's last 'values'
+        message with just that parameter replaced. A new lane of the same
+        parameter replaces the running one.
+        """
+        channel = self._channel(channel)
+        params = {p.name: p for p in channel.type.params if p.typetag in "fi" and p.name not in channel.type.fixed}
+        if param not in params:
+            raise BitBeatsError(f"Invalid parameter: {param}. Available options are {', '.join(params)}.", "param", param)
+        param = params[param]
+        if curve not in Lane.curves:
+            raise BitBeatsError(f"Invalid curve: {curve}. Available options are {', '.join(Lane.curves)}.", "curve", curve)
+        _check_number(start, "start")
+        _check_number(end, "end")
+        _check_number(bars, "bars")
+        if curve == "exp" and not (start > 0 and end > 0):
+            raise BitBeatsError("Exponential curves need values above 0.", "start", start)
+        if not bars >= 0:
+            raise BitBeatsError("Invalid duration for automation", "bars", bars)
+        if self.bar_duration is None:
+            raise BitBeatsError("Set a tempo or start the sequencer before automating", "bars", bars)
+        for value in (start, end):
+            param.encode(round(value) if param.typetag == "i" else value)
+        lane = Lane(channel, param, start, end, self.clock.now(), self.bar_duration * bars, curve)
+        self.lanes = {**self.lanes, (channel.name, param.name): lane}
+        return lane
+
+    def stop_automation(self, channel=None, param=None):
+        """Removes the lanes of a parameter, of a channel or all of them, keeping the values reached"""
+        self.lanes = {key: lane for key, lane in self.lanes.items()
+                      if not ((channel is None or key[0] == channel) and (param is None or key[1] == param))}
+
+    def _update_lanes(self, now):
+        """Sends the automated parameters that changed, one message per channel"""
+        lanes = self.lanes
+        updates = {}
+        for key, lane in lanes.items():
+            value = lane.value_at(now)
+            encoded = lane.param.encode(value)
+            if lane.last is not None and (encoded == lane.encoded or not (lane.finished(now) or lane.param.changed(value, lane.last))):
+                lane.dropped += 1
+                continue
+            state_key = (lane.channel.address, "values")
+            msg = updates.get(state_key, self.state.get(state_key))
+            if msg is None or msg.typetags[lane.index + 2] != lane.param.typetag:
+                # the channel is not playing
+                lane.dropped += 1
+                continue
+            if lane.last is None:
+                offset = _arg_offset(msg, lane.index)
+                if msg.message[offset:offset + 4] == encoded:
+                    # the first point is what the channel already plays
+                    lane.last = value
+                    lane.encoded = encoded
+                    lane.dropped += 1
+                    continue
+            updates[state_key] = _replace_arg(msg, lane.index, encoded)
+            lane.last = value
+            lane.encoded = encoded
+            lane.sent += 1
+        done = [key for key, lane in lanes.items() if lane.finished(now)]
+        if done:
+            self.lanes = {key: lane for key, lane in self.lanes.items() if key not in done}
+        if updates:
+            with self.batch():
+                for key, msg in updates.items():
+                    self.state[key] = msg
+                    self._send_packet(msg)
+
+    def advance(self, bars):
+        """Lets the set channels and effects play for a number of bars"""
+        _check_number(bars, "bars")
+        if not bars >= 0:
+            raise BitBeatsError("Invalid duration for waiting", "bars", bars)
+        bar_duration = self.bar_duration
+        if bar_duration is None:
+            raise BitBeatsError("Set a tempo or start the sequencer before waiting", "bars", bars)
+        deadline = self.clock.now() + bar_duration * bars
+        tick = self.clock.now()
+        while self.lanes and tick < deadline:
+            self._update_lanes(tick)
+            tick += 1 / self.control_rate
+            if tick < deadline:
+                self.clock.sleep_until(tick)
+        self._sleep_until(deadline, self.bars + bars)
+        if self.lanes:
+            self._update_lanes(deadline)
+        with self._lock:
+            self.bars += bars
+
+    def _send(self, path, value):
+        started = time.perf_counter()
+        msg = OSC.OSCMessage(path, value)
+        self.stats.record("encode", time.perf_counter() - started)
+        self._send_packet(msg)
+
+    def _send_packet(self, msg):
+        batch = getattr(self._batch, "msgs", None)
+        if batch is not None:
+            batch.append(msg)
+            return
+        address = msg.address or "#bundle"
+        started = time.perf_counter()
+        try:
+            size = self.transport.send(msg)
+        except Exception as e:
+            self._record_send(address, time.perf_counter() - started, 0, e)
+            return
+        if size != QUEUED:
+            self._record_send(address, time.perf_counter() - started, size or 0)
+
+    def _record_send(self, address, seconds, size, error=None):
+        """Counts a packet written to the transport, or the error writing it"""
+        if error is not None:
+            self.flight.record(FlightRecorder.ERROR, f"{address}: {_format_exception_message(error)}")
+            self.report_send_error(address, error)
+        self.stats.record_send(address, seconds, error is not None)
+        self.flight.record(FlightRecorder.SEND, address, seconds, size)
+
+    def _sleep_until(self, deadline, bar=None):
+        """Sleeps until a deadline, recording how late it was reached
+
+        'bar' is the bar position reached at the deadline. Only deadlines at
+        the start of a bar (a whole bar position) count as late bars.
+        """
+        self.clock.sleep_until(deadline)
+        lateness = max(self.clock.now() - deadline, 0.0)
+        self.stats.record("lateness", lateness)
+        self.flight.record(FlightRecorder.DEADLINE, None, lateness)
+        if lateness > self.late_threshold:
+            if bar is not None and abs(bar - round(bar)) < 1e-9:
+                with self.stats.lock:
+                    self.stats.late_bars += 1
+            if lateness > self.flight_threshold:
+                with self._lock:
+                    # dump at most once per full buffer, in the background to keep playing on time
+                    dump = self.flight.total - self._flight_dumped >= self.flight.capacity
+                    if dump:
+                        self._flight_dumped = self.flight.total
+                if dump:
+                    self.dump_flight(f"bar {lateness * 1000:.1f} ms late", background=True)
+
+    def report_send_error(self, address, exception):
+        """Called when sending to the transport failed; the message is dropped
+        so that playback continues. Counted in stats.send_errors."""
+
+    def dump_flight(self, reason, background=False):
+        """Writes the flight recorder to a new file in flight_dir and returns its path
+
+        The file name holds the time to the millisecond and a dump counter,
+        so dumps never overwrite each other.
+        """
+        now = time.time()
+        name = time.strftime("bitbeats-flight-%Y%m%d-%H%M%S", time.localtime(now))
+        path = os.path.join(self.flight_dir, f"{name}-{int(now % 1 * 1000):03d}-{next(_flight_dumps)}.log")
+        if background:
+            threading.Thread(target=self.flight.copy().dump, args=(path, reason), daemon=True).start()
+            return path
+        return self.flight.dump(path, reason)
+
+class BitBeats(Engine, cmd.Cmd):
+    """Command shell around the Engine, parsing command lines and scripts"""
+
+    def __init__(self, filename=None, clock=None, transport=None):
+        Engine.__init__(self, clock, transport)
+        cmd.Cmd.__init__(self)
         self.prompt = "BitBeats> "
-        self.channels = {"triangle": "/triangle", "square1": "/square1", "square2": "/square2", "noise": "/noise"}
-        self.current_channel = None
         self.filename = filename
-        self.oscillators = []
         self.variables = {}
-        self.tempo=60
+        self._compiled = None
+        self.metrics = None
+        self.capture = None
+        self._command_started = None
 
-    def do_run_script(self, script_file):
-        """Runs commands from a script file"""
+    def report_send_error(self, address, exception):
+        print(f"ERROR: {_format_exception_message(exception)}")
+
+    def dump_flight(self, reason, background=False):
+        """Writes the flight recorder to a new file in flight_dir and prints its path"""
         try:
-            self.do_stop()
-            with open(script_file) as f:
-                for line in f.readlines():
-                    self.onecmd(self.precmd(line.strip()))
-        except FileNotFoundError:
+            path = super().dump_flight(reason, background)
+        except OSError as e:
+            print(f"ERROR: Could not write the flight recorder: {_format_exception_message(e)}")
+            return None
+        if not background:
+            print(f"Flight recorder written to {path}")
+        return path
+
+    def do_run_script(self, args):
+        """
+        Runs a script file, optionally starting at a bar or section
+
+        Scripts can repeat blocks with 'repeat N { ... }' and name parts
+        with 'section NAME { ... }'. A section plays in place and can be
+        played again with a line containing only its name.
+
+        Example: run_script commands.txt
+        Example: run_script commands.txt --from-bar 17
+        """
+        script_file, _, from_bar = args.partition("--from-bar")
+        self.do_stop()
+        self._play_bars(script_file.strip(), from_bar.strip() or "1")
+
+    def do_seek(self, args):
+        """
+        Plays the last script (or the given one) from the start of a bar or section
+
+        Example: seek 17
+        Example: seek chorus commands.txt
+        """
+        bar, _, script_file = args.strip().partition(" ")
+        self._play_bars(script_file.strip() or self.filename, bar)
+
+    def do_loop(self, args):
+        """
+        Plays bars N to M (or a section) of the last script repeatedly,
+        forever or a number of times
+
+        Example: loop 9 16
+        Example: loop 9 16 4
+        Example: loop chorus 2
+        """
+        parts = args.split()
+        if parts and not parts[0].isdigit() and len(parts) in (1, 2):
+            self._play_bars(self.filename, parts[0], *parts)
+        elif len(parts) in (2, 3):
+            self._play_bars(self.filename, *parts)
+        else:
+            print("ERROR: Invalid number of arguments for 'loop' command.")
+
+    def emptyline(self):
+        """Does nothing, instead of repeating the last command"""
+        pass
+
+    def _compile(self, script_file):
+        """Returns the CompiledScript for a script file, compiling it if it or
+        the tempo, variables and channels of the session changed"""
+        key = (script_file, os.path.getmtime(script_file), self.tempo, self.bar_duration, _script_inputs(self))
+        if self._compiled is None or self._compiled[0] != key:
+            compiled = compile_script(script_file, self)
+            for line_number, message in compiled.errors:
+                print(f"Line {line_number}: {message}")
+            self._compiled = (key, compiled)
+        return self._compiled[1]
+
+    def _play_bars(self, script_file, first, last=None, repeat=None):
+        """Plays bars 'first' to 'last' (counted from 1, or section names) of a script
+
+        Without 'last' the script is played to its end. With 'last' the bars
+        are looped 'repeat' times, or until interrupted.
+        """
+        if not script_file:
+            print("ERROR: No script loaded, use run_script first.")
+            return
+        try:
+            compiled = self._compile(script_file)
+        except FileNotFoundError as e:
             print(f"ERROR: Script file '{script_file}' not found")
-            self.do_stop()
-        except ValueError as e:
-            print(f"ERROR: {e}: Stopping the script.")
-            self.do_stop()
+            self.flight.record(FlightRecorder.ERROR, f"{type(e).__name__}: {script_file}")
+            return
+        try:
+            self.filename = script_file
+            bar_count = max(compiled.bar_count, 1)
+            if first in compiled.sections:
+                first = int(compiled.sections[first][0] + 1e-9) + 1
+            if last in compiled.sections:
+                last = math.ceil(compiled.sections[last][1] - 1e-9)
+            looping = last is not None
+            first = int(first)
+            last = int(last) if looping else bar_count
+            if not 1 <= first <= last <= bar_count:
+                print(f"ERROR: Bars must be in the range of 1 to {bar_count}.")
+                return
+            if not looping:
+                self.play_compiled(compiled, first - 1)
+                with self._lock:
+                    self.bars += compiled.bars - (first - 1)
+                    if compiled.tempo_changed:
+                        self.tempo = compiled.tempo
+                        self.bar_duration = (60 / self.tempo) * 4
+                    elif self.bar_duration is None:
+                        self.bar_duration = compiled.bar_duration
+                self.variables.update(compiled.variables)
+                return
+            iterations = int(repeat) if repeat is not None else None
+            while iterations is None or iterations > 0:
+                self.play_compiled(compiled, first - 1, last - 1)
+                with self._lock:
+                    self.bars += last - first + 1
+                if iterations is not None:
+                    iterations -= 1
         except KeyboardInterrupt:
             print("KeyboardInterrupt: Stopping the script.")
-            self.do_stop()
+            self._abort_script("KeyboardInterrupt")
         except Exception as e:
             print(f"ERROR: {e}: Stopping the script.")
-            self.do_stop()
+            self._abort_script(f"{type(e).__name__}: {e}")
+
+    def _abort_script(self, reason):
+        """Records why a script stopped, stops playing and dumps the flight recorder"""
+        self.flight.record(FlightRecorder.ERROR, reason)
+        self.do_stop()
+        self.dump_flight(reason)
+
+    def play_compiled(self, compiled, first_bar, last_bar=None):
+        """Plays a CompiledScript from the start of first_bar (counted from 0)
+
+        The state at first_bar is restored with a single packet, then the
+        pre-encoded packets are sent on schedule until the end of last_bar,
+        or until the end of the script.
+        """
+        start = compiled.bar_time(first_bar)
+        end = None if last_bar is None else compiled.bar_time(last_bar + 1)
+        origin = self._wait_for_bar() - start
+        snapshot = compiled.snapshot(start)
+        if snapshot is not None:
+            self._send_packet(snapshot)
+        self._play_clip(compiled.clip, origin, start, end)
+        self._sleep_until(origin + (compiled.seconds if end is None else end),
+                          compiled.bars if last_bar is None else last_bar + 1)
+        state = {}
+        compiled.clip.state_at(compiled.seconds if end is None else end - 1e-6, state)
+        self.state.update((key, msg) for key, msg in state.items() if isinstance(key, tuple))
+
+    def _play_clip(self, clip, origin, start, end, bar_origin=0.0):
+        """Sends the packets of a clip timed after 'start' and before 'end'
+        (both relative to the clip), with the clip starting at 'origin' and
+        at bar position 'bar_origin' of the script"""
+        first = max(0, bisect.bisect_right(clip.offsets, start + 1e-9) - 1)
+        for kind, offset, bar, a, b in clip.items[first:]:
+            if end is not None and offset >= end - 1e-9:
+                break
+            if kind == "packet":
+                if offset > start + 1e-9:
+                    self._sleep_until(origin + offset, bar_origin + bar)
+                    self._send_packet(a)
+            elif kind == "loop":
+                if a.seconds > 0:
+                    iteration = max(0, int((start - offset + 1e-9) // a.seconds))
+                else:
+                    iteration = 0 if offset > start + 1e-9 else b
+                for j in range(iteration, b):
+                    begin = offset + j * a.seconds
+                    if end is not None and begin >= end - 1e-9:
+                        break
+                    self._play_clip(a, origin + begin, start - begin, None if end is None else end - begin,
+                                    bar_origin + bar + j * a.bars)
+
+    def do_profile(self, args):
+        """
+        Profiles a script on a virtual clock and writes a pstats file
+
+        Waits are skipped, so the profile only shows interpreter and OSC
+        cost. With --memory, the top allocations are reported as well.
+
+        Example: profile commands.txt
+        Example: profile commands.txt commands.pstats --memory
+        """
+        parts = args.split()
+        memory = "--memory" in parts
+        parts = [part for part in parts if part != "--memory"]
+        if len(parts) not in (1, 2):
+            print("ERROR: Invalid number of arguments for 'profile' command.")
+            return
+        script_file = parts[0]
+        out_file = parts[1] if len(parts) == 2 else os.path.splitext(script_file)[0] + ".pstats"
+        self.profile_command(f"run_script {script_file}", out_file, memory)
+
+    def profile_command(self, line, out_file, memory=False, top=15):
+        """Runs one command under cProfile (and tracemalloc) on a virtual clock"""
+        # imported here to keep the start-up of the shell fast
+        import cProfile, pstats, tracemalloc
+        clock = self.clock
+        self.clock = VirtualClock(clock.now())
+        profiler = cProfile.Profile()
+        if memory:
+            tracemalloc.start()
+        try:
+            profiler.runcall(self.onecmd, line)
+        finally:
+            self.clock = clock
+            if memory:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+        profiler.dump_stats(out_file)
+        pstats.Stats(profiler, stream=self.stdout).sort_stats("cumulative").print_stats(top)
+        if memory:
+            print("Top allocations:")
+            for statistic in snapshot.statistics("lineno")[:top]:
+                print(statistic)
+        print(f"Profile written to {out_file}")
+
+    def do_check(self, script_file):
+        """
+        Checks a script without playing it and reports all errors
+
+        Example: check commands.txt
+        """
+        try:
+            print_report(check_script(script_file, self))
+        except FileNotFoundError:
+            print(f"ERROR: Script file '{script_file}' not found")
 
     def onecmd_define_variable(self, args):
         """Handles the define_variable command"""
@@ -62,6 +1503,23 @@ class BitBeats(cmd.Cmd):
 
 
     def precmd(self, line):
+        started = time.perf_counter()
+        self._command_started = started
+        line = self._parse_line(line)
+        parsed = time.perf_counter() - started
+        self.stats.record("parse", parsed)
+        self.flight.record(FlightRecorder.COMMAND, line, parsed)
+        return line
+
+    def postcmd(self, stop, line):
+        if self._command_started is not None:
+            name = line.split(" ", 1)[0]
+            if name:
+                self.stats.record(f"command {name}", time.perf_counter() - self._command_started)
+            self._command_started = None
+        return stop
+
+    def _parse_line(self, line):
         if line.startswith("#"):
             return ""  # Skip comments and empty lines
         if "=" in line:
@@ -72,41 +1530,275 @@ class BitBeats(cmd.Cmd):
             return ""
         return line
 
-    def _send(self, path, value):
+    def do_target(self, args):
+        """
+        Lists the Pd instances messages are sent to, with their send errors,
+        or adds or removes one. A target can be limited to some channels and
+        can prepend an OSC address prefix.
+
+        Example: target
+        Example: target add localhost:10000
+        Example: target add 192.168.1.20:9999/layer2 square1,noise
+        Example: target remove localhost:10000
+        """
+        parts = args.split()
+        if parts and parts[0] in ("add", "remove") and len(parts) in (2, 3):
+            if isinstance(self.transport, OSCTransport):
+                self.transport.set_capture(None)
+                self.transport = MultiTransport([f"{self.transport.host}:{self.transport.port}"], self.clock)
+                self.transport.set_capture(self.capture)
+            elif not isinstance(self.transport, MultiTransport):
+                print("ERROR: Targets can only be changed in the live shell.")
+                return
+            try:
+                if parts[0] == "add":
+                    self.transport.add_target(parts[1], parts[2].split(",") if len(parts) == 3 else None)
+                else:
+                    self.transport.remove_target(parts[1])
+            except (BitBeatsError, OSC.OSCClientError) as e:
+                print(f"ERROR: {e}")
+            return
+        if parts:
+            print("ERROR: Use 'target', 'target add HOST:PORT[/PREFIX] [CHANNELS]' or 'target remove HOST:PORT'.")
+            return
+        if isinstance(self.transport, OSCTransport):
+            print(f"Sending to {self.transport.host}:{self.transport.port}")
+            return
+        if not isinstance(self.transport, MultiTransport):
+            print(f"Sending through {type(self.transport).__name__}")
+            return
+        now = self.clock.now()
+        print(f"{'target':28} {'channels':24} {'sent':>8} {'errors':>7} {'rate':>6} {'skipped':>8}  state")
+        for address, health in list(self.transport.health.items()):
+            channels = ",".join(self.transport.channels[address] or ["all"])
+            state = f"backing off ({health.last_error})" if now < health.retry_at else "ok"
+            print(f"{self.transport.names[address]:28} {channels:24} {health.sent:8} {health.errors:7} {health.error_rate():6.1%} {health.skipped:8}  {state}")
+
+    def do_channel(self, args):
+        """
+        Lists the channels, or adds a voice of type square, triangle or noise
+        (on '/NAME' unless an OSC address is given) or removes one
+
+        Example: channel add square3 square /synth2/square1
+        Example: channel remove square3
+        Example: channel
+        """
+        parts = args.split()
         try:
-            OSC.sendMsg(path, value, "localhost", 9999)
-        except Exception as e:
-            print(f"ERROR: {_format_exception_message(e)}")
+            if parts and parts[0] == "add" and len(parts) in (3, 4):
+                self.add_channel(*parts[1:])
+            elif parts and parts[0] == "remove" and len(parts) == 2:
+                self.remove_channel(parts[1])
+            elif not parts:
+                for channel in self.channels.values():
+                    print(f"{channel.name:12} {channel.type.name:10} {channel.address}")
+            else:
+                print("ERROR: Use 'channel add NAME TYPE [ADDRESS]', 'channel remove NAME' or 'channel'.")
+        except BitBeatsError as e:
+            print(f"ERROR: {e}")
 
-    def do_start(self, args=None):
-        """Starts sequencer"""
+    def do_coalesce(self, args):
+        """
+        Holds back updates until the next bar and sends only the latest one
+        per channel and setting, from the next 'start' on. Meant for live
+        playing: scripts already send one packet per instant.
+
+        Example: coalesce on
+        Example: coalesce on 5
+        Example: coalesce off
+        Example: coalesce
+        """
+        parts = args.split()
+        queue = self.transport if isinstance(self.transport, CoalescingTransport) else None
+        if parts and parts[0] == "on" and len(parts) <= 2:
+            try:
+                lookahead = float(parts[1]) / 1000 if len(parts) > 1 else 0.002
+            except ValueError:
+                print("ERROR: Lookahead should be a number of milliseconds")
+                return
+            if queue:
+                queue.lookahead = lookahead
+            else:
+                self.transport = CoalescingTransport(self.transport, self.clock, lookahead, self._record_send,
+                                                     thread=not isinstance(self.clock, VirtualClock))
+        elif parts == ["off"]:
+            if queue:
+                queue.close()
+                self.transport = queue.transport
+        elif not parts:
+            if not queue:
+                print("Coalescing is off")
+                return
+            summary = queue.summary()
+            rate = summary["superseded"] / summary["queued"] if summary["queued"] else 0.0
+            print(f"Queued {summary['queued']}, superseded {summary['superseded']} ({rate:.1%}), "
+                  f"bundles {summary['flushes']}, pending {summary['pending']}, errors {summary['errors']}")
+            if queue.last_error:
+                print(f"Last error: {queue.last_error}")
+        else:
+            print("ERROR: Use 'coalesce on [LOOKAHEAD_MS]', 'coalesce off' or 'coalesce'.")
+
+    def do_ensemble(self, args):
+        """
+        Shares the bar clock with other BitBeats processes: leads it on a UDP
+        port, follows a leader, shows the sync state or stops. Playing starts
+        at the next bar of the shared clock.
+
+        Example: ensemble lead 9995 120
+        Example: ensemble follow 192.168.1.10:9995
+        Example: ensemble
+        Example: ensemble stop
+        """
+        import bb_ensemble
+        parts = args.split()
         try:
-            self._send("/start", 1)
-            if self.tempo > 0:
-                self.bar_duration = (60 / self.tempo) * 4 
+            if parts and parts[0] == "lead" and len(parts) <= 3:
+                self._stop_ensemble()
+                port = int(parts[1]) if len(parts) > 1 else 9995
+                tempo = float(parts[2]) if len(parts) > 2 else self.tempo
+                self.clock = bb_ensemble.EnsembleLeader(port, tempo)
+                self.clock.start()
+            elif parts and parts[0] == "follow" and len(parts) == 2:
+                self._stop_ensemble()
+                host, _, port = parts[1].rpartition(":")
+                follower = bb_ensemble.EnsembleFollower((host or "localhost", int(port)))
+                follower.start()
+                self.clock = follower
+            elif parts == ["stop"]:
+                self._stop_ensemble()
+            elif not parts:
+                if isinstance(self.clock, bb_ensemble.EnsembleLeader):
+                    print(f"Leading on port {self.clock.address[1]}, bar {self.clock.bar}, {len(self.clock.followers)} followers")
+                elif isinstance(self.clock, bb_ensemble.EnsembleFollower):
+                    status = self.clock.status()
+                    print(f"Following {self.clock.leader[0]}:{self.clock.leader[1]}, bar {status['bar']}, "
+                          f"round trip {status['delay'] * 1e6:.0f} us, skew {status['skew_ppm']:+.2f} ppm")
+                else:
+                    print("Not in an ensemble")
             else:
-                print("ERROR: Tempo should be greater than zero.")
-                raise ValueError()
-        except Exception as e:
+                print("ERROR: Use 'ensemble lead [PORT [BPM]]', 'ensemble follow HOST:PORT', 'ensemble' or 'ensemble stop'.")
+        except (OSError, ValueError) as e:
             print(f"ERROR: {_format_exception_message(e)}")
 
-    def do_stop(self, args=None):
-        """Stops sequencer"""           
+    def _stop_ensemble(self):
+        """Returns to the local clock if leading or following an ensemble"""
+        if hasattr(self.clock, "next_bar"):
+            self.clock.stop()
+            self.clock = RealClock()
+
+    def do_capture(self, args):
+        """
+        Records every OSC packet sent to the Pd patch in a binary capture file,
+        with the target it was sent to, or stops recording
+
+        Example: capture show.osccap
+        Example: capture stop
+        """
+        set_capture = getattr(self.transport, "set_capture", None)
+        if set_capture is None:
+            print("ERROR: Capturing needs an OSC transport.")
+            return
+        if self.capture:
+            set_capture(None)
+            self.capture.close()
+            self.capture = None
+        if not args.strip() or args.strip() == "stop":
+            return
         try:
-            self._send("/master_vol", 0.0)
-            intervals = '0 0 0 0 0 0 0 0 0 0 0 0'       
-            self._send("/noise", {"values": [0.0, intervals, "0", 0.0, 0.0, 0.0, 0.0, 0.0]})
-            self._send("/triangle", {"values": [0.0, intervals, 0.0, 0.0, 0.0]})
-            self._send("/square1", {"values": [0.0, intervals, 0.0, 0.0, 0.0]})
-            self._send("/square2", {"values": [0.0, intervals, 0.0, 0.0, 0.0]})
-            self._send("/triangle", {"values_eff": [0.0, intervals]})
-            self._send("/square1", {"values_eff": [0.0, intervals]})
-            self._send("/square2", {"values_eff": [0.0, intervals]})
-            self._send("/stop", 0)
-        except Exception as e:
-            print(f"ERROR: {_format_exception_message(e)}, program is terminated")
-            raise ValueError()
+            self.capture = OSC.OSCCaptureWriter(args.strip())
+        except OSError as e:
+            print(f"ERROR: {_format_exception_message(e)}")
+            return
+        set_capture(self.capture)
+
+    def do_flight(self, args):
+        """
+        Shows the last events of the flight recorder or writes all of them to a file
 
+        Example: flight
+        Example: flight 50
+        Example: flight dump
+        """
+        if args.strip() == "dump":
+            self.dump_flight("flight dump")
+            return
+        try:
+            count = int(args) if args.strip() else 20
+        except ValueError:
+            print("ERROR: Use 'flight [count]' or 'flight dump'.")
+            return
+        for kind, stamp, value, size, text in self.flight.events()[-count:]:
+            print(f"{stamp:14.6f} {kind:<8} {value * 1000:9.3f} ms {size:5d} B  {text if text is not None else ''}")
+
+    def do_metrics(self, args):
+        """
+        Exports session metrics in the background to a Prometheus text file,
+        a local HTTP port or an OSC address, or stops the export
+
+        Example: metrics file bitbeats.prom
+        Example: metrics port 9100
+        Example: metrics osc localhost:9998
+        Example: metrics queue 9999
+        Example: metrics stop
+
+        'metrics queue PORT' reports the receive queue of a local UDP port,
+        by default the port of a BitBeats.pd running on this machine.
+        """
+        import bb_metrics
+        parts = args.split()
+        if parts == ["stop"]:
+            if self.metrics:
+                self.metrics.stop()
+                self.metrics = None
+            return
+        if len(parts) != 2 or parts[0] not in ("file", "port", "osc", "queue"):
+            print("ERROR: Use 'metrics file PATH', 'metrics port PORT', 'metrics osc HOST:PORT', "
+                  "'metrics queue PORT' or 'metrics stop'.")
+            return
+        try:
+            if self.metrics is None:
+                queue_port = None
+                if isinstance(self.transport, OSCTransport) and self.transport.host in ("localhost", "127.0.0.1"):
+                    queue_port = self.transport.port
+                self.metrics = bb_metrics.MetricsExporter(self.stats, queue_port=queue_port)
+                self.metrics.start()
+            if parts[0] == "queue":
+                self.metrics.queue_port = int(parts[1])
+            elif parts[0] == "file":
+                self.metrics.path = parts[1]
+            elif parts[0] == "port":
+                self.metrics.serve(int(parts[1]))
+            else:
+                host, _, port = parts[1].rpartition(":")
+                self.metrics.osc_target = (host or "localhost", int(port))
+        except (OSError, ValueError) as e:
+            print(f"ERROR: {_format_exception_message(e)}")
+
+    def do_stats(self, args):
+        """
+        Prints latency percentiles of commands and sending phases, or resets them
+
+        Example: stats
+        Example: stats reset
+        """
+        if args.strip() == "reset":
+            self.stats.reset()
+            return
+        elapsed = time.perf_counter() - self.stats.started
+        print(f"{'':24} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for name, histogram in sorted(self.stats.histograms.items()):
+            percentiles = [histogram.percentile(p) * 1000 for p in (50, 95, 99)]
+            print(f"{name:24} {histogram.count:8} {percentiles[0]:9.3f} {percentiles[1]:9.3f} {percentiles[2]:9.3f} {histogram.max * 1000:9.3f}")
+        print(f"Messages: {self.stats.messages} ({self.stats.messages / elapsed:.1f} per second)")
+        print(f"Late bars: {self.stats.late_bars} (later than {self.late_threshold * 1000:g} ms)")
+
+    def do_start(self, args=None):
+        """Starts sequencer"""
+        self.start()
+
+    def do_stop(self, args=None):
+        """Stops sequencer"""
+        self.stop()
 
     def do_tempo(self, args):
         """
@@ -115,16 +1807,14 @@ class BitBeats(cmd.Cmd):
         Example: tempo 120
         """
         try:
-            self.tempo = float(args)
-            if self.tempo > 0:
-                self.bar_duration = (60 / self.tempo) * 4
-                self._send("/tempo", self.tempo*2) 
-            else:
-                print("ERROR: Tempo should be greater than zero.")
-                return
-            
+            bpm = float(args)
         except ValueError:
             print("ERROR: tempo should be a number")
+            return
+        try:
+            self.set_tempo(bpm)
+        except BitBeatsError as e:
+            print(f"ERROR: {e}")
 
     def do_master_vol(self, args):
         """
@@ -133,117 +1823,26 @@ class BitBeats(cmd.Cmd):
         Example: master_vol 0.3
         """
         try:
-            master = float(args)
-            if master < 0 or master > 1:
-                print("ERROR: master volume should be between 0 and 1")
-                return
-            else:
-                self._send("/master_vol", master)
+            volume = float(args)
         except ValueError:
             print("ERROR: master volume should be a number")
+            return
+        try:
+            self.set_master_vol(volume)
+        except BitBeatsError as e:
+            print(f"ERROR: {e}")
 
     def play_bar(self, args):
+        """Parses the arguments of one channel of a 'play' command and plays it"""
         if not args:
             print("ERROR: No arguments provided for play command.")
             return
-        
+        name, *words = args.split()
+        if name not in self.channels:
+            print("ERROR: Invalid channel specified.")
+            return
         try:
-            parts = args.split()
-            if parts[0] == 'noise':
-                _, vol, binary_pattern, filter_, cut_off, A, D, S, R = parts
-                self.vol = float(vol)
-                self.cut_off = float(cut_off)                     
-                channel = "noise"
-                self.A, self.D, self.S, self.R = map(float, [A, D, S, R])
-
-                if channel.lower() in self.channels:
-                    self.current_channel = self.channels[channel.lower()]
-                else:
-                    print(f"ERROR: Invalid oscillator name: {channel}. Available options are {', '.join(self.channels.keys())}.") 
-                    return
-
-                if filter_ == "0":
-                    self.filter_string = "1 0 0"
-                elif filter_ == "hp":
-                    self.filter_string = "0 0 1"
-                elif filter_ == "lp":
-                    self.filter_string = "0 1 0"
-                else:
-                    print("ERROR: invalid filter name. Available options are 0, lp, hp.")
-                    return
-
-                if not (0 <= self.vol <= 1):
-                    print("ERROR: volume must be in the range of 0 to 1.")
-                    return
-
-                if not (0 <= self.A <= 5000) or not (0 <= self.D <= 5000) or not (0 <= self.S <= 5000) or not (0 <= self.R <= 5000):
-                    print("ERROR: A, D, S, R must be in the range of 0 to 1000.")
-                    return
-
-            elif parts[0] == 'triangle' or parts[0] == 'square1' or parts[0] == 'square2':
-                channel, vol, binary_pattern, note, length, duty_cycle = parts
-
-                self.duty_cycle = float(duty_cycle)
-                self.length = float(length)
-                self.vol = float(vol)
-
-                if channel.lower() in self.channels:
-                    self.current_channel = self.channels[channel.lower()]
-                else:
-                    print(f"ERROR: Invalid oscillator name: {channel}. Available options are {', '.join(self.channels.keys())}.") 
-                    return
-
-                if channel in ["square1", "square2"]:
-                    if not (0 <= self.duty_cycle <= 1):
-                        print("ERROR: Duty cycle must be in the range of 0 to 1.")
-                        return
-
-                if not (1 <= self.length <= 4):
-                    print("ERROR: Length must be in the range of 1 to 4.")
-                    return
-
-                if not (0 <= self.vol <= 1):
-                    print("ERROR: Volume must be in the range of 0 to 1.")
-                    return
-                
-                if "triangle" in self.current_channel:
-                    if self.duty_cycle != 0:
-                        self.duty_cycle = 0.0                                                
-
-                # Convert note to MIDI note value
-                self.midi_note = note_to_midi(note)
-                #self.duty_cycle = (self.duty_cycle-0.5)*2
-            else:
-                print("ERROR: Invalid channel specified.")
-                return
-            binary_list = [int(bit) for bit in binary_pattern]
-            if len(binary_list) > 8:
-                print("ERROR: Binary pattern should have at most 8 bits.")
-                return
-            else:
-                # Pad the binary list to make it 8 bits long
-                binary_list += [0] * (8 - len(binary_list))
-                # Check if any bit is not 0 or 1
-                if all(bit in {0, 1} for bit in binary_list):
-                    # Convert the list to a string with spaces between each character
-                    self.binary_string = ' '.join(map(str, binary_list))
-                else:
-                    print("ERROR: Binary pattern should only contain 0s and 1s.")
-                    return
-
-            if self.current_channel == "/noise":   
-                if self.current_channel in self.oscillators:
-                    self._send(self.current_channel, {"values": [self.vol, self.binary_string, self.filter_string, self.cut_off, self.A, self.D, self.S, self.R]})
-                else:
-                    self.oscillators.append(self.current_channel)
-                    self._send(self.current_channel, {"values": [self.vol, self.binary_string, self.filter_string, self.cut_off, self.A, self.D, self.S, self.R]})
-            else:    
-                if self.current_channel in self.oscillators:
-                    self._send(self.current_channel, {"values": [self.vol, self.binary_string, self.midi_note, self.length, self.duty_cycle]})
-                else:
-                    self.oscillators.append(self.current_channel)
-                    self._send(self.current_channel, {"values": [self.vol, self.binary_string, self.midi_note, self.length, self.duty_cycle]})
-            
+            self.set_values(name, self.channels[name].type.parse(words))
         except ValueError as e:
             print(f"ERROR: {e}")
 
@@ -271,13 +1870,20 @@ class BitBeats(cmd.Cmd):
             duty_cycle: Duty cycle from 0 to 1
 
             Example: play square1 0.7 01010101 e3 1 0.2
+
+        Channels added with 'channel add' take the arguments of their type.
+        The channels of one line are sent together in one bundle.
         """
         channels_to_play = args.split(',')
-        for channel in channels_to_play:
-            if channel in self.variables:
-                self.play_bar(self.variables[channel])
-            else:
-                self.play_bar(channel)       
+        with self.batch():
+            for channel in channels_to_play:
+                started = time.perf_counter()
+                channel = channel.strip()
+                if channel in self.variables:
+                    channel = self.variables[channel].strip()
+                self.play_bar(channel)
+                words = channel.split(None, 1)
+                self.stats.record(f"play {words[0] if words else ''}", time.perf_counter() - started)
 
     def do_wait(self, args):
         """
@@ -286,9 +1892,14 @@ class BitBeats(cmd.Cmd):
         Example: wait 2
         """
         try:
-            time.sleep(self.bar_duration*float(args))
+            bars = float(args)
         except ValueError:
             print("ERROR: Invalid duration for waiting")
+            return
+        try:
+            self.advance(bars)
+        except BitBeatsError as e:
+            print(f"ERROR: {e}")
 
     def do_pause(self, args):
         """
@@ -296,22 +1907,75 @@ class BitBeats(cmd.Cmd):
         
         Example: pause noise,square1
         """
+        channels = []
+        for channel in args.split(','):
+            try:
+                channels.append(self._channel(channel.strip()).name)
+            except BitBeatsError as e:
+                print(f"ERROR: {e}")
+        if channels:
+            self.pause(*channels)
+
+    def do_automate(self, args):
+        """
+        Ramps a parameter of a playing channel from one value to another over
+        a number of bars while waiting, with a linear, exp or smooth curve.
+        Lists the lanes, stops them or sets the points evaluated per second.
+
+        Example: automate square1 vol 0.2 0.8 4
+        Example: automate noise cut_off 200 8000 8 exp
+        Example: automate stop square1
+        Example: automate rate 100
+        Example: automate
+        """
+        parts = args.split()
         try:
-            channels_to_pause = args.split(',')
-            for channel in channels_to_pause:
-                parts = channel.split()
-                intervals = '0 0 0 0 0 0 0 0 0 0 0 0' 
-                if parts[0] == 'noise':
-                    self._send("/noise", {"values": [0.0, intervals, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]})
-                elif parts[0] == 'triangle':
-                    self._send("/triangle", {"values": [0.0, intervals, 0.0, 0.0, 0.0]})
-                elif parts[0] == 'square1':
-                    self._send("/square1", {"values": [0.0, intervals, 0.0, 0.0, 0.0]})
-                elif parts[0] == 'square2':
-                    self._send("/square2", {"values": [0.0, intervals, 0.0, 0.0, 0.0]})
+            if len(parts) in (5, 6):
+                self.automate(parts[0], parts[1], float(parts[2]), float(parts[3]), float(parts[4]), *parts[5:])
+            elif parts and parts[0] == "stop" and len(parts) <= 3:
+                self.stop_automation(*parts[1:])
+            elif len(parts) == 2 and parts[0] == "rate":
+                rate = float(parts[1])
+                if not rate > 0:
+                    raise BitBeatsError("Control rate should be greater than zero.", "rate", rate)
+                self.control_rate = rate
+            elif not parts:
+                for (channel, param), lane in self.lanes.items():
+                    print(f"{channel:12} {param:8} {lane.start:g} -> {lane.end:g} {lane.curve:7} "
+                          f"sent {lane.sent}, dropped {lane.dropped}")
+                print(f"Control rate: {self.control_rate:g} per second")
+            else:
+                print("ERROR: Use 'automate CHANNEL PARAM FROM TO BARS [CURVE]', 'automate stop [CHANNEL [PARAM]]', "
+                      "'automate rate HZ' or 'automate'.")
         except ValueError as e:
             print(f"ERROR: {e}")
-            
+
+    def do_scene(self, args):
+        """
+        Saves the state of all channels and effects as a scene, switches to
+        a saved scene with one packet, deletes one or lists them
+
+        Example: scene save verse
+        Example: scene verse
+        Example: scene delete verse
+        Example: scene
+        """
+        parts = args.split()
+        if len(parts) == 2 and parts[0] == "save":
+            self.save_scene(parts[1])
+        elif len(parts) == 2 and parts[0] == "delete":
+            if self.scenes.pop(parts[1], None) is None:
+                print(f"ERROR: No such scene: {parts[1]}")
+        elif len(parts) == 1:
+            try:
+                self.recall_scene(parts[0])
+            except BitBeatsError as e:
+                print(f"ERROR: {e}")
+        elif not parts:
+            for scene in self.scenes.values():
+                print(f"{scene.name:16} {len(scene.state):3} messages {len(scene.packet.getBinary()):6} bytes")
+        else:
+            print("ERROR: Use 'scene save NAME', 'scene NAME', 'scene delete NAME' or 'scene'.")
 
     def do_set_effect(self, args):
         """
@@ -323,41 +1987,14 @@ class BitBeats(cmd.Cmd):
 
         Example: set_effect square1 3 P1M3P4
         """
+        parts = args.split()
+        if len(parts) != 3:
+            print("ERROR: Invalid number of arguments for 'set_effect' command.")
+            return
+        channel, cycle_steps, intervals = parts
         try:
-            parts = args.split()
-            if len(parts) == 3:
-                channel, cycle_steps, intervals = parts
-                cycle_steps = float(cycle_steps)
-                intervals = str(intervals)
-            else:
-                print("ERROR: Invalid number of arguments for 'set_effect' command.")
-                return
-
-            if channel.lower() in self.channels:
-                self.current_channel = self.channels[channel.lower()]
-            else:
-                print(f"ERROR: Invalid oscillator name: {channel}. Available options are {', '.join(self.channels.keys())}.")
-                return
-
-            if not 0 <= cycle_steps <= 12:
-                print("ERROR: Modulo must be in the range of 0 to 12.")
-                return
-
             interval_pairs = [intervals[i:i+2] for i in range(0, len(intervals), 2)]
-            semitones = intervals_to_semitones(interval_pairs)
-            if not all(isinstance(interval, (int, float)) for interval in semitones):
-                return
-            if len(semitones) > 12:
-                print("ERROR: Semitones should have at most 12 intervals.")
-                return
-            else:
-                semitones += [0] * (12 - len(semitones))
-                if all(isinstance(semitone, int) for semitone in semitones):
-                    semitones = ' '.join(map(str, semitones))
-                else:
-                    print("ERROR: Semitones should be integers.")
-                    return
-                self._send(self.current_channel, {"values_eff": [cycle_steps, semitones]})
+            self.set_effect(channel.lower(), float(cycle_steps), intervals_to_semitones(interval_pairs))
         except ValueError as e:
             print(f"ERROR: {e}")
 
@@ -368,47 +2005,26 @@ class BitBeats(cmd.Cmd):
         Example: stop_effect square1
         """
         try:
-            channel = args
-            if channel.lower() in self.channels:
-                self.current_channel = self.channels[channel.lower()]
-            else:
-                print(f"ERROR: Invalid oscillator name: {channel}. Available options are {', '.join(self.channels.keys())}.")
-                return
-            cycle_steps = 0.0
-            intervals = '0 0 0 0 0 0 0 0 0 0 0 0'
-            self._send(self.current_channel, {"values_eff": [cycle_steps, intervals]})
-        except ValueError as e:
+            self.stop_effect(args.lower())
+        except BitBeatsError as e:
             print(f"ERROR: {e}")
-            self.do_stop()
-
 
 def note_to_midi(note):
-    """Converts note to midi value"""
+    """Converts a note in English notation (c1 to b8) to its MIDI value"""
     note_mapping = {
         'c': 0, 'c#': 1, 'db': 1, 'd': 2, 'd#': 3, 'eb': 3,
         'e': 4, 'f': 5, 'f#': 6, 'gb': 6, 'g': 7, 'g#': 8,
         'ab': 8, 'a': 9, 'a#': 10, 'bb': 10, 'b': 11
     }
-
-    try:
-        note_name, octave = note[:-1].lower(), int(note[-1])
-
-        if note_name in note_mapping:
-            if 1 <= octave <= 8:
-                midi_note = note_mapping[note_name] + (octave) * 12 + 12
-                return midi_note
-            else:
-                print(f"ERROR: Invalid octave: {octave}, must be in the range of c1 to c8")
-        else:
-            print(f"ERROR: Invalid note name: {note_name}")
-            return None
-
-    except (KeyError, ValueError) as e:
-        print(f"ERROR: {_format_exception_message(e)}")
-        return None
+    note_name, octave = note[:-1].lower(), note[-1:]
+    if note_name not in note_mapping:
+        raise BitBeatsError(f"Invalid note name: {note_name}", "note", note)
+    if not octave.isdigit() or not 1 <= int(octave) <= 8:
+        raise BitBeatsError(f"Invalid octave: {octave}, must be in the range of c1 to c8", "note", note)
+    return note_mapping[note_name] + int(octave) * 12 + 12
 
 def intervals_to_semitones(interval_sequence):
-    """Converts intervals to semitones"""
+    """Converts intervals (P1 to P8) to semitones"""
     interval_dict = {
         'P1': 0, 'm2': 1, 'M2': 2, 'm3': 3, 'M3': 4,
         'P4': 5, 'A4': 6, 'd5': 6, 'P5': 7, 'm6': 8,
@@ -416,26 +2032,476 @@ def intervals_to_semitones(interval_sequence):
     }
     semitones = []
     for interval in interval_sequence:
-        if interval in interval_dict:
-            semitones.append(interval_dict[interval])
+        if interval not in interval_dict:
+            raise BitBeatsError(f"Invalid interval: {interval}", "intervals", interval)
+        semitones.append(interval_dict[interval])
+    return semitones
+
+class ScriptLine:
+    """A single command line of a script"""
+
+    def __init__(self, line_number, text):
+        self.line_number = line_number
+        self.text = text
+
+class Block:
+    """A 'repeat N { ... }' or 'section NAME { ... }' block of a script
+
+    A section plays in place like 'repeat 1' and can be played again later
+    by its name. Calls share the body of the section, so it is compiled
+    only once.
+    """
+
+    def __init__(self, line_number, count, body, name=None):
+        self.line_number = line_number
+        self.count = count
+        self.body = body
+        self.name = name
+
+def parse_script(lines):
+    """Parses script lines into a list of ScriptLine and Block nodes
+
+    Comments and empty lines are dropped. Returns the nodes and the syntax
+    errors as (line number, message) tuples.
+    """
+    errors = []
+    sections = {}
+    nodes = []
+    stack = []
+    for line_number, line in enumerate(lines, 1):
+        text = line.strip()
+        if not text or text.startswith("#"):
+            continue
+        if text == "}":
+            if stack:
+                nodes, block = stack.pop()
+                if block.name:
+                    sections[block.name] = block
+            else:
+                errors.append((line_number, "ERROR: '}' without an open block."))
+            continue
+        if text.endswith("{"):
+            words = text[:-1].split()
+            block = Block(line_number, 0, [])
+            if len(words) != 2 or words[0] not in ("repeat", "section"):
+                errors.append((line_number, "ERROR: Blocks must start with 'repeat N {' or 'section NAME {'."))
+            elif words[0] == "repeat":
+                try:
+                    block.count = int(words[1])
+                    if block.count < 0:
+                        raise ValueError()
+                except ValueError:
+                    errors.append((line_number, "ERROR: Repeat count should be a whole number of at least 0."))
+            elif hasattr(BitBeats, "do_" + words[1]) or words[1] in sections:
+                errors.append((line_number, f"ERROR: Section name '{words[1]}' is already in use."))
+            else:
+                block.count = 1
+                block.name = words[1]
+            nodes.append(block)
+            stack.append((nodes, block))
+            nodes = block.body
+            continue
+        if text in sections:
+            nodes.append(Block(line_number, 1, sections[text].body))
         else:
-            print(f"ERROR: Invalid interval: {interval}")
-            return None
+            nodes.append(ScriptLine(line_number, text))
+    for _, block in stack:
+        errors.append((block.line_number, "ERROR: Block is not closed with '}'."))
+    return nodes, errors
 
-    return semitones
+def _state_key(msg):
+    """Returns the part of the sequencer state an OSC message sets"""
+    if msg.address in ("/start", "/stop"):
+        return "/start"
+    values = msg.values()
+    if values and values[0] in ("values", "values_eff"):
+        return (msg.address, values[0])
+    return msg.address
+
+def _apply_state(state, delta):
+    """Updates a state dict, keeping its keys ordered by their last update"""
+    for key, msg in delta.items():
+        state.pop(key, None)
+        state[key] = msg
+
+def _bundle(msgs):
+    """Returns a single OSCMessage, or an OSCBundle holding several"""
+    if len(msgs) == 1:
+        return msgs[0]
+    bundle = OSC.OSCBundle()
+    for msg in msgs:
+        bundle.append(msg)
+    return bundle
+
+class Clip:
+    """Pre-encoded packets of a block of script lines, replayed from cache
+
+    'items' holds ("packet", seconds, bars, packet, messages), ("wait",
+    seconds, bars, duration, duration_bars) and ("loop", seconds, bars, clip,
+    count) tuples, timed from the start of the clip. Messages sent at the
+    same instant share one packet. 'states' holds, for every item, the
+    sequencer state set by the clip up to and including that item.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.seconds = 0.0
+        self.bars = 0.0
+
+    def add_messages(self, seconds, bars, msgs):
+        if self.items and self.items[-1][0] == "packet" and self.items[-1][1] == seconds:
+            self.items[-1][4].extend(msgs)
+        else:
+            self.items.append(["packet", seconds, bars, None, list(msgs)])
+
+    def add_wait(self, seconds, bars, duration, duration_bars):
+        self.items.append(["wait", seconds, bars, duration, duration_bars])
+
+    def add_loop(self, seconds, bars, clip):
+        last = self.items[-1] if self.items else None
+        if last and last[0] == "loop" and last[3] is clip and last[1] + last[4] * clip.seconds == seconds:
+            last[4] += 1
+        else:
+            self.items.append(["loop", seconds, bars, clip, 1])
+
+    def finish(self, seconds, bars):
+        """Encodes the packets and indexes the state after every item"""
+        self.seconds = seconds
+        self.bars = bars
+        self.states = []
+        delta = {}
+        for item in self.items:
+            if item[0] == "packet":
+                item[3] = _bundle(item[4])
+                for msg in item[4]:
+                    _apply_state(delta, {_state_key(msg): msg})
+            elif item[0] == "loop":
+                _apply_state(delta, item[3].final)
+            self.states.append(dict(delta))
+        self.final = delta
+        self.items = [tuple(item) for item in self.items]
+        self.offsets = [item[1] for item in self.items]
+        self.bar_offsets = [item[2] for item in self.items]
+
+    def time_of(self, bars):
+        """Returns the time in seconds at which the given bar position is reached"""
+        i = bisect.bisect_right(self.bar_offsets, bars + 1e-9) - 1
+        if i < 0:
+            return 0.0
+        kind, seconds, start, a, b = self.items[i]
+        if kind == "wait" and bars < start + b:
+            return seconds + (bars - start) * a / b
+        if kind == "loop" and a.bars > 0 and bars < start + b * a.bars:
+            j = int((bars - start + 1e-9) // a.bars)
+            return seconds + j * a.seconds + a.time_of(bars - start - j * a.bars)
+        if kind == "packet" and bars <= start + 1e-9:
+            return seconds
+        return self.seconds
+
+    def state_at(self, seconds, state):
+        """Updates 'state' with everything the clip has set up to the given time"""
+        i = bisect.bisect_right(self.offsets, seconds + 1e-9) - 1
+        if i < 0:
+            return
+        kind, offset, _, a, b = self.items[i]
+        if kind == "loop" and a.seconds > 0 and seconds < offset + b * a.seconds - 1e-9:
+            if i > 0:
+                _apply_state(state, self.states[i - 1])
+            j = int((seconds - offset + 1e-9) // a.seconds)
+            if j > 0:
+                _apply_state(state, a.final)
+            a.state_at(seconds - offset - j * a.seconds, state)
+        else:
+            _apply_state(state, self.states[i])
+
+    def iter_packets(self, seconds=0.0, bars=0.0):
+        """Yields (seconds, bars, packet, messages) for every packet, with loops unrolled"""
+        for kind, offset, start, a, b in self.items:
+            if kind == "packet":
+                yield seconds + offset, bars + start, a, b
+            elif kind == "loop":
+                for j in range(b):
+                    yield from a.iter_packets(seconds + offset + j * a.seconds, bars + start + j * a.bars)
+
+def _script_inputs(b):
+    """Returns the state of a BitBeats shell that its commands read besides
+    the tempo: the variables and the channel table"""
+    return (tuple(sorted(b.variables.items())),
+            tuple((name, channel.type.name, channel.address) for name, channel in b.channels.items()))
+
+class _ScriptCompiler:
+    """Compiles parsed scripts by executing them once on a virtual clock
+
+    The compiler starts from the tempo, variables and channels of the
+    session it compiles for. Commands that act on the session itself
+    (SESSION_COMMANDS) are rejected, as they would only reach the
+    compiler's own shell. Blocks are compiled on their first iteration and replayed from cache
+    afterwards, as long as the tempo, variables and channels they start
+    with are the same. Replaying a block leaves the compiler in the state
+    its first iteration ended in. Blocks with commands that read the state
+    of the channels ('automate', 'scene') are compiled every time.
+    """
+
+    # commands whose messages depend on what was played before
+    STATEFUL_COMMANDS = ("automate", "scene")
+    # commands that change the session rather than what is played
+    SESSION_COMMANDS = ("capture", "target", "metrics", "ensemble", "coalesce")
 
-def main():
-    b = BitBeats()
+    def __init__(self, session=None):
+        self.clock = VirtualClock()
+        self.transport = MemoryTransport(self.clock)
+        self.b = BitBeats(clock=self.clock, transport=self.transport)
+        # packets are formed per instant by the Clip
+        self.b.batch_updates = False
+        if session is not None:
+            self.b.tempo = session.tempo
+            self.b.bar_duration = session.bar_duration
+            self.b.variables = dict(session.variables)
+            self.b.channels = session.channels
+        self.tempo_changed = False
+        self.errors = []
+        self.sections = {}
+        self._clips = {}
+        self._stateful = {}
+
+    def _inputs(self):
+        """Returns what the commands of a block read besides the tempo"""
+        return _script_inputs(self.b)
+
+    def _outputs(self):
+        b = self.b
+        return (dict(b.variables), b.channels, dict(b.scenes), b.tempo, b.bar_duration, dict(b.state))
+
+    def _restore(self, outputs):
+        b = self.b
+        variables, b.channels, scenes, b.tempo, b.bar_duration, state = outputs
+        b.variables, b.scenes, b.state = dict(variables), dict(scenes), dict(state)
+
+    def _is_stateful(self, nodes):
+        """Tells whether a block runs commands that read the state of the channels"""
+        key = id(nodes)
+        if key not in self._stateful:
+            self._stateful[key] = any(self._is_stateful(node.body) if isinstance(node, Block)
+                                      else node.text.split(" ", 1)[0] in self.STATEFUL_COMMANDS
+                                      for node in nodes)
+        return self._stateful[key]
+
+    def run_line(self, line_number, text):
+        """Runs one command, collecting its errors"""
+        name = text.split(None, 1)[0] if text.strip() else ""
+        if name in self.SESSION_COMMANDS:
+            self.errors.append((line_number, f"ERROR: '{name}' changes the session and only works in the shell, not in scripts"))
+            return
+        if name == "tempo":
+            self.tempo_changed = True
+        output = io.StringIO()
+        self.b.stdout = output
+        try:
+            with contextlib.redirect_stdout(output):
+                self.b.onecmd(self.b.precmd(text))
+        except Exception as e:
+            self.errors.append((line_number, _format_exception_message(e)))
+        for message in output.getvalue().splitlines():
+            if message.startswith(("ERROR", "***")):
+                self.errors.append((line_number, message))
+
+    def compile(self, nodes):
+        """Executes the nodes once and returns them as a Clip"""
+        clip = Clip()
+        start_time, start_bars = self.clock.now(), self.b.bars
+        for node in nodes:
+            line_time, line_bars = self.clock.now(), self.b.bars
+            if isinstance(node, ScriptLine):
+                self.run_line(node.line_number, node.text)
+                duration = self.clock.now() - line_time
+                duration_bars = self.b.bars - line_bars
+                if duration > 0:
+                    clip.add_wait(line_time - start_time, line_bars - start_bars, duration, duration_bars)
+                for stamp, msg in self.transport.packets:
+                    bars = line_bars + (duration_bars * (stamp - line_time) / duration if duration > 0 else 0)
+                    # bundles ('stop', 'pause', scenes) are split up to index the state they set
+                    msgs = msg.values() if isinstance(msg, OSC.OSCBundle) else [msg]
+                    clip.add_messages(stamp - start_time, bars - start_bars, msgs)
+                self.transport.packets.clear()
+                continue
+
+            if node.name and node.name not in self.sections:
+                self.sections[node.name] = (self.b.bars, None)
+            for _ in range(node.count):
+                key = (id(node.body), self.b.tempo, getattr(self.b, "bar_duration", None), self._inputs())
+                loop_time, loop_bars = self.clock.now(), self.b.bars
+                # automation running into or out of a block differs per iteration
+                cacheable = not self.b.lanes and not self._is_stateful(node.body)
+                cached = self._clips.get(key) if cacheable else None
+                if cached is None:
+                    body = self.compile(node.body)
+                    if cacheable and not self.b.lanes:
+                        self._clips[key] = (body, self._outputs())
+                else:
+                    body, outputs = cached
+                    self._restore(outputs)
+                    self.clock.sleep_until(loop_time + body.seconds)
+                    self.b.bars += body.bars
+                clip.add_loop(loop_time - start_time, loop_bars - start_bars, body)
+            if node.name and self.sections[node.name][1] is None:
+                self.sections[node.name] = (self.sections[node.name][0], self.b.bars)
+        clip.finish(self.clock.now() - start_time, self.b.bars - start_bars)
+        return clip
+
+class CompiledScript:
+    """A script compiled into pre-encoded packets and loops
+
+    The script is executed once on a virtual clock. Loops and sections are
+    kept as references to one compiled body, so memory stays proportional
+    to the unique content of the script. The state of all channels and
+    effects at any bar is reconstructed from per-item state indexes, so
+    playback can start at any bar without replaying the earlier waits.
+    """
+
+    def __init__(self, script_file, clip, errors, sections, tempo, variables, tempo_changed=True, bar_duration=None):
+        self.script_file = script_file
+        self.clip = clip
+        self.errors = errors
+        self.sections = sections
+        self.tempo = tempo
+        self.tempo_changed = tempo_changed
+        self.bar_duration = bar_duration
+        self.variables = variables
+        self.bars = clip.bars
+        self.seconds = clip.seconds
+        self.bar_count = math.ceil(self.bars - 1e-9)
+
+    def bar_time(self, bar):
+        """Returns the time in seconds at which the given bar (counted from 0) starts"""
+        return self.clip.time_of(bar)
+
+    def snapshot(self, seconds):
+        """Returns one packet restoring the whole state at the given time, or None"""
+        state = {}
+        self.clip.state_at(seconds, state)
+        return _bundle(list(state.values())) if state else None
+
+def compile_script(script_file, session=None):
+    """Compiles a script file into a CompiledScript, starting from the
+    tempo, variables and channels of a BitBeats session if given"""
+    with open(script_file) as f:
+        lines = f.readlines()
+    nodes, errors = parse_script(lines)
+    compiler = _ScriptCompiler(session)
+    clip = compiler.compile(nodes)
+    errors = sorted(errors + compiler.errors, key=lambda error: error[0])
+    return CompiledScript(script_file, clip, errors, compiler.sections, compiler.b.tempo, compiler.b.variables,
+                          compiler.tempo_changed, compiler.b.bar_duration)
+
+def check_script(script_file, session=None):
+    """Compiles a script and reports on it without network access, starting
+    from the tempo, variables and channels of a BitBeats session if given
+
+    Returns a report dict with the collected errors as (line number,
+    message) tuples, the duration in bars and seconds, the tempo changes
+    as (bar, bpm) tuples, the message counts per channel, the OSC traffic
+    in bytes and the peak number of messages sent within one bar.
+    """
+    started = time.perf_counter()
+    compiled = compile_script(script_file, session)
+    messages_per_bar = {}
+    tempo_changes = []
+    channels = {}
+    traffic = 0
+    for _, bars, packet, msgs in compiled.clip.iter_packets():
+        bar = int(bars + 1e-9)
+        messages_per_bar[bar] = messages_per_bar.get(bar, 0) + len(msgs)
+        traffic += len(packet.getBinary())
+        for msg in msgs:
+            channels[msg.address] = channels.get(msg.address, 0) + 1
+            if msg.address == "/tempo":
+                tempo_changes.append((bars, msg.values()[0] / 2))
+    elapsed = time.perf_counter() - started
+
+    peak_bar = max(messages_per_bar, key=messages_per_bar.get, default=None)
+    return {
+        "script": script_file,
+        "errors": compiled.errors,
+        "bars": compiled.bars,
+        "seconds": compiled.seconds,
+        "tempo_changes": tempo_changes,
+        "channels": channels,
+        "bytes": traffic,
+        "peak_messages_per_bar": messages_per_bar.get(peak_bar, 0),
+        "peak_bar": peak_bar,
+        "elapsed": elapsed,
+    }
+
+def print_report(report):
+    """Prints a report returned by check_script"""
+    print(f"Script: {report['script']}")
+    print(f"Duration: {report['bars']:g} bars, {report['seconds']:.2f} seconds")
+    for bar, tempo in report["tempo_changes"]:
+        print(f"Tempo {tempo:g} BPM at bar {int(bar) + 1}")
+    for channel, count in sorted(report["channels"].items()):
+        print(f"Messages {channel}: {count}")
+    print(f"OSC traffic: {report['bytes']} bytes")
+    if report["peak_bar"] is not None:
+        print(f"Peak messages per bar: {report['peak_messages_per_bar']} (bar {report['peak_bar'] + 1})")
+    speedup = report["seconds"] / report["elapsed"] if report["elapsed"] > 0 else 0
+    print(f"Checked in {report['elapsed'] * 1000:.2f} ms ({speedup:.0f}x real time)")
+    for line_number, message in report["errors"]:
+        print(f"Line {line_number}: {message}")
+    if report["errors"]:
+        print(f"{len(report['errors'])} error(s) found")
+    else:
+        print("No errors found")
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "check":
+        failed = False
+        for script_file in argv[1:]:
+            try:
+                report = check_script(script_file)
+            except FileNotFoundError:
+                print(f"ERROR: Script file '{script_file}' not found")
+                failed = True
+                continue
+            print_report(report)
+            failed = failed or bool(report["errors"])
+        return 1 if failed else 0
+
+    profile = None
+    if argv and argv[0].startswith("--profile"):
+        profile = argv.pop(0).partition("=")[2] or "bitbeats.pstats"
+    transport = None
+    if argv and argv[0].startswith("--daemon"):
+        import bb_daemon
+        address = argv.pop(0).partition("=")[2] or "/tmp/bitbeats.sock"
+        try:
+            transport = bb_daemon.DaemonTransport(address)
+        except OSError as e:
+            print(f"ERROR: Could not connect to the daemon at {address}: {_format_exception_message(e)}")
+            return 1
+
+    b = BitBeats(transport=transport)
     try:
-        b.cmdloop()
+        if profile:
+            memory = "--memory" in argv
+            b.profile_command(" ".join(part for part in argv if part != "--memory"), profile, memory)
+        elif argv:
+            b.onecmd(" ".join(argv))
+        else:
+            b.cmdloop()
     except KeyboardInterrupt:
         print("KeyboardInterrupt: Stopping the script.")
+        b.dump_flight("KeyboardInterrupt")
         return
     except Exception as e:
         print(f"ERROR: {_format_exception_message(e)}")
+    finally:
+        if transport:
+            transport.close()
 
 def _format_exception_message(exception):
     return f"{type(exception).__name__}: {str(exception)}"
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# Copyright (C) 2024 Hannes PESCOLLER, Eugen-Maximilian STANGL
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""Validates and analyses whole directories of BitBeats scripts in parallel
+
+Every script is checked with BitBeats.check_script in a process pool. The
+results are written to a single JSON index, keyed by script path and
+content hash, so that a later run only reprocesses scripts that changed.
+
+Example: python bb_batch.py -o index.json scripts/
+"""
+
+import argparse
+import concurrent.futures
+import fnmatch
+import hashlib
+import json
+import os
+import sys
+
+import BitBeats
+import OSC
+import OSC_server
+
+INDEX_VERSION = 1
+
+# modules whose source affects the reports stored in the index
+ENGINE_MODULES = (BitBeats, OSC, OSC_server, sys.modules[__name__])
+
+def hash_file(path):
+    """Returns the SHA-256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def engine_hash():
+    """Returns a hash of the source of ENGINE_MODULES, so that results are
+    recomputed whenever the interpreter, the OSC encoder or this module changes"""
+    digest = hashlib.sha256()
+    for module in ENGINE_MODULES:
+        digest.update(os.path.basename(module.__file__).encode() + b"\0")
+        digest.update(bytes.fromhex(hash_file(module.__file__)))
+    return digest.hexdigest()
+
+def find_scripts(paths, pattern="*.txt"):
+    """Returns a sorted list of the script files in the given files and directories"""
+    scripts = set()
+    for path in paths:
+        if os.path.isfile(path):
+            scripts.add(os.path.abspath(path))
+            continue
+        for root, _, files in os.walk(path):
+            for name in fnmatch.filter(files, pattern):
+                scripts.add(os.path.abspath(os.path.join(root, name)))
+    return sorted(scripts)
+
+def analyse(script_file):
+    """Checks one script, returning a JSON-serializable report"""
+    try:
+        report = BitBeats.check_script(script_file)
+    except Exception as e:
+        return {"script": script_file, "errors": [[0, BitBeats._format_exception_message(e)]]}
+    report["errors"] = [list(error) for error in report["errors"]]
+    report["tempo_changes"] = [list(change) for change in report["tempo_changes"]]
+    return report
+
+def load_index(index_file):
+    """Loads an index file, returning an empty index if it is missing or outdated"""
+    empty = {"version": INDEX_VERSION, "engine": engine_hash(), "scripts": {}}
+    try:
+        with open(index_file) as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return empty
+    if index.get("version") != INDEX_VERSION or index.get("engine") != empty["engine"]:
+        return empty
+    return index
+
+def save_index(index, index_file):
+    """Writes the index atomically"""
+    tmp_file = index_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(tmp_file, index_file)
+
+def run_batch(paths, index_file, jobs=None, pattern="*.txt"):
+    """Analyses all scripts below the given paths, reusing unchanged results
+
+    Returns the updated index and the list of reprocessed scripts.
+    """
+    old_index = load_index(index_file)
+    index = {"version": INDEX_VERSION, "engine": old_index["engine"], "scripts": {}}
+    pending = {}
+    for script_file in find_scripts(paths, pattern):
+        content_hash = hash_file(script_file)
+        entry = old_index["scripts"].get(script_file)
+        if entry and entry["hash"] == content_hash:
+            index["scripts"][script_file] = entry
+        else:
+            pending[script_file] = content_hash
+
+    if pending:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            chunksize = max(1, len(pending) // (4 * (jobs or os.cpu_count() or 1)))
+            reports = pool.map(analyse, list(pending), chunksize=chunksize)
+            for script_file, report in zip(list(pending), reports):
+                index["scripts"][script_file] = {"hash": pending[script_file], "report": report}
+
+    save_index(index, index_file)
+    return index, list(pending)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate and analyse BitBeats scripts in parallel")
+    parser.add_argument("paths", nargs="+", help="script files or directories")
+    parser.add_argument("-o", "--index", default="bitbeats_index.json", help="index file (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--pattern", default="*.txt", help="file name pattern in directories (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    index, processed = run_batch(args.paths, args.index, args.jobs, args.pattern)
+    failed = 0
+    for script_file, entry in index["scripts"].items():
+        report = entry["report"]
+        for line_number, message in report["errors"]:
+            print(f"{script_file}:{line_number}: {message}")
+        failed += bool(report["errors"])
+    total = len(index["scripts"])
+    print(f"{total} script(s), {len(processed)} processed, {total - len(processed)} unchanged, {failed} with errors")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
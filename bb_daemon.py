@@ -0,0 +1,299 @@
+# Copyright (C) 2024 Hannes PESCOLLER, Eugen-Maximilian STANGL
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""Local sender daemon shared by several BitBeats front-ends
+
+The daemon owns the clock, the bar scheduler and the OSC socket to
+BitBeats.pd. Front-ends connect over a Unix domain socket or TCP and send
+their OSC messages with the OSC streaming protocol (every packet preceded by
+its length). Messages are collected per bar and sent as one bundle shortly
+before the bar starts, so all performers share one timeline.
+
+Start the daemon, then point BitBeats at it:
+
+    python bb_daemon.py --listen /tmp/bitbeats.sock
+    python BitBeats.py --daemon=/tmp/bitbeats.sock run_script commands.txt
+
+Example: python bb_daemon.py --listen localhost:9990 --target localhost:9999
+"""
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+import BitBeats
+import OSC
+
+def parse_address(text):
+    """Returns (family, address) for 'HOST:PORT' (TCP) or a Unix socket path"""
+    host, sep, port = text.rpartition(":")
+    if sep and port.isdigit() and "/" not in text:
+        return socket.AF_INET, (host or "localhost", int(port))
+    return socket.AF_UNIX, text
+
+class SenderDaemon:
+    """Merges the messages of all front-ends into one bundle per bar
+
+    While the sequencer is stopped, messages are sent straight away. A
+    '/start' opens the bar grid: bar 0 begins start_delay seconds later and
+    every bar's messages are sent lookahead seconds before it begins, in the
+    order they were submitted. '/tempo' messages change the length of the
+    bars after the one they are sent with.
+
+    The grid stays open as long as one front-end that sent '/start' is
+    still playing. '/start' messages of further front-ends join the running
+    grid, and a '/stop' only reaches Pd (and closes the grid) when it comes
+    from the last of them. The same goes for the rest of a front-end's stop
+    bundle: while others are playing, '/master_vol 0' is dropped, and so
+    are the pauses and arpeggio resets of channels the front-end did not
+    play itself. A front-end that disconnects stops playing.
+    """
+
+    def __init__(self, transport=None, clock=None, tempo=60.0, start_delay=0.05, lookahead=0.002):
+        self.transport = transport or BitBeats.OSCTransport()
+        self.clock = clock or BitBeats.RealClock()
+        self.bar_duration = (60 / tempo) * 4
+        self.start_delay = start_delay
+        self.lookahead = lookahead
+        self.next_bar = None
+        self.bar = 0
+        self.pending = []
+        self.bundles = 0
+        self.messages = 0
+        self.ignored = 0
+        self.players = set()
+        # channel addresses each front-end has played
+        self.channels = {}
+        self.running = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """Starts the scheduler thread"""
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the scheduler thread, sending what is still pending"""
+        with self._condition:
+            self.running = False
+            self._condition.notify()
+        self._thread.join()
+        self._flush()
+
+    def submit(self, msg, client=None):
+        """Adds an OSCMessage from a front-end (any hashable id) to the timeline"""
+        with self._condition:
+            self.messages += 1
+            if msg.address == "/start":
+                self.players.add(client)
+                if self.next_bar is not None:
+                    self.ignored += 1
+                    return
+                self.next_bar = self.clock.now() + self.start_delay
+                self.bar = 0
+                self._condition.notify()
+            elif msg.address == "/stop":
+                self.players.discard(client)
+                if self.players:
+                    # other front-ends are still playing
+                    self.ignored += 1
+                    return
+            elif self._silences_others(msg, client):
+                self.ignored += 1
+                return
+            if self.next_bar is None:
+                if msg.address == "/tempo":
+                    self.bar_duration = 8 * 60 / msg.values()[0]
+                self._send(msg)
+            else:
+                self.pending.append(msg)
+
+    def _silences_others(self, msg, client):
+        """Tells whether msg would silence what other players are playing:
+        '/master_vol 0', or a pause or arpeggio reset of a channel the client
+        did not play. Records the channels the client plays. Called with the
+        condition held."""
+        args = msg.values()
+        others = bool(self.players - {client})
+        if msg.address == "/master_vol":
+            return others and args[:1] == [0]
+        if len(args) < 2 or args[0] not in ("values", "values_eff"):
+            return False
+        # pauses have volume 0, arpeggio resets 0 steps
+        played = self.channels.setdefault(client, set())
+        if args[1] != 0:
+            played.add(msg.address)
+            return False
+        return others and msg.address not in played
+
+    def disconnect(self, client):
+        """Forgets a front-end; the grid closes after the bar when the last player left"""
+        with self._condition:
+            self.players.discard(client)
+            self.channels.pop(client, None)
+
+    def _send(self, msg):
+        try:
+            self.transport.send(msg)
+        except Exception as e:
+            print(f"ERROR: {BitBeats._format_exception_message(e)}")
+
+    def _flush(self):
+        """Sends the pending messages as one bundle and moves to the next bar"""
+        with self._condition:
+            msgs, self.pending = self.pending, []
+            for msg in msgs:
+                if msg.address == "/tempo":
+                    self.bar_duration = 8 * 60 / msg.values()[0]
+            if not self.players:
+                self.next_bar = None
+            if self.next_bar is not None:
+                self.next_bar += self.bar_duration
+                self.bar += 1
+            if msgs:
+                self.bundles += 1
+                self._send(BitBeats._bundle(msgs))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self.running and self.next_bar is None:
+                    self._condition.wait()
+                if not self.running:
+                    return
+                deadline = self.next_bar - self.lookahead
+            self.clock.sleep_until(deadline)
+            self._flush()
+
+    def summary(self):
+        """Returns the counters of the daemon as a dict"""
+        return {"messages": self.messages, "bundles": self.bundles, "ignored": self.ignored,
+                "bars": self.bar, "running": self.next_bar is not None}
+
+class _FrontEndHandler(OSC.OSCStreamRequestHandler):
+    """Submits every message of a front-end connection to the daemon"""
+
+    def setupAddressSpace(self):
+        self.addMsgHandler("default", self._submit)
+
+    def finish(self):
+        super().finish()
+        self.server.daemon.disconnect(self)
+
+    def _submit(self, address, tags, data, client_address):
+        msg = OSC.OSCMessage(address)
+        for typetag, value in zip(tags, data):
+            msg.append(value, typehint=typetag)
+        self.server.daemon.submit(msg, self)
+
+class DaemonServer(OSC.OSCStreamingServerThreading):
+    """Accepts front-end connections over TCP and feeds them to a SenderDaemon"""
+
+    RequestHandlerClass = _FrontEndHandler
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, address, daemon):
+        self.daemon = daemon
+        super().__init__(address)
+
+class UnixDaemonServer(DaemonServer):
+    """DaemonServer listening on a Unix domain socket"""
+
+    address_family = socket.AF_UNIX
+
+    def __init__(self, path, daemon):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, daemon)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+def make_server(address, daemon):
+    """Returns a DaemonServer for 'HOST:PORT' or a UnixDaemonServer for a path"""
+    family, parsed = parse_address(address)
+    if family == socket.AF_UNIX:
+        return UnixDaemonServer(parsed, daemon)
+    return DaemonServer(parsed, daemon)
+
+class DaemonTransport:
+    """BitBeats transport submitting messages to a running bb_daemon"""
+
+    def __init__(self, address):
+        family, parsed = parse_address(address)
+        self.address = address
+        self.stream = OSC.OSCStreamingClient(family)
+        self.stream.connect(parsed)
+        self.capture = None
+        self._lock = threading.Lock()
+
+    def send(self, msg):
+        """Sends an OSCMessage (or OSCBundle) to the daemon, returning the packet size"""
+        with self._lock:
+            if not self.stream.sendOSC(msg):
+                raise OSC.OSCClientError("Connection to the daemon was closed")
+            binary = msg.getBinary()
+            if self.capture:
+                self.capture.write(binary, destination=self.address)
+        return len(binary)
+
+    def set_capture(self, capture):
+        """Records every packet sent to the daemon in capture, an OSC.OSCCaptureWriter (None stops)"""
+        self.capture = capture
+
+    def close(self):
+        """Closes the connection to the daemon"""
+        self.stream.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shares one clock and OSC socket to BitBeats.pd between several BitBeats front-ends.")
+    parser.add_argument("--listen", default="/tmp/bitbeats.sock", help="Unix socket path or HOST:PORT to accept front-ends on")
+    parser.add_argument("--target", default="localhost:9999", help="HOST:PORT of BitBeats.pd")
+    parser.add_argument("--tempo", type=float, default=60.0, help="tempo until a front-end sets one")
+    parser.add_argument("--start-delay", type=float, default=0.05, help="seconds between the first 'start' and bar 0")
+    parser.add_argument("--lookahead", type=float, default=0.002, help="seconds before a bar its bundle is sent")
+    args = parser.parse_args(argv)
+
+    host, _, port = args.target.rpartition(":")
+    daemon = SenderDaemon(BitBeats.OSCTransport(host or "localhost", int(port)), tempo=args.tempo,
+                          start_delay=args.start_delay, lookahead=args.lookahead)
+    try:
+        server = make_server(args.listen, daemon)
+    except OSError as e:
+        print(f"ERROR: Could not listen on {args.listen}: {BitBeats._format_exception_message(e)}")
+        return 1
+    daemon.start()
+    server.start()
+    print(f"Listening on {args.listen}, sending to {args.target}. Stop with Ctrl+C.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+    daemon.stop()
+    print(daemon.summary())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
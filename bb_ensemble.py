@@ -0,0 +1,377 @@
+# Copyright (C) 2024 Hannes PESCOLLER, Eugen-Maximilian STANGL
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""Keeps several BitBeats processes in lockstep with a shared bar clock
+
+One process is the clock leader. It answers sync requests and sends every
+follower a beat bundle before each bar, with the bar's start time as OSC
+timetag. Followers measure their offset and skew to the leader the way NTP
+does: each request is stamped when it is sent (t1), received by the
+leader (t2), answered (t3) and received back (t4). The offset is
+((t2 - t1) + (t3 - t4)) / 2 and the round trip (t4 - t1) - (t3 - t2);
+offset and skew are fitted to the samples with the shortest round trips.
+
+Both classes are BitBeats clocks: now() and sleep_until() work in the
+leader's timebase, and next_bar() returns the start of the next bar of the
+shared grid, which BitBeats waits for before it starts playing.
+
+Example: python bb_ensemble.py verify --followers 3 --seconds 20
+"""
+
+import argparse
+import math
+import multiprocessing
+import socket
+import sys
+import threading
+import time
+
+import OSC
+
+SYNC_ADDRESS = "/bitbeats/sync"
+BEAT_ADDRESS = "/bitbeats/beat"
+
+def _bundle(timetag, address, *args):
+    """Returns the binary of an OSCBundle holding one message with (value, typetag) args"""
+    msg = OSC.OSCMessage(address)
+    for value, typetag in args:
+        msg.append(value, typehint=typetag)
+    bundle = OSC.OSCBundle(time=timetag)
+    bundle.append(msg)
+    return bundle.getBinary()
+
+class EnsembleLeader:
+    """Clock leader: defines the bar grid and answers the followers
+
+    The leader's timebase is time.monotonic() shifted to the wall clock at
+    start, so it never jumps but reads as a normal NTP time in the timetags.
+    """
+
+    # followers that did not send a sync request for this long get no beats
+    follower_timeout = 5.0
+
+    def __init__(self, port=9995, tempo=120.0, host="0.0.0.0", lead=0.05):
+        self.base = time.time() - time.monotonic()
+        self.bar_duration = (60 / tempo) * 4
+        self.lead = lead
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((host, port))
+        self.socket.settimeout(0.2)
+        self.address = self.socket.getsockname()
+        self.followers = {}
+        self.origin = self.now() + lead
+        self.bar = 0
+        self.running = False
+
+    def now(self):
+        """Returns the current time in the leader's timebase"""
+        return time.monotonic() + self.base
+
+    def sleep_until(self, deadline):
+        """Blocks until the given leader time is reached"""
+        delay = deadline - self.now()
+        if delay > 0:
+            time.sleep(delay)
+
+    def next_bar(self):
+        """Returns the start of the next bar of the grid"""
+        return self.origin + math.ceil((self.now() - self.origin) / self.bar_duration) * self.bar_duration
+
+    def bar_index(self, stamp):
+        """Returns the number of the bar starting at a grid time"""
+        return round((stamp - self.origin) / self.bar_duration)
+
+    def start(self):
+        """Starts answering sync requests and sending beats"""
+        self.running = True
+        self._threads = [threading.Thread(target=self._serve, daemon=True), threading.Thread(target=self._beat, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stops the leader and closes its socket"""
+        self.running = False
+        for thread in self._threads:
+            thread.join()
+        self.socket.close()
+
+    def _serve(self):
+        while self.running:
+            try:
+                data, address = self.socket.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            received = self.now()
+            try:
+                decoded = OSC.decodeOSC(data)
+            except Exception:
+                continue
+            if not decoded or decoded[0] != SYNC_ADDRESS:
+                continue
+            self.followers[address] = received
+            # t3 is taken as late as possible, just before encoding the reply
+            reply = _bundle(self.now(), SYNC_ADDRESS, (decoded[2], "i"), (received, "t"))
+            self.socket.sendto(reply, address)
+
+    def _beat(self):
+        stamp = self.next_bar()
+        while self.running:
+            # short sleeps, so that stop() does not wait for a whole bar
+            while self.running and self.now() < stamp - self.lead:
+                time.sleep(min(stamp - self.lead - self.now(), 0.1))
+            bar = self.bar_index(stamp)
+            beat = _bundle(stamp, BEAT_ADDRESS, (bar, "i"), (self.bar_duration, "d"))
+            now = self.now()
+            for address, seen in list(self.followers.items()):
+                if now - seen > self.follower_timeout:
+                    del self.followers[address]
+                    continue
+                try:
+                    self.socket.sendto(beat, address)
+                except OSError:
+                    pass
+            self.bar = bar
+            stamp += self.bar_duration
+
+class EnsembleFollower:
+    """Follows the bar grid of an EnsembleLeader
+
+    Sync requests are sent every 'interval' seconds (faster right after
+    start). The leader time is estimated as offset + (1 + skew) * local
+    time, with the local time from time.monotonic().
+    """
+
+    # sync samples kept for the fit, and how many of the fastest are used
+    window = 64
+    best = 16
+
+    def __init__(self, leader, interval=0.25):
+        self.leader = leader
+        self.interval = interval
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.connect(leader)
+        self.socket.settimeout(0.01)
+        self.samples = []
+        self.offset = None
+        self.skew = 0.0
+        self.reference = 0.0
+        self.delay = None
+        self.beat = None
+        self.requests = {}
+        self.sequence = 0
+        self.running = False
+        self.synced = threading.Event()
+
+    def now(self):
+        """Returns the estimated current time in the leader's timebase"""
+        return self.to_leader(time.monotonic())
+
+    def to_leader(self, local):
+        """Converts a local time.monotonic() time to leader time"""
+        return local + self.offset + self.skew * (local - self.reference)
+
+    def to_local(self, stamp):
+        """Converts a leader time to local time.monotonic() time"""
+        return (stamp - self.offset + self.skew * self.reference) / (1 + self.skew)
+
+    def sleep_until(self, deadline):
+        """Blocks until the given leader time is reached"""
+        delay = self.to_local(deadline) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def next_bar(self):
+        """Returns the start of the next bar of the leader's grid"""
+        stamp, bar, bar_duration = self.beat
+        return stamp + math.ceil((self.now() - stamp) / bar_duration) * bar_duration
+
+    def bar_index(self, stamp):
+        """Returns the number of the leader's bar starting at a grid time"""
+        beat, bar, bar_duration = self.beat
+        return bar + round((stamp - beat) / bar_duration)
+
+    def start(self, timeout=5.0):
+        """Starts following and waits until the clock and the grid are known.
+        Raises OSError if the leader does not answer within the timeout."""
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        if not self.synced.wait(timeout):
+            self.stop()
+            raise OSError(f"No answer from the ensemble leader at {self.leader[0]}:{self.leader[1]}")
+
+    def stop(self):
+        """Stops following and closes the socket"""
+        self.running = False
+        self._thread.join()
+        self.socket.close()
+
+    def _request(self):
+        self.sequence += 1
+        self.requests[self.sequence] = time.monotonic()
+        if len(self.requests) > self.window:
+            self.requests.pop(min(self.requests))
+        try:
+            self.socket.send(OSC.OSCMessage(SYNC_ADDRESS, self.sequence).getBinary())
+        except OSError:
+            pass
+
+    def _run(self):
+        next_request = 0.0
+        while self.running:
+            local = time.monotonic()
+            if local >= next_request:
+                self._request()
+                # 8 quick requests for a first estimate, then one per interval
+                next_request = local + (0.02 if len(self.samples) < 8 else self.interval)
+            try:
+                data = self.socket.recv(1024)
+            except (socket.timeout, ConnectionRefusedError):
+                continue
+            received = time.monotonic()
+            try:
+                decoded = OSC.decodeOSC(data)
+            except Exception:
+                continue
+            if len(decoded) < 3 or decoded[0] != "#bundle":
+                continue
+            message = decoded[2]
+            if message[0] == SYNC_ADDRESS:
+                sent = self.requests.pop(message[2], None)
+                if sent is not None:
+                    self._add_sample(sent, message[3], decoded[1], received)
+            elif message[0] == BEAT_ADDRESS:
+                self.beat = (decoded[1], message[2], message[3])
+            if self.offset is not None and self.beat is not None:
+                self.synced.set()
+
+    def _add_sample(self, t1, t2, t3, t4):
+        """Adds one sync exchange and refits offset and skew"""
+        offset = ((t2 - t1) + (t3 - t4)) / 2
+        delay = (t4 - t1) - (t3 - t2)
+        self.samples.append(((t1 + t4) / 2, offset, delay))
+        del self.samples[:-self.window]
+        best = sorted(self.samples, key=lambda sample: sample[2])[:self.best]
+        self.delay = best[0][2]
+        reference = sum(sample[0] for sample in best) / len(best)
+        mean = sum(sample[1] for sample in best) / len(best)
+        spread = sum((sample[0] - reference) ** 2 for sample in best)
+        # the skew needs samples spread over a few seconds to be meaningful
+        skew = 0.0
+        if spread > 1.0:
+            skew = sum((sample[0] - reference) * (sample[1] - mean) for sample in best) / spread
+        # leader time = local + mean + skew * (local - reference)
+        self.offset, self.skew, self.reference = mean, skew, reference
+
+    def status(self):
+        """Returns the current estimate as a dict"""
+        return {"offset": self.offset, "skew_ppm": self.skew * 1e6, "delay": self.delay,
+                "samples": len(self.samples), "bar": None if self.beat is None else self.beat[1]}
+
+def _follower_main(leader, bars, connection):
+    """Runs a follower in a child process and reports when it woke up for each bar"""
+    follower = EnsembleFollower(leader)
+    follower.start()
+    time.sleep(2.0)
+    wakes = {}
+    stamp = follower.next_bar()
+    for _ in range(bars):
+        follower.sleep_until(stamp)
+        wakes[follower.bar_index(stamp)] = time.monotonic()
+        stamp += follower.beat[2]
+    connection.send((wakes, follower.status()))
+    follower.stop()
+
+def verify(followers=3, seconds=20.0, tempo=240.0, port=0):
+    """Runs a leader and follower processes on this machine and returns the
+    differences (in seconds) between the leader's and the followers' bar starts
+
+    On one machine all processes share time.monotonic(), so the moments
+    they wake up for the same bar can be compared directly.
+    """
+    leader = EnsembleLeader(port, tempo, host="127.0.0.1")
+    leader.start()
+    bars = int(seconds / leader.bar_duration)
+    context = multiprocessing.get_context("spawn")
+    pipes, processes = [], []
+    for _ in range(followers):
+        parent, child = context.Pipe()
+        process = context.Process(target=_follower_main, args=(leader.address, bars, child))
+        process.start()
+        pipes.append(parent)
+        processes.append(process)
+    wakes = {}
+    deadline = time.monotonic() + seconds + 30.0
+    stamp = leader.next_bar()
+    while time.monotonic() < deadline and not all(pipe.poll() for pipe in pipes):
+        leader.sleep_until(stamp)
+        wakes[leader.bar_index(stamp)] = time.monotonic()
+        stamp += leader.bar_duration
+    results = [pipe.recv() for pipe in pipes if pipe.poll(5.0)]
+    for process in processes:
+        process.join()
+    leader.stop()
+    report = []
+    for index, (follower_wakes, status) in enumerate(results):
+        errors = [follower_wakes[bar] - wakes[bar] for bar in sorted(follower_wakes) if bar in wakes]
+        report.append({"follower": index, "bars": len(errors), "status": status,
+                       "mean": sum(errors) / len(errors) if errors else None,
+                       "max": max(map(abs, errors)) if errors else None})
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs an ensemble clock leader or checks how closely followers keep up with it.")
+    parser.add_argument("mode", choices=("lead", "verify"))
+    parser.add_argument("--port", type=int, default=9995, help="UDP port of the leader")
+    parser.add_argument("--tempo", type=float, default=120.0, help="tempo of the shared bar grid")
+    parser.add_argument("--followers", type=int, default=3, help="follower processes to start ('verify')")
+    parser.add_argument("--seconds", type=float, default=20.0, help="how long to compare bar starts ('verify')")
+    args = parser.parse_args(argv)
+
+    if args.mode == "lead":
+        try:
+            leader = EnsembleLeader(args.port, args.tempo)
+        except OSError as e:
+            print(f"ERROR: Could not listen on port {args.port}: {e}")
+            return 1
+        leader.start()
+        print(f"Leading at {args.tempo:g} BPM on port {args.port}. Stop with Ctrl+C.")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        leader.stop()
+        return 0
+
+    report = verify(args.followers, args.seconds, args.tempo, 0)
+    failed = False
+    for result in report:
+        if result["max"] is None:
+            print(f"Follower {result['follower']}: no bars compared")
+            failed = True
+            continue
+        print(f"Follower {result['follower']}: {result['bars']} bars, mean {result['mean'] * 1000:+.3f} ms, "
+              f"max {result['max'] * 1000:.3f} ms, round trip {result['status']['delay'] * 1e6:.0f} us")
+        failed = failed or result["max"] > 0.001
+    if len(report) < args.followers:
+        print(f"ERROR: Only {len(report)} of {args.followers} followers reported")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
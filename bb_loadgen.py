@@ -0,0 +1,292 @@
+# Copyright (C) 2024 Hannes PESCOLLER, Eugen-Maximilian STANGL
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""Finds how much OSC traffic a local receiver can sustain
+
+N simulated sessions send the packets of a typical BitBeats command mix
+to a receiver running in its own process. The total rate is raised step by
+step until packet loss, the receive queue or the latency of timestamped
+probe messages passes its threshold. This is repeated for every receiver
+mode: OSC.OSCServer ('osc'), OSC.ThreadingOSCServer ('threading') and the
+bb_receiver stand-in for BitBeats.pd ('standin').
+
+Example: python bb_loadgen.py --sessions 8 --report loadgen.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import socket
+import sys
+import threading
+import time
+
+import BitBeats
+import OSC
+import bb_metrics
+import bb_receiver
+
+MODES = ("osc", "threading", "standin")
+
+COMMAND_MIX = [
+    "tempo 140",
+    "start",
+    "play square1 0.7 01010101 e3 1 0.2",
+    "play square2 0.5 10101010 g3 2 0.5",
+    "play triangle 0.8 11110000 c3 4 0",
+    "play noise 0.3 10001000 hp 3000 10 50 3 50",
+    "set_effect square1 3 P1M3P5",
+    "master_vol 0.8",
+    "play square1 0.6 11001100 a3 1 0.5,square2 0.4 00110011 c4 1 0.25",
+    "stop_effect square1",
+    "pause noise",
+]
+
+def command_mix_packets():
+    """Returns the encoded packets a session sends for COMMAND_MIX, plus
+    one bundle of a whole bar as sent by compiled scripts, and the number
+    of messages in every packet"""
+    transport = BitBeats.MemoryTransport()
+    session = BitBeats.BitBeats(clock=BitBeats.VirtualClock(), transport=transport)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for line in COMMAND_MIX:
+            session.onecmd(line)
+    msgs = [msg for _, msg in transport.packets]
+    packets = [msg.getBinary() for msg in msgs]
+    packets.append(BitBeats._bundle(msgs[2:6]).getBinary())
+    counts = [len(list(bb_receiver.decode_packet(packet))) for packet in packets]
+    return packets, counts
+
+def probe_packet():
+    """Returns a '/probe' message carrying the current time.monotonic()"""
+    msg = OSC.OSCMessage("/probe")
+    msg.append(time.monotonic(), typehint="d")
+    return msg.getBinary()
+
+class _Counter:
+    """Messages and probe latencies seen by a receiver, shared by its threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.messages = 0
+        self.latency = BitBeats.LatencyHistogram()
+
+    def message(self):
+        with self.lock:
+            self.messages += 1
+
+    def probe(self, sent):
+        latency = max(time.monotonic() - sent, 0.0)
+        with self.lock:
+            self.messages += 1
+            self.latency.add(latency)
+
+    def snapshot(self):
+        with self.lock:
+            result = (self.messages, self.latency)
+            self.reset()
+        return result
+
+class _StandInAdapter:
+    """Routes probes to a _Counter and everything else to a StandInReceiver"""
+
+    def __init__(self, counter):
+        self.counter = counter
+        self.receiver = bb_receiver.StandInReceiver()
+
+    def handle_packet(self, data, timestamp):
+        if data.startswith(b"/probe\0"):
+            for _, args in bb_receiver.decode_packet(data):
+                self.counter.probe(args[0])
+            return
+        before = len(self.receiver.arrivals)
+        self.receiver.handle_packet(data, timestamp)
+        with self.counter.lock:
+            self.counter.messages += len(self.receiver.arrivals) - before
+
+def _receiver_main(mode, conn):
+    counter = _Counter()
+    if mode == "standin":
+        server = bb_receiver.UDPReceiver(_StandInAdapter(counter), port=0)
+        server.start()
+        port = server.address[1]
+    else:
+        server = (OSC.ThreadingOSCServer if mode == "threading" else OSC.OSCServer)(("127.0.0.1", 0))
+        server.addMsgHandler("default", lambda addr, tags, data, client: counter.message())
+        server.addMsgHandler("/probe", lambda addr, tags, data, client: counter.probe(data[0]))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.address()[1]
+    conn.send(port)
+    while conn.recv() == "snapshot":
+        messages, latency = counter.snapshot()
+        conn.send((messages, latency.counts, latency.max))
+
+def _session(port, packets, counts, rate, duration, probe_every, results, index):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    target = ("127.0.0.1", port)
+    interval = 1.0 / rate
+    start = time.monotonic()
+    end = start + duration
+    sent = messages = 0
+    while True:
+        deadline = start + sent * interval
+        if deadline >= end:
+            break
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            if sent % probe_every == 0:
+                sock.sendto(probe_packet(), target)
+                messages += 1
+            else:
+                k = sent % len(packets)
+                sock.sendto(packets[k], target)
+                messages += counts[k]
+        except OSError:
+            pass
+        sent += 1
+    sock.close()
+    results[index] = (sent, messages)
+
+def run_step(port, conn, sessions, rate, duration, probe_every=50, drain=0.3):
+    """Sends rate packets per second in total from the given number of
+    sessions for duration seconds and returns the measured step"""
+    packets, counts = command_mix_packets()
+    results = [None] * sessions
+    queue = []
+    sampling = True
+
+    def sample_queue():
+        while sampling:
+            depth = bb_metrics.udp_queue_depth(port)
+            if depth is not None:
+                queue.append(depth)
+            time.sleep(0.05)
+
+    sampler = threading.Thread(target=sample_queue, daemon=True)
+    sampler.start()
+    threads = [threading.Thread(target=_session, args=(port, packets, counts, rate / sessions, duration, probe_every, results, i))
+               for i in range(sessions)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    time.sleep(drain)
+    sampling = False
+    sampler.join()
+
+    conn.send("snapshot")
+    received, latency_counts, latency_max = conn.recv()
+    latency = BitBeats.LatencyHistogram()
+    latency.counts, latency.count, latency.max = latency_counts, sum(latency_counts), latency_max
+    sent_packets = sum(result[0] for result in results)
+    sent_messages = sum(result[1] for result in results)
+    return {
+        "rate": rate,
+        "achieved_rate": sent_packets / elapsed,
+        "packets": sent_packets,
+        "messages": sent_messages,
+        "received": received,
+        "loss": 1 - received / sent_messages if sent_messages else 0.0,
+        "queue_max": max(queue) if queue else None,
+        "latency_p50": latency.percentile(50) if latency.count else None,
+        "latency_p99": latency.percentile(99) if latency.count else None,
+        "latency_max": latency.max if latency.count else None,
+    }
+
+def find_saturation(mode, sessions=4, start_rate=1000, factor=1.5, max_rate=200000, duration=2.0,
+                    max_loss=0.01, max_latency=0.01, max_queue=65536, log=print):
+    """Ramps the rate against one receiver mode until a threshold is passed
+
+    Returns a dict with all steps and the highest rate that passed, with
+    the reason the next step failed.
+    """
+    conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_receiver_main, args=(mode, child_conn), daemon=True)
+    process.start()
+    port = conn.recv()
+    steps = []
+    saturation = None
+    reason = "max rate reached"
+    rate = start_rate
+    try:
+        while rate <= max_rate:
+            step = run_step(port, conn, sessions, rate, duration)
+            steps.append(step)
+            log(f"{mode:10} {rate:9.0f}/s sent {step['achieved_rate']:9.0f}/s loss {step['loss'] * 100:6.2f}% "
+                f"queue {step['queue_max'] if step['queue_max'] is not None else '-':>8} "
+                f"p99 {step['latency_p99'] * 1000 if step['latency_p99'] is not None else float('nan'):8.3f} ms")
+            failures = []
+            if step["loss"] > max_loss:
+                failures.append(f"loss {step['loss'] * 100:.2f}%")
+            if step["latency_p99"] is not None and step["latency_p99"] > max_latency:
+                failures.append(f"p99 latency {step['latency_p99'] * 1000:.1f} ms")
+            if step["queue_max"] is not None and step["queue_max"] > max_queue:
+                failures.append(f"receive queue {step['queue_max']} bytes")
+            if step["achieved_rate"] < 0.9 * rate:
+                failures.append("the senders could not reach the rate")
+            if failures:
+                reason = ", ".join(failures)
+                break
+            saturation = rate
+            rate *= factor
+    finally:
+        conn.send("stop")
+        process.join(1)
+        if process.is_alive():
+            process.terminate()
+    return {"mode": mode, "sessions": sessions, "saturation_rate": saturation, "reason": reason, "steps": steps}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ramps OSC traffic against local receivers until they saturate")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated receiver modes (default: {','.join(MODES)})")
+    parser.add_argument("--sessions", type=int, default=4, help="simulated sessions sending in parallel")
+    parser.add_argument("--start-rate", type=float, default=1000, help="first total rate in packets per second")
+    parser.add_argument("--factor", type=float, default=1.5, help="rate increase per step")
+    parser.add_argument("--max-rate", type=float, default=200000)
+    parser.add_argument("--step", type=float, default=2.0, help="seconds per step")
+    parser.add_argument("--max-loss", type=float, default=0.01, help="highest accepted fraction of lost messages")
+    parser.add_argument("--max-latency", type=float, default=0.01, help="highest accepted p99 latency in seconds")
+    parser.add_argument("--max-queue", type=int, default=65536, help="highest accepted receive queue in bytes")
+    parser.add_argument("--report", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    modes = args.modes.split(",")
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"unknown mode '{mode}', available: {', '.join(MODES)}")
+    results = []
+    for mode in modes:
+        results.append(find_saturation(mode, args.sessions, args.start_rate, args.factor, args.max_rate, args.step,
+                                       args.max_loss, args.max_latency, args.max_queue))
+    print()
+    for result in results:
+        rate = f"{result['saturation_rate']:.0f} packets/s" if result["saturation_rate"] else "below the start rate"
+        print(f"{result['mode']:10} saturates at {rate} ({result['reason']})")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"sessions": args.sessions, "results": results}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+# Copyright (C) 2024 Hannes PESCOLLER, Eugen-Maximilian STANGL
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""Exports BitBeats session metrics in the Prometheus text format
+
+A MetricsExporter runs in a background thread. Every few seconds it reads
+the counters of a BitBeats SessionStats and the OSC send hook, and
+writes them to a text file, serves them on a local HTTP port and/or sends
+them as one OSC message to a '/stats' address. The sending threads never
+take a lock: every thread counts into its own dict, and only the exporter
+thread sums them up.
+"""
+
+import http.server
+import os
+import socket
+import threading
+import time
+
+import OSC
+
+class ThreadCounters:
+    """Counters that each thread updates in its own dict, summed on read"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._all = []
+
+    def add(self, key, value=1):
+        counters = getattr(self._local, "counters", None)
+        if counters is None:
+            counters = self._local.counters = {}
+            self._all.append(counters)
+        counters[key] = counters.get(key, 0) + value
+
+    def totals(self):
+        """Returns the sum of all threads' counters"""
+        totals = {}
+        for counters in list(self._all):
+            for key, value in list(counters.items()):
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+def udp_queue_depth(port):
+    """Returns the bytes waiting in the receive queue of the local UDP
+    socket bound to the given port, or None where /proc is not available"""
+    for table in ("/proc/net/udp", "/proc/net/udp6"):
+        try:
+            with open(table) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if int(fields[1].rsplit(":", 1)[1], 16) == port:
+                        return int(fields[4].split(":")[1], 16)
+        except (OSError, IndexError, ValueError):
+            continue
+    return None
+
+class MetricsExporter:
+    """Periodically exports the metrics of a BitBeats session
+
+    - path: Prometheus text file, rewritten atomically on every interval
+    - serve(port): serves the latest metrics at http://127.0.0.1:port/metrics
+    - osc_target: (host, port) receiving an OSC message on '/stats' with
+      messages sent, bytes per second, send errors, late bars and the 99th
+      percentile bar lateness in seconds
+    - queue_port: local UDP port whose receive queue depth is reported,
+      such as the port of a BitBeats.pd (or OSC server) on this machine
+    """
+
+    def __init__(self, stats, interval=5.0, path=None, osc_target=None, queue_port=None):
+        self.stats = stats
+        self.interval = interval
+        self.path = path
+        self.osc_target = osc_target
+        self.queue_port = queue_port
+        self.text = ""
+        self.counters = ThreadCounters()
+        self._running = False
+        self._httpd = None
+        self._client = None
+        self._last = (time.monotonic(), 0)
+        # set while the exporter sends its own '/stats' message, which is not counted
+        self._exporting = threading.local()
+
+    def _on_send(self, event, address, size, duration):
+        if getattr(self._exporting, "active", False):
+            return
+        self.counters.add(event)
+        self.counters.add(event + "_bytes", size)
+
+    def start(self):
+        """Registers the OSC send hook and starts the export thread"""
+        OSC.addHook("send", self._on_send)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Exports a last time, then stops and unregisters the OSC send hook"""
+        self._running = False
+        self._thread.join()
+        self.export()
+        OSC.delHook("send", self._on_send)
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        if self._client:
+            self._client.close()
+            self._client = None
+
+    def serve(self, port):
+        """Serves the metrics on a local HTTP port"""
+        exporter = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = exporter.text.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def _run(self):
+        while self._running:
+            try:
+                self.export()
+            except Exception as e:
+                print(f"ERROR: metrics export failed: {type(e).__name__}: {e}")
+            deadline = time.monotonic() + self.interval
+            while self._running and time.monotonic() < deadline:
+                time.sleep(min(0.1, self.interval))
+
+    def collect(self):
+        """Returns the current metrics as a dict"""
+        totals = self.counters.totals()
+        now = time.monotonic()
+        sent_bytes = totals.get("send_bytes", 0)
+        last_time, last_bytes = self._last
+        self._last = (now, sent_bytes)
+        # the sending threads update the stats under their lock
+        stats = self.stats
+        with stats.lock:
+            lateness = stats.histograms.get("lateness")
+            metrics = {
+                "addresses": dict(stats.addresses),
+                "messages": stats.messages,
+                "bytes": sent_bytes,
+                "bytes_per_second": (sent_bytes - last_bytes) / (now - last_time) if now > last_time else 0.0,
+                "send_errors": stats.send_errors,
+                "late_bars": stats.late_bars,
+                "lateness": {p: lateness.percentile(p) for p in (50, 99)} if lateness else {},
+                "lateness_sum": lateness.sum if lateness else 0.0,
+                "lateness_count": lateness.count if lateness else 0,
+                "lateness_max": lateness.max if lateness else 0.0,
+                "queue_bytes": None,
+            }
+        if self.queue_port is not None:
+            metrics["queue_bytes"] = udp_queue_depth(self.queue_port)
+        return metrics
+
+    def export(self):
+        """Collects the metrics once and writes them to all outputs"""
+        metrics = self.collect()
+        self.text = format_prometheus(metrics)
+        if self.path:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.text)
+            os.replace(tmp_path, self.path)
+        if self.osc_target:
+            if self._client is None:
+                self._client = OSC.OSCClient()
+            msg = OSC.OSCMessage("/stats", [
+                metrics["messages"],
+                float(metrics["bytes_per_second"]),
+                metrics["send_errors"],
+                metrics["late_bars"],
+                float(metrics["lateness"].get(99, 0.0)),
+            ])
+            self._exporting.active = True
+            try:
+                self._client.sendto(msg, self.osc_target)
+            except (OSC.OSCClientError, socket.error):
+                pass
+            finally:
+                self._exporting.active = False
+
+def format_prometheus(metrics):
+    """Formats a metrics dict in the Prometheus text exposition format"""
+    lines = [
+        "# HELP bitbeats_messages_sent_total OSC messages sent per OSC address.",
+        "# TYPE bitbeats_messages_sent_total counter",
+    ]
+    for address, count in sorted(metrics["addresses"].items()):
+        lines.append(f'bitbeats_messages_sent_total{{address="{address}"}} {count}')
+    lines += [
+        "# HELP bitbeats_bytes_sent_total OSC bytes sent over the network.",
+        "# TYPE bitbeats_bytes_sent_total counter",
+        f"bitbeats_bytes_sent_total {metrics['bytes']}",
+        "# HELP bitbeats_bytes_per_second OSC bytes sent per second since the last export.",
+        "# TYPE bitbeats_bytes_per_second gauge",
+        f"bitbeats_bytes_per_second {metrics['bytes_per_second']:.3f}",
+        "# HELP bitbeats_send_errors_total Failed OSC sends.",
+        "# TYPE bitbeats_send_errors_total counter",
+        f"bitbeats_send_errors_total {metrics['send_errors']}",
+        "# HELP bitbeats_late_bars_total Bars that started later than the lateness threshold.",
+        "# TYPE bitbeats_late_bars_total counter",
+        f"bitbeats_late_bars_total {metrics['late_bars']}",
+        "# HELP bitbeats_bar_lateness_seconds Lateness of bar deadlines.",
+        "# TYPE bitbeats_bar_lateness_seconds summary",
+    ]
+    for p, value in sorted(metrics["lateness"].items()):
+        lines.append(f'bitbeats_bar_lateness_seconds{{quantile="{p / 100:g}"}} {value:.6f}')
+    lines += [
+        f"bitbeats_bar_lateness_seconds_sum {metrics['lateness_sum']:.6f}",
+        f"bitbeats_bar_lateness_seconds_count {metrics['lateness_count']}",
+        "# HELP bitbeats_bar_lateness_max_seconds Largest lateness of a bar deadline.",
+        "# TYPE bitbeats_bar_lateness_max_seconds gauge",
+        f"bitbeats_bar_lateness_max_seconds {metrics['lateness_max']:.6f}",
+    ]
+    if metrics["queue_bytes"] is not None:
+        lines += [
+            "# HELP bitbeats_receive_queue_bytes Bytes waiting in the receive queue of the local OSC receiver.",
+            "# TYPE bitbeats_receive_queue_bytes gauge",
+            f"bitbeats_receive_queue_bytes {metrics['queue_bytes']}",
+        ]
+    return "\n".join(lines) + "\n"
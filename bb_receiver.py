@@ -0,0 +1,314 @@
+# Copyright (C) 2024 Hannes PESCOLLER, Eugen-Maximilian STANGL
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""Headless stand-in for BitBeats.pd, for load and regression tests
+
+The receiver implements the OSC surface of the patch: the 'values' and
+'values_eff' messages of /triangle, /square1, /square2 and /noise, and
+/tempo, /start, /stop and /master_vol. It keeps the channel arrays and the
+sequencer state in memory, and records the arrival time of every message
+and how far it landed from the nearest bar boundary of the sequencer.
+
+Example: python bb_receiver.py --port 9999 --report receiver.json
+"""
+
+import argparse
+import array
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+
+import BitBeats
+
+TONE_CHANNELS = ("/triangle", "/square1", "/square2")
+ADDRESSES = TONE_CHANNELS + ("/noise", "/tempo", "/start", "/stop", "/master_vol")
+
+_int = struct.Struct(">i")
+_float = struct.Struct(">f")
+_double = struct.Struct(">d")
+
+def _read_string(data, offset):
+    end = data.index(b"\0", offset)
+    return data[offset:end].decode(), (end + 4) & ~3
+
+def decode_packet(data, offset=0, end=None):
+    """Yields the (address, arguments) of every message in a raw OSC packet
+
+    A faster, flattening replacement for OSC.decodeOSC that supports the
+    'i', 'f', 's', 'd' and 'b' types BitBeats sends.
+    """
+    end = len(data) if end is None else end
+    if data.startswith(b"#bundle\0", offset):
+        offset += 16
+        while offset < end:
+            size = _int.unpack_from(data, offset)[0]
+            yield from decode_packet(data, offset + 4, offset + 4 + size)
+            offset += 4 + size
+        return
+    address, offset = _read_string(data, offset)
+    typetags, offset = _read_string(data, offset)
+    args = []
+    for tag in typetags[1:]:
+        if tag == "s":
+            value, offset = _read_string(data, offset)
+        elif tag == "f":
+            value = _float.unpack_from(data, offset)[0]
+            offset += 4
+        elif tag == "i":
+            value = _int.unpack_from(data, offset)[0]
+            offset += 4
+        elif tag == "d":
+            value = _double.unpack_from(data, offset)[0]
+            offset += 8
+        elif tag == "b":
+            size = _int.unpack_from(data, offset)[0]
+            value = data[offset + 4:offset + 4 + size]
+            offset += (size + 7) & ~3
+        else:
+            raise ValueError(f"unsupported type tag '{tag}'")
+        args.append(value)
+    if offset > end:
+        raise ValueError("truncated message")
+    yield address, args
+
+class ChannelState:
+    """Arrays and parameters of one channel, as set by 'values' and 'values_eff'
+
+    'params' holds the arguments after the pattern: note, length and duty
+    cycle for tone channels; filter, cut-off and A, D, S, R for noise.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.vol = 0.0
+        self.pattern = [0] * 8
+        self.params = []
+        self.arp_steps = 0
+        self.arp = [0] * 12
+        self.updates = 0
+
+    def as_dict(self):
+        return {"vol": self.vol, "pattern": self.pattern, "params": self.params,
+                "arp_steps": self.arp_steps, "arp": self.arp, "updates": self.updates}
+
+class StandInReceiver:
+    """In-memory model of BitBeats.pd fed with raw OSC packets
+
+    The sequencer plays 8 steps per bar at /tempo steps per minute, so a
+    bar lasts 480 / tempo seconds. Arrival times and bar offsets (seconds
+    after the nearest bar boundary, negative when early) are kept in arrays
+    so that millions of messages can be recorded.
+    """
+
+    def __init__(self):
+        self.channels = {name: ChannelState(name) for name in TONE_CHANNELS + ("/noise",)}
+        self.tempo = 120.0
+        self.running = False
+        self.master_vol = 1.0
+        self.arrivals = array.array("d")
+        self.address_codes = array.array("B")
+        self.bar_offsets = array.array("d")
+        self.counts = dict.fromkeys(ADDRESSES, 0)
+        self.packets = 0
+        self.errors = 0
+        self.error_messages = []
+        self._origin = 0.0
+        self._origin_bars = 0.0
+
+    @property
+    def bar_duration(self):
+        return 480.0 / self.tempo
+
+    def bars_at(self, timestamp):
+        """Returns the sequencer position in bars at the given time"""
+        return self._origin_bars + (timestamp - self._origin) / self.bar_duration
+
+    def handle_packet(self, data, timestamp):
+        """Decodes a raw OSC packet that arrived at the given time.monotonic() time"""
+        self.packets += 1
+        try:
+            for address, args in decode_packet(data):
+                self._handle_message(address, args, timestamp)
+        except (struct.error, UnicodeDecodeError, ValueError, IndexError, TypeError) as e:
+            self._error(f"{type(e).__name__}: {e}")
+
+    def _error(self, message):
+        self.errors += 1
+        if len(self.error_messages) < 100:
+            self.error_messages.append(message)
+
+    def _handle_message(self, address, args, timestamp):
+        if address not in self.counts:
+            self._error(f"unknown address {address}")
+            return
+        self.counts[address] += 1
+        self.arrivals.append(timestamp)
+        self.address_codes.append(ADDRESSES.index(address))
+        if self.running:
+            bars = self.bars_at(timestamp)
+            self.bar_offsets.append((bars - round(bars)) * self.bar_duration)
+
+        if address in self.channels:
+            self._handle_channel(self.channels[address], args)
+        elif address == "/tempo":
+            if args[0] <= 0:
+                raise ValueError("tempo must be positive")
+            if self.running:
+                self._origin_bars = self.bars_at(timestamp)
+                self._origin = timestamp
+            self.tempo = float(args[0])
+        elif address == "/start":
+            if not self.running:
+                self.running = True
+                self._origin, self._origin_bars = timestamp, 0.0
+        elif address == "/stop":
+            self.running = False
+        else:
+            self.master_vol = float(args[0])
+
+    def _handle_channel(self, channel, args):
+        selector, args = args[0], args[1:]
+        if selector == "values":
+            expected = 8 if channel.name == "/noise" else 5
+            if len(args) != expected:
+                raise ValueError(f"{channel.name} values needs {expected} arguments, got {len(args)}")
+            # like [array set], extra steps are dropped and missing ones kept
+            pattern = [int(bit) for bit in args[1].split()[:8]]
+            pattern += channel.pattern[len(pattern):]
+            channel.vol = float(args[0])
+            channel.pattern = pattern
+            channel.params = args[2:]
+        elif selector == "values_eff" and channel.name != "/noise":
+            if len(args) != 2:
+                raise ValueError(f"{channel.name} values_eff needs 2 arguments, got {len(args)}")
+            arp = [int(step) for step in args[1].split()[:12]]
+            arp += channel.arp[len(arp):]
+            channel.arp_steps = int(args[0])
+            channel.arp = arp
+        else:
+            raise ValueError(f"unknown selector {channel.name} {selector}")
+        channel.updates += 1
+
+    def summary(self):
+        """Returns the counters, bar alignment and state as a JSON-compatible dict"""
+        offsets = BitBeats.LatencyHistogram()
+        for offset in self.bar_offsets:
+            offsets.add(abs(offset))
+        elapsed = self.arrivals[-1] - self.arrivals[0] if len(self.arrivals) > 1 else 0.0
+        return {
+            "packets": self.packets,
+            "messages": len(self.arrivals),
+            "errors": self.errors,
+            "error_messages": self.error_messages[:10],
+            "messages_per_second": len(self.arrivals) / elapsed if elapsed > 0 else None,
+            "counts": self.counts,
+            "bar_offset_p50": offsets.percentile(50) if offsets.count else None,
+            "bar_offset_p99": offsets.percentile(99) if offsets.count else None,
+            "bar_offset_max": offsets.max if offsets.count else None,
+            "tempo": self.tempo,
+            "running": self.running,
+            "master_vol": self.master_vol,
+            "channels": {name: channel.as_dict() for name, channel in self.channels.items()},
+        }
+
+class ReceiverTransport:
+    """BitBeats transport delivering packets straight to a StandInReceiver,
+    stamped with the given clock, without going through a socket"""
+
+    def __init__(self, receiver, clock=None):
+        self.receiver = receiver
+        self.clock = clock or BitBeats.RealClock()
+        self._lock = threading.Lock()
+
+    def send(self, msg):
+        binary = msg.getBinary()
+        with self._lock:
+            self.receiver.handle_packet(binary, self.clock.now())
+        return len(binary)
+
+class UDPReceiver:
+    """Feeds a StandInReceiver from a UDP socket in a background thread"""
+
+    def __init__(self, receiver, host="127.0.0.1", port=9999, rcvbuf=1 << 22):
+        self.receiver = receiver
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.socket.bind((host, port))
+        self.socket.settimeout(0.1)
+        self.address = self.socket.getsockname()
+        self._running = False
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+        self.socket.close()
+
+    def _run(self):
+        recv = self.socket.recv
+        handle = self.receiver.handle_packet
+        now = time.monotonic
+        while self._running:
+            try:
+                data = recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            handle(data, now())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless stand-in for BitBeats.pd")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    parser.add_argument("--report", help="write the summary as JSON to this file")
+    args = parser.parse_args(argv)
+
+    receiver = StandInReceiver()
+    try:
+        udp = UDPReceiver(receiver, args.host, args.port)
+    except OSError as e:
+        print(f"ERROR: {e}")
+        return 1
+    udp.start()
+    print(f"Listening on {udp.address[0]}:{udp.address[1]}")
+    try:
+        deadline = time.monotonic() + args.duration if args.duration else None
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    udp.stop()
+
+    summary = receiver.summary()
+    print(f"Packets: {summary['packets']}, messages: {summary['messages']}, errors: {summary['errors']}")
+    if summary["bar_offset_p50"] is not None:
+        print(f"Bar offset: p50 {summary['bar_offset_p50'] * 1000:.3f} ms, p99 {summary['bar_offset_p99'] * 1000:.3f} ms, "
+              f"max {summary['bar_offset_max'] * 1000:.3f} ms")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
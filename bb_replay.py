@@ -0,0 +1,165 @@
+# Copyright (C) 2024 Hannes PESCOLLER, Eugen-Maximilian STANGL
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""Replays an OSC capture file to BitBeats.pd or any other OSC receiver
+
+Packets are sent with their original timing, scaled by a speed factor, or
+as fast as possible. Every deadline is computed from the start of the
+replay, so sleeping late never accumulates into drift. Address filters use
+the OSCMultiClient filter syntax, e.g. '+/square1 +/square2' or '-/noise'.
+
+Example: python bb_replay.py show.osccap --speed 2 --filter=-/noise
+"""
+
+import argparse
+import functools
+import socket
+import sys
+
+import BitBeats
+import OSC
+
+def message_from_decoded(decoded):
+    """Rebuilds an OSCMessage or OSCBundle from the output of OSC.decodeOSC"""
+    if decoded[0] == "#bundle":
+        bundle = OSC.OSCBundle(time=decoded[1])
+        for item in decoded[2:]:
+            bundle.append(message_from_decoded(item))
+        return bundle
+    msg = OSC.OSCMessage(decoded[0])
+    for typetag, value in zip(decoded[1][1:], decoded[2:]):
+        msg.append(value, typehint=typetag)
+    return msg
+
+@functools.lru_cache(maxsize=64)
+def resolve_destination(text):
+    """Returns 'host:port' with the host resolved to its IP address, so that
+    'localhost:9999' and '127.0.0.1:9999' compare equal"""
+    if not text:
+        return text
+    host, _, port = text.rpartition(":")
+    try:
+        return f"{socket.gethostbyname(host or 'localhost')}:{int(port)}"
+    except (OSError, ValueError):
+        return text
+
+def make_sender(target, filters=None):
+    """Returns a function sending a raw packet to target, a (host, port) tuple
+
+    Without filters the packets are sent unchanged. With filters (a list of
+    '+/address' and '-/address' strings, optionally starting with a prefix)
+    every packet is decoded and sent through an OSCMultiClient.
+    """
+    if not filters:
+        sock = socket.socket(socket.AF_INET6 if ":" in target[0] else socket.AF_INET, socket.SOCK_DGRAM)
+        return lambda packet: sock.sendto(packet, target)
+    prefix, filter_dict = OSC.parseFilterStr(filters)
+    client = OSC.OSCMultiClient()
+    client.setOSCTarget(target, prefix, filter_dict)
+    return lambda packet: client.send(message_from_decoded(OSC.decodeOSC(packet)))
+
+def replay(reader, send, speed=1.0, start=0.0, end=None, clock=None, destination=None):
+    """Sends the packets of an OSCCaptureReader between start and end seconds
+
+    speed scales the original timing (2.0 plays twice as fast); None sends
+    as fast as possible. With destination ('host:port'), only the packets
+    captured on their way to that target are sent. Returns a report dict
+    comparing the achieved with the intended timing.
+    """
+    clock = clock or BitBeats.RealClock()
+    lateness = BitBeats.LatencyHistogram()
+    packets = errors = size = 0
+    origin = first = last = None
+    if destination is not None:
+        destination = resolve_destination(destination)
+    for timestamp, sent_to, packet in reader.records(start, end):
+        if destination is not None and resolve_destination(sent_to) != destination:
+            continue
+        if origin is None:
+            origin, first = clock.now(), timestamp
+        last = timestamp
+        if speed:
+            deadline = origin + (timestamp - first) / speed
+            clock.sleep_until(deadline)
+            lateness.add(max(clock.now() - deadline, 0.0))
+        try:
+            send(packet)
+        except (OSC.OSCClientError, OSError):
+            errors += 1
+        packets += 1
+        size += len(packet)
+    achieved = clock.now() - origin if origin is not None else 0.0
+    intended = (last - first) / speed if origin is not None and speed else 0.0
+    return {
+        "packets": packets,
+        "bytes": size,
+        "errors": errors,
+        "speed": speed,
+        "captured_seconds": last - first if origin is not None else 0.0,
+        "intended_seconds": intended,
+        "achieved_seconds": achieved,
+        "drift_seconds": achieved - intended if speed else None,
+        "packets_per_second": packets / achieved if achieved > 0 else None,
+        "lateness_p50": lateness.percentile(50) if lateness.count else None,
+        "lateness_p99": lateness.percentile(99) if lateness.count else None,
+        "lateness_max": lateness.max if lateness.count else None,
+    }
+
+def print_report(report):
+    """Prints a replay report"""
+    print(f"Packets: {report['packets']} ({report['bytes']} bytes, {report['errors']} send errors)")
+    if report["speed"]:
+        print(f"Intended: {report['intended_seconds']:.3f} s at {report['speed']:g}x, "
+              f"achieved: {report['achieved_seconds']:.3f} s (drift {report['drift_seconds'] * 1000:+.2f} ms)")
+        print(f"Lateness: p50 {report['lateness_p50'] * 1000:.3f} ms, p99 {report['lateness_p99'] * 1000:.3f} ms, "
+              f"max {report['lateness_max'] * 1000:.3f} ms" if report["packets"] else "Lateness: -")
+    else:
+        print(f"Captured: {report['captured_seconds']:.3f} s, replayed in {report['achieved_seconds']:.3f} s")
+    if report["packets_per_second"]:
+        print(f"Rate: {report['packets_per_second']:.0f} packets/s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replays an OSC capture file")
+    parser.add_argument("capture", help="capture file written by the 'capture' command")
+    parser.add_argument("--target", default="localhost:9999", help="receiver as host:port (default: localhost:9999)")
+    timing = parser.add_mutually_exclusive_group()
+    timing.add_argument("--speed", type=float, default=1.0, help="time-scale factor (default: 1)")
+    timing.add_argument("--max-speed", action="store_true", help="send as fast as possible")
+    parser.add_argument("--start", type=float, default=0.0, help="start time in seconds")
+    parser.add_argument("--end", type=float, default=None, help="end time in seconds")
+    parser.add_argument("--filter", action="append", default=[], help="address filter, e.g. '+/square1' or '-/noise'")
+    parser.add_argument("--destination", default=None, help="only replay packets captured for this host:port")
+    args = parser.parse_args(argv)
+
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+    host, _, port = args.target.rpartition(":")
+    try:
+        reader = OSC.OSCCaptureReader(args.capture)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}")
+        return 1
+    send = make_sender((host or "localhost", int(port)), args.filter)
+    try:
+        report = replay(reader, send, None if args.max_speed else args.speed, args.start, args.end,
+                        destination=args.destination)
+    except KeyboardInterrupt:
+        print("KeyboardInterrupt: Stopping the replay.")
+        return 1
+    print_report(report)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
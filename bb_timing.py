@@ -0,0 +1,160 @@
+# Copyright (C) 2024 Hannes PESCOLLER, Eugen-Maximilian STANGL
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""End-to-end timing benchmark of scripted playback
+
+Reference scripts of a given length and tempo are played in real time
+through do_run_script to a bb_receiver stand-in running in its own process,
+which timestamps every arrival. For every bar the onset error is the
+arrival time of its packet minus the time the bar should have started. From
+these the benchmark reports the error percentiles, the cumulative drift
+(the fitted error at the end minus the one at the start) and the jitter
+(the standard deviation of the bar-to-bar change of the error).
+
+The full default matrix plays for several hours; use e.g.
+'--minutes 1 --tempos 60,300' for a quick run.
+
+Example: python bb_timing.py --minutes 1,10 --tempos 60,120,300 --report timing.json
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import BitBeats
+import bb_receiver
+
+class _RecordingClock(BitBeats.RealClock):
+    """Real clock remembering every deadline it was asked to sleep until"""
+
+    def __init__(self):
+        self.deadlines = []
+
+    def sleep_until(self, deadline):
+        self.deadlines.append(deadline)
+        super().sleep_until(deadline)
+
+def reference_script(path, tempo, minutes):
+    """Writes a script playing one square1 bar after the other for about
+    the given number of minutes and returns the number of bars"""
+    bars = max(1, round(minutes * tempo / 4))
+    with open(path, "w") as f:
+        f.write(f"tempo {tempo:g}\nstart\nrepeat {bars} {{\nplay square1 0.7 01010101 e3 1 0.2\nwait 1\n}}\n")
+    return bars
+
+def _receiver_main(conn):
+    receiver = bb_receiver.StandInReceiver()
+    udp = bb_receiver.UDPReceiver(receiver, port=0)
+    udp.start()
+    conn.send(udp.address[1])
+    conn.recv()
+    udp.stop()
+    square1 = bb_receiver.ADDRESSES.index("/square1")
+    conn.send([t for t, code in zip(receiver.arrivals, receiver.address_codes) if code == square1])
+
+def analyse(errors):
+    """Returns onset error statistics for a list of per-bar errors in seconds"""
+    n = len(errors)
+    ordered = sorted(abs(e) for e in errors)
+    mean = sum(errors) / n
+    # least-squares line through the errors, evaluated at the first and last bar
+    mean_k = (n - 1) / 2
+    variance_k = sum((k - mean_k) ** 2 for k in range(n))
+    slope = sum((k - mean_k) * (e - mean) for k, e in enumerate(errors)) / variance_k if variance_k else 0.0
+    steps = [b - a for a, b in zip(errors, errors[1:])]
+    step_mean = sum(steps) / len(steps) if steps else 0.0
+    return {
+        "bars": n,
+        "mean_error": mean,
+        "p50_abs_error": ordered[n // 2],
+        "p99_abs_error": ordered[min(n - 1, math.ceil(0.99 * n) - 1)],
+        "max_abs_error": ordered[-1],
+        "drift": slope * (n - 1),
+        "jitter": math.sqrt(sum((s - step_mean) ** 2 for s in steps) / len(steps)) if steps else 0.0,
+    }
+
+def run_benchmark(tempo, minutes, directory):
+    """Plays one reference script in real time and returns its statistics"""
+    path = os.path.join(directory, f"reference_{tempo:g}bpm_{minutes:g}min.txt")
+    bars = reference_script(path, tempo, minutes)
+    conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_receiver_main, args=(child_conn,), daemon=True)
+    process.start()
+    port = conn.recv()
+
+    clock = _RecordingClock()
+    session = BitBeats.BitBeats(clock=clock, transport=BitBeats.OSCTransport("127.0.0.1", port))
+    session.onecmd(f"run_script {path}")
+    time.sleep(0.2)
+    conn.send("stop")
+    arrivals = conn.recv()
+    process.join()
+
+    bar_duration = 240 / tempo
+    origin = clock.deadlines[0] - bar_duration
+    onsets = arrivals[-bars:]
+    if len(onsets) < bars:
+        raise RuntimeError(f"only {len(onsets)} of {bars} bars arrived")
+    result = analyse([t - (origin + k * bar_duration) for k, t in enumerate(onsets)])
+    result.update({"tempo": tempo, "minutes": minutes, "late_bars": session.stats.late_bars})
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures bar onset error, drift and jitter of scripted playback")
+    parser.add_argument("--minutes", default="1,10,60", help="comma-separated script lengths (default: 1,10,60)")
+    parser.add_argument("--tempos", default="60,120,180,240,300", help="comma-separated tempos in BPM (default: 60,120,180,240,300)")
+    parser.add_argument("--report", default="bitbeats_timing.json", help="JSON report (default: bitbeats_timing.json)")
+    args = parser.parse_args(argv)
+
+    try:
+        minutes = [float(m) for m in args.minutes.split(",")]
+        tempos = [float(t) for t in args.tempos.split(",")]
+    except ValueError:
+        parser.error("--minutes and --tempos take comma-separated numbers")
+
+    results = []
+    print(f"{'tempo':>6} {'min':>5} {'bars':>6} {'mean ms':>9} {'p99 ms':>9} {'max ms':>9} {'drift ms':>9} {'jitter ms':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            for length in minutes:
+                for tempo in tempos:
+                    result = run_benchmark(tempo, length, directory)
+                    results.append(result)
+                    print(f"{tempo:6g} {length:5g} {result['bars']:6} {result['mean_error'] * 1000:9.3f} "
+                          f"{result['p99_abs_error'] * 1000:9.3f} {result['max_abs_error'] * 1000:9.3f} "
+                          f"{result['drift'] * 1000:9.3f} {result['jitter'] * 1000:9.3f}")
+        except KeyboardInterrupt:
+            print("KeyboardInterrupt: Stopping the benchmark.")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.report}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+import pytest
+
+import BitBeats
+import OSC
+
+@pytest.fixture
+def engine():
+    clock = BitBeats.VirtualClock()
+    engine = BitBeats.Engine(clock=clock, transport=BitBeats.MemoryTransport(clock))
+    engine.set_tempo(120)
+    return engine
+
+def square1_values(engine):
+    """Returns the (time, args) of every 'values' message sent to /square1"""
+    return [(stamp, m.values()) for stamp, msg in engine.transport.packets
+            for m in (msg.values() if isinstance(msg, OSC.OSCBundle) else [msg])
+            if m.address == "/square1" and m.values()[0] == "values"]
+
+def test_first_point_at_the_playing_value_is_not_sent_again(engine):
+    engine.play("square1", 0.5, [1], 52, 1, 0.25)
+    lane = engine.automate("square1", "vol", 0.5, 1.0, 1)
+    engine.advance(1)
+    sent = square1_values(engine)
+    assert sent[0] == (0.0, ["values", 0.5, "1 0 0 0 0 0 0 0", 52, 1, 0.25])
+    assert [stamp for stamp, _ in sent[1:]] == sorted(stamp for stamp, _ in sent[1:])
+    assert all(stamp > 0 for stamp, _ in sent[1:])
+    assert lane.sent == len(sent) - 1
+
+def test_first_point_is_sent_when_it_differs(engine):
+    engine.play("square1", 0.5, [1], 52, 1, 0.25)
+    engine.automate("square1", "vol", 0.2, 0.2, 1)
+    engine.advance(1)
+    assert [args[1] for _, args in square1_values(engine)] == [0.5, pytest.approx(0.2)]
+
+def test_small_changes_are_dropped_and_only_the_param_changes(engine):
+    engine.play("square1", 0.5, [1], 52, 1, 0.25)
+    lane = engine.automate("square1", "vol", 0.5, 0.51, 2)
+    engine.advance(2)
+    sent = square1_values(engine)[1:]
+    # 0.01 is 2.56 steps of 1/256: at most 3 points of 200 evaluated
+    assert 1 <= lane.sent == len(sent) <= 3
+    assert lane.sent + lane.dropped >= 2 * engine.bar_duration * engine.control_rate
+    assert all(args[2:] == ["1 0 0 0 0 0 0 0", 52, 1, 0.25] for _, args in sent)
+    assert sent[-1][1][1] == pytest.approx(0.51)
+    assert engine.lanes == {}
+
+def test_lanes_of_silent_channels_send_nothing(engine):
+    engine.play("square1", 0.5, [1], 52, 1, 0.25)
+    engine.automate("square1", "vol", 0.5, 1.0, 1)
+    idle = engine.automate("square2", "vol", 0.5, 1.0, 1)
+    engine.pause("square1")
+    engine.advance(1)
+    assert [args[1] for _, args in square1_values(engine)] == [0.5, 0.0]
+    assert idle.sent == 0 and idle.dropped > 0
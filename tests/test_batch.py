@@ -0,0 +1,11 @@
+import bb_batch
+
+def test_engine_hash_covers_every_engine_module(monkeypatch, tmp_path):
+    before = bb_batch.engine_hash()
+    for module in bb_batch.ENGINE_MODULES:
+        copy = tmp_path / module.__name__
+        copy.write_bytes(open(module.__file__, "rb").read() + b"\n")
+        monkeypatch.setattr(module, "__file__", str(copy))
+        assert bb_batch.engine_hash() != before
+        before = bb_batch.engine_hash()
+    assert {module.__name__ for module in bb_batch.ENGINE_MODULES} >= {"BitBeats", "OSC", "OSC_server"}
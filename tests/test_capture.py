@@ -0,0 +1,33 @@
+import OSC
+
+import BitBeats
+
+def test_capture_through_several_targets_records_destinations(tmp_path):
+    capture_file = str(tmp_path / "show.osccap")
+    b = BitBeats.BitBeats()
+    b.onecmd("target add localhost:10000")
+    b.onecmd("coalesce on")
+    b.onecmd(f"capture {capture_file}")
+    b.onecmd("play square1 0.5 1 e3 1 0.2")
+    b.onecmd("capture stop")
+    b.onecmd("coalesce off")
+    b.transport.close()
+
+    reader = OSC.OSCCaptureReader(capture_file)
+    records = list(reader.records())
+    assert sorted(destination for _, destination, _ in records) == ["127.0.0.1:10000", "127.0.0.1:9999"]
+    assert {bytes(packet) for _, _, packet in records} == {bytes(packet) for _, packet in reader.iterate()}
+    reader.close()
+
+def test_version_1_captures_are_read_and_appended(tmp_path):
+    capture_file = str(tmp_path / "old.osccap")
+    with open(capture_file, "wb") as f:
+        f.write(OSC._captureHeader.pack(OSC._captureMagicV1, 100.0, 0.0))
+        f.write(OSC._captureRecordV1.pack(100.5, 4) + b"abcd")
+    writer = OSC.OSCCaptureWriter(capture_file)
+    writer.write(b"efgh", timestamp=101.0, destination=("127.0.0.1", 9999))
+    writer.close()
+
+    reader = OSC.OSCCaptureReader(capture_file)
+    assert [(t, d, bytes(p)) for t, d, p in reader.records()] == [(0.5, None, b"abcd"), (1.0, None, b"efgh")]
+    reader.close()
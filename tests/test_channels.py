@@ -0,0 +1,61 @@
+import pytest
+
+import BitBeats
+import OSC
+
+def make_engine():
+    clock = BitBeats.VirtualClock()
+    return BitBeats.Engine(clock=clock, transport=BitBeats.MemoryTransport(clock))
+
+def messages(packet):
+    return packet.values() if isinstance(packet, OSC.OSCBundle) else [packet]
+
+def test_sixteen_squares_on_two_synths_update_in_one_bundle():
+    engine = make_engine()
+    for i in range(16):
+        engine.add_channel(f"lead{i}", "square", f"/synth{i // 8 + 1}/square{i % 8 + 1}")
+    with engine.batch():
+        for i in range(16):
+            engine.set_values(f"lead{i}", {"vol": 0.5, "pattern": [1, 0], "note": 40 + i, "length": 1, "duty": 0.25})
+    [(_, bundle)] = engine.transport.packets
+    sent = messages(bundle)
+    assert [m.address for m in sent] == [f"/synth{i // 8 + 1}/square{i % 8 + 1}" for i in range(16)]
+    assert [m.values()[3] for m in sent] == list(range(40, 56))
+
+    engine.stop()
+    stop = [m.address for m in messages(engine.transport.packets[-1][1])]
+    assert "/synth2/square8" in stop and stop[-1] == "/stop"
+
+def test_values_are_checked_by_the_type_of_the_channel():
+    engine = make_engine()
+    engine.add_channel("drums", "noise", "/synth2/noise")
+    with pytest.raises(BitBeats.BitBeatsError) as error:
+        engine.set_values("drums", {"vol": 0.5, "pattern": [1], "filter": "bp", "cut_off": 3000,
+                                    "attack": 0, "decay": 0, "sustain": 0, "release": 0})
+    assert error.value.argument == "filter"
+    with pytest.raises(BitBeats.BitBeatsError):
+        engine.set_values("drums", [0.5, [1]])
+    assert engine.transport.packets == []
+
+def test_custom_types_need_no_extra_code():
+    pulse = BitBeats.ChannelType("pulse", [
+        BitBeats.Param("vol", 0, 1, "Volume must be in the range of 0 to 1."),
+        BitBeats.IntParam("note", 0, 127, "Invalid MIDI note: {value}", resolution=1),
+    ], arpeggio=False)
+    engine = make_engine()
+    engine.add_channel("pulse1", pulse)
+    engine.set_values("pulse1", [0.5, 60])
+    engine.pause("pulse1")
+    assert [m.values() for _, m in engine.transport.packets] == [["values", 0.5, 60], ["values", 0.0, 0]]
+
+def test_shell_adds_channels_and_plays_them_together():
+    clock = BitBeats.VirtualClock()
+    b = BitBeats.BitBeats(clock=clock, transport=BitBeats.MemoryTransport(clock))
+    b.onecmd("channel add square3 square /synth2/square1")
+    b.onecmd(b.precmd("play square1 0.7 1 e3 1 0.2, square3 0.5 01 g3 2 0.5"))
+    [(_, bundle)] = [packet for packet in b.transport.packets if isinstance(packet[1], OSC.OSCBundle)]
+    assert [(m.address, m.values()[3]) for m in messages(bundle)] == [("/square1", 52), ("/synth2/square1", 55)]
+    b.onecmd("channel remove square3")
+    [pause] = messages(b.transport.packets[-1][1])
+    assert (pause.address, pause.values()[1]) == ("/synth2/square1", 0.0)
+    assert "square3" not in b.channels
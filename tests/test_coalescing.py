@@ -0,0 +1,95 @@
+import gc
+
+import pytest
+
+import BitBeats
+import OSC
+import bb_receiver
+
+def make_queue(lookahead=0.002):
+    clock = BitBeats.VirtualClock()
+    transport = BitBeats.MemoryTransport(clock)
+    queue = BitBeats.CoalescingTransport(transport, clock, lookahead, thread=False)
+    return queue, transport, clock
+
+def values(vol, note):
+    return OSC.OSCMessage("/square1", ["values", vol, "1 0 0 0 0 0 0 0", note, 1.0, 0.5])
+
+def addresses(msg):
+    return [m.address for m in (msg.values() if isinstance(msg, OSC.OSCBundle) else [msg])]
+
+def start(queue, bpm=120):
+    queue.send(OSC.OSCMessage("/tempo", bpm * 2.0))
+    queue.send(OSC.OSCMessage("/start", 1))
+
+def test_newer_messages_supersede_queued_ones():
+    queue, transport, clock = make_queue()
+    start(queue)
+    assert queue.send(values(0.5, 52)) == BitBeats.QUEUED
+    queue.send(values(0.6, 55))
+    queue.send(OSC.OSCMessage("/master_vol", 0.5))
+    assert len(transport.packets) == 2
+    clock.time = 1.998
+    queue.flush_due()
+    stamp, bundle = transport.packets[-1]
+    assert stamp == 1.998
+    assert [m.values()[3] if m.address == "/square1" else m.address for m in bundle.values()] == [55, "/master_vol"]
+    assert queue.summary() == {"queued": 3, "superseded": 1, "flushes": 1, "pending": 0, "errors": 0}
+
+def test_queue_is_sent_lookahead_before_every_bar():
+    queue, transport, clock = make_queue(lookahead=0.005)
+    start(queue)
+    assert queue.flush_due() == pytest.approx(1.995)
+    queue.send(values(0.5, 52))
+    clock.time = 1.99
+    queue.flush_due()
+    assert len(transport.packets) == 2
+    clock.time = 1.995
+    assert queue.flush_due() == pytest.approx(3.995)
+    assert [stamp for stamp, _ in transport.packets] == [0.0, 0.0, 1.995]
+    # a send after the flush time sends the queue of the bar that began first
+    queue.send(values(0.6, 55))
+    clock.time = 8.0
+    queue.send(values(0.7, 57))
+    stamp, msg = transport.packets[-1]
+    assert (stamp, addresses(msg), msg.values()[3]) == (8.0, ["/square1"], 55)
+    assert queue.flush_due() == pytest.approx(9.995)
+
+def test_start_and_stop_are_not_held_back():
+    queue, transport, clock = make_queue()
+    queue.send(values(0.5, 52))
+    assert addresses(transport.packets[-1][1]) == ["/square1"]
+    start(queue)
+    assert addresses(transport.packets[-1][1]) == ["/start"]
+    queue.send(values(0.6, 55))
+    clock.time = 0.5
+    queue.send(OSC.OSCMessage("/stop", 0))
+    # what is queued goes out first, then the stop, without waiting for the bar
+    assert [(stamp, addresses(msg)) for stamp, msg in transport.packets[-2:]] == [(0.5, ["/square1"]), (0.5, ["/stop"])]
+    assert queue.flush_due() is None
+    queue.send(values(0.7, 57))
+    assert transport.packets[-1][0] == 0.5
+
+def test_engine_counts_the_bundles_when_they_are_sent():
+    clock = BitBeats.VirtualClock()
+    receiver = bb_receiver.StandInReceiver()
+    b = BitBeats.BitBeats(clock=clock, transport=bb_receiver.ReceiverTransport(receiver, clock))
+    for line in ("coalesce on", "tempo 120", "start", "play square1 0.5 1 e3 1 0.2", "play square1 0.6 1 g3 1 0.2"):
+        b.onecmd(line)
+    assert b.stats.messages == 2
+    clock.time = 1.998
+    b.transport.flush_due()
+    assert b.stats.messages == 3
+    assert b.stats.addresses["#bundle"] == 1
+    [(_, _, _, size, text)] = [event for event in b.flight.events() if event[0] == "send" and event[4] == "#bundle"]
+    assert size > 0
+    assert receiver.channels["/square1"].params[0] == 55
+
+def test_thread_ends_with_the_queue():
+    clock = BitBeats.RealClock()
+    queue = BitBeats.CoalescingTransport(BitBeats.MemoryTransport(clock), clock)
+    thread = queue._thread
+    del queue
+    gc.collect()
+    thread.join(2.0)
+    assert not thread.is_alive()
@@ -0,0 +1,94 @@
+import BitBeats
+import OSC
+
+def compile_lines(tmp_path, lines):
+    script = tmp_path / "script.txt"
+    script.write_text("\n".join(lines) + "\n")
+    return BitBeats.compile_script(str(script))
+
+def channel_messages(compiled, address):
+    return [(round(seconds, 6), msg.values()) for seconds, _, _, msgs in compiled.clip.iter_packets()
+            for msg in msgs if msg.address == address]
+
+def test_section_called_again_uses_new_variable_values(tmp_path):
+    compiled = compile_lines(tmp_path, [
+        "tempo 120",
+        "start",
+        "a = square1 0.7 01010101 e3 1 0.2",
+        "section verse {",
+        "  play a",
+        "  wait 1",
+        "}",
+        "a = square1 0.3 01010101 g4 1 0.2",
+        "verse",
+    ])
+    assert compiled.errors == []
+    (first, values1), (second, values2) = channel_messages(compiled, "/square1")
+    assert (first, second) == (0.0, 2.0)
+    assert values1[1:2] + values1[3:4] == [0.699999988079071, 52]
+    assert values2[1:2] + values2[3:4] == [0.30000001192092896, 67]
+
+def test_section_called_again_uses_added_channels(tmp_path):
+    compiled = compile_lines(tmp_path, [
+        "tempo 120",
+        "start",
+        "section verse {",
+        "  pause square3",
+        "  wait 1",
+        "}",
+        "channel add square3 square",
+        "verse",
+    ])
+    assert compiled.errors[0][0] == 4
+    assert len(compiled.errors) == 1
+    assert [seconds for seconds, _ in channel_messages(compiled, "/square3")] == [2.0]
+
+def test_repeat_restores_tempo_set_inside_the_body(tmp_path):
+    compiled = compile_lines(tmp_path, [
+        "tempo 60",
+        "start",
+        "repeat 2 {",
+        "  wait 1",
+        "  tempo 120",
+        "}",
+        "wait 1",
+    ])
+    assert compiled.errors == []
+    # 4 s, then 2 s with tempo 120 (compiled again), then 2 s
+    assert compiled.seconds == 8.0
+
+def make_shell():
+    clock = BitBeats.VirtualClock()
+    return BitBeats.BitBeats(clock=clock, transport=BitBeats.MemoryTransport(clock))
+
+def test_script_starts_from_the_tempo_and_variables_of_the_shell(tmp_path, capsys):
+    script = tmp_path / "song.txt"
+    script.write_text("start\nplay a\nwait 1\n")
+    b = make_shell()
+    b.onecmd(b.precmd("tempo 120"))
+    b.onecmd(b.precmd("a = square1 0.7 1 e3 1 0.2"))
+    b.onecmd(f"run_script {script}")
+    assert "ERROR" not in capsys.readouterr().out
+    played = [stamp for stamp, msg in b.transport.packets
+              if any(m.address == "/square1" and m.values()[:4:3] == ["values", 52] for m in channel_messages_of(msg))]
+    assert played == [0.0]
+    # one bar at 120 BPM, and the tempo of the shell is kept
+    assert b.clock.now() == 2.0
+    assert (b.tempo, b.bar_duration) == (120.0, 2.0)
+
+def test_script_uses_channels_added_in_the_shell(tmp_path, capsys):
+    script = tmp_path / "song.txt"
+    script.write_text("tempo 120\nplay square3 0.5 1 c4 1 0.5\nwait 1\n")
+    b = make_shell()
+    b.onecmd("channel add square3 square /synth2/square1")
+    b.onecmd(f"run_script {script}")
+    assert "ERROR" not in capsys.readouterr().out
+    assert any(m.address == "/synth2/square1" for _, msg in b.transport.packets for m in channel_messages_of(msg))
+
+def test_session_commands_are_rejected_in_scripts(tmp_path):
+    compiled = compile_lines(tmp_path, ["tempo 120", "coalesce on", "target add localhost:10000", "wait 1"])
+    assert [line for line, _ in compiled.errors] == [2, 3]
+    assert "only works in the shell" in compiled.errors[0][1]
+
+def channel_messages_of(msg):
+    return msg.values() if isinstance(msg, OSC.OSCBundle) else [msg]
@@ -0,0 +1,79 @@
+import BitBeats
+import OSC
+import bb_daemon
+
+class FrontEnd:
+    """Transport of a simulated front-end, submitting like a daemon connection"""
+
+    def __init__(self, daemon):
+        self.daemon = daemon
+
+    def send(self, msg):
+        for m in (msg.values() if isinstance(msg, OSC.OSCBundle) else [msg]):
+            self.daemon.submit(m, self)
+        return 0
+
+def make_ensemble():
+    clock = BitBeats.VirtualClock()
+    transport = BitBeats.MemoryTransport(clock)
+    daemon = bb_daemon.SenderDaemon(transport, clock)
+    front_ends = [BitBeats.Engine(clock, FrontEnd(daemon)) for _ in range(2)]
+    return daemon, transport, front_ends
+
+def sent(transport):
+    """Returns the (address, args) pairs of everything the daemon sent"""
+    return [(m.address, m.values()) for _, msg in transport.packets
+            for m in (msg.values() if isinstance(msg, OSC.OSCBundle) else [msg])]
+
+def test_stop_of_one_player_does_not_silence_the_other():
+    daemon, transport, (a, b) = make_ensemble()
+    a.set_tempo(120)
+    a.start()
+    a.play("square1", 0.7, [1, 0, 1, 0], 52, 1)
+    b.start()
+    b.play("square2", 0.5, [1, 1], 55, 1)
+    b.set_effect("square2", 3, [0, 4, 7])
+    daemon._flush()
+    transport.packets.clear()
+
+    b.stop()
+    daemon._flush()
+    messages = sent(transport)
+    assert ("/stop", [0]) not in messages
+    assert not any(address == "/master_vol" for address, _ in messages)
+    # only b's own channel is paused and its arpeggio reset
+    assert {address for address, _ in messages} == {"/square2"}
+    assert daemon.next_bar is not None
+
+    transport.packets.clear()
+    a.stop()
+    daemon._flush()
+    messages = sent(transport)
+    assert ("/stop", [0]) in messages
+    assert ("/master_vol", [0.0]) in messages
+    assert {"/square1", "/triangle", "/noise"} <= {address for address, _ in messages}
+    assert daemon.next_bar is None
+
+def test_script_of_a_second_player_does_not_stop_the_first():
+    daemon, transport, (a, b) = make_ensemble()
+    a.set_tempo(120)
+    a.start()
+    a.play("square1", 0.7, [1, 0, 1, 0], 52, 1)
+    daemon._flush()
+    transport.packets.clear()
+    # run_script starts with a stop, before the script's own 'start'
+    b.stop()
+    b.play("square2", 0.5, [1, 1], 55, 1)
+    daemon._flush()
+    assert [address for address, _ in sent(transport)] == ["/square2"]
+
+def test_a_single_player_stops_everything():
+    daemon, transport, (a, _) = make_ensemble()
+    a.set_tempo(120)
+    a.start()
+    a.play("square1", 0.7, [1], 52, 1)
+    a.stop()
+    daemon._flush()
+    messages = sent(transport)
+    assert ("/master_vol", [0.0]) in messages and ("/stop", [0]) in messages
+    assert daemon.ignored == 0
@@ -0,0 +1,47 @@
+import time
+
+import BitBeats
+import OSC
+
+def run(tmp_path, text):
+    script = tmp_path / "song.txt"
+    script.write_text(text)
+    clock = BitBeats.VirtualClock()
+    transport = BitBeats.MemoryTransport(clock)
+    b = BitBeats.BitBeats(clock=clock, transport=transport)
+    b.onecmd(f"run_script {script}")
+    return b, transport.packets
+
+def addresses(msg):
+    msgs = msg.values() if isinstance(msg, OSC.OSCBundle) else [msg]
+    return [m.address for m in msgs]
+
+def test_script_runs_on_the_virtual_clock_without_waiting(tmp_path):
+    started = time.monotonic()
+    b, packets = run(tmp_path, "tempo 120\nstart\n"
+                     + "play square1 0.7 01010101 e3 1 0.2\nwait 1\nplay square1 0.7 01010101 g3 1 0.2\nwait 1\n" * 150)
+    assert time.monotonic() - started < 5.0
+    # 300 bars of 2 seconds
+    assert b.clock.now() == 600.0
+    assert b.bars == 300
+
+def test_packets_are_sent_at_the_script_times(tmp_path):
+    b, packets = run(tmp_path, "tempo 120\nstart\nplay square1 0.7 1 e3 1 0.2\nwait 1\n"
+                     "master_vol 0.5\nwait 0.5\nplay square1 0.7 1 g3 1 0.2\nwait 2\n")
+    timeline = [(stamp, addresses(msg)) for stamp, msg in packets]
+    stops = [stamp for stamp, names in timeline if "/stop" in names]
+    assert stops == [0.0]
+    assert [(stamp, names) for stamp, names in timeline if stamp > 0] == [
+        (2.0, ["/master_vol"]),
+        (3.0, ["/square1"]),
+    ]
+    [(_, last)] = [(stamp, msg) for stamp, msg in packets if stamp == 3.0]
+    assert last.values()[2:4] == ["1 0 0 0 0 0 0 0", 55]
+    assert b.clock.now() == 7.0
+
+def test_tempo_changes_rescale_the_waits(tmp_path):
+    b, packets = run(tmp_path, "tempo 120\nwait 1\ntempo 60\nmaster_vol 0.3\nwait 1\nmaster_vol 0.4\n")
+    timeline = [(stamp, addresses(msg)) for stamp, msg in packets]
+    assert timeline[1:] == [(0.0, ["/tempo"]), (2.0, ["/tempo", "/master_vol"]), (6.0, ["/master_vol"])]
+    assert packets[1][1].values() == [240.0]
+    assert packets[2][1].values()[0].values() == [120.0]
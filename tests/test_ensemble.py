@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+import bb_ensemble
+
+# the follower's local clock runs 80 ppm slow and 1234.5 s behind the leader
+SKEW = 80e-6
+OFFSET = 1234.5
+
+def leader_time(local):
+    return local + OFFSET + SKEW * local
+
+def local_time(stamp):
+    return (stamp - OFFSET) / (1 + SKEW)
+
+@pytest.fixture
+def follower():
+    follower = bb_ensemble.EnsembleFollower(("127.0.0.1", 9))
+    yield follower
+    follower.socket.close()
+
+def sync(follower, seconds=16.0, seed=1):
+    """Feeds the follower the sync exchanges of 'seconds' of following, with
+    one-way delays of 50 us to 2 ms and a few slow round trips"""
+    rng = random.Random(seed)
+    t1 = 100.0
+    while t1 < 100.0 + seconds:
+        there, back = (rng.uniform(50e-6, 2e-3) * (20 if rng.random() < 0.1 else 1) for _ in range(2))
+        t2 = leader_time(t1 + there)
+        t3 = t2 + 30e-6
+        t4 = local_time(t3) + back
+        follower._add_sample(t1, t2, t3, t4)
+        t1 += 0.25
+    return t1
+
+def test_follower_estimates_the_leader_clock_within_a_millisecond(follower):
+    end = sync(follower)
+    assert follower.skew == pytest.approx(SKEW, abs=20e-6)
+    for local in (end - 10, end, end + 5, end + 10):
+        assert abs(follower.to_leader(local) - leader_time(local)) < 0.001
+
+def test_follower_wakes_for_the_leader_bars_within_a_millisecond(follower):
+    end = sync(follower)
+    bar_duration = 2.0
+    first = leader_time(end)
+    for bar in range(5):
+        stamp = first + bar * bar_duration
+        woke = follower.to_local(stamp)
+        assert abs(leader_time(woke) - stamp) < 0.001
+        assert follower.to_leader(woke) == pytest.approx(stamp, abs=1e-9)
+
+def test_bar_numbers_follow_the_leader_grid(follower):
+    follower.beat = (5000.0, 40, 2.0)
+    assert follower.bar_index(5000.0) == 40
+    assert follower.bar_index(5006.0) == 43
+    assert follower.bar_index(4998.0) == 39
+
+def test_slow_round_trips_are_left_out(follower):
+    sync(follower, seconds=4.0)
+    assert follower.delay < 4e-3
+    assert len(follower.samples) == 16
+    assert abs(follower.offset + follower.skew * (100.0 - follower.reference) - (leader_time(100.0) - 100.0)) < 0.001
@@ -0,0 +1,43 @@
+import threading
+
+import BitBeats
+
+def make_shell(tmp_path):
+    clock = BitBeats.VirtualClock()
+    b = BitBeats.BitBeats(clock=clock, transport=BitBeats.MemoryTransport(clock))
+    b.flight_dir = str(tmp_path)
+    return b
+
+def test_dumps_in_the_same_second_do_not_overwrite(tmp_path):
+    b = make_shell(tmp_path)
+    paths = {b.dump_flight("first"), b.dump_flight("second")}
+    assert len(paths) == 2
+    assert len(list(tmp_path.iterdir())) == 2
+
+def test_missing_script_records_without_dumping(tmp_path):
+    b = make_shell(tmp_path)
+    b.onecmd(f"run_script {tmp_path / 'missing.txt'}")
+    assert list(tmp_path.iterdir()) == []
+    [(kind, _, _, _, text)] = [e for e in b.flight.events() if e[0] == "error"]
+    assert text.startswith("FileNotFoundError")
+
+def test_invalid_start_bar_records_and_dumps(tmp_path):
+    script = tmp_path / "song.txt"
+    script.write_text("tempo 120\nwait 1\n")
+    b = make_shell(tmp_path)
+    b.onecmd(f"run_script {script} --from-bar chorus")
+    [dump] = tmp_path.glob("*.log")
+    assert "ValueError" in dump.read_text()
+
+def test_threads_share_the_recorder():
+    recorder = BitBeats.FlightRecorder(capacity=64)
+    def record():
+        for i in range(1000):
+            recorder.record(BitBeats.FlightRecorder.SEND, "/square1", size=i)
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert recorder.total == 4000
+    assert len(recorder.events()) == 64
@@ -0,0 +1,59 @@
+import pytest
+
+import OSC
+import OSC_server
+
+@pytest.fixture
+def counters():
+    counters = OSC.OSCCounters()
+    counters.attach()
+    yield counters
+    counters.detach()
+
+def test_disabled_hooks_are_not_called(monkeypatch):
+    counters = OSC.OSCCounters()
+    counters.attach()
+    counters.detach()
+    assert not OSC._hooksActive
+    monkeypatch.setattr(OSC, "_runHooks", lambda *args: pytest.fail("hook called"))
+    msg = OSC.OSCMessage("/square1")
+    msg.append(0.5)
+    msg.getBinary()
+    bundle = OSC.OSCBundle()
+    bundle.append(msg)
+    bundle.getBinary()
+
+def test_counters_follow_a_message_from_client_to_handler(counters):
+    received = []
+    server = OSC_server.OSCServer(("127.0.0.1", 0))
+    server.timeout = 2.0
+    server.addMsgHandler("/square1", lambda addr, tags, data, source: received.append(data))
+    client = OSC.OSCClient()
+    try:
+        msg = OSC.OSCMessage("/square1")
+        msg.append(0.5)
+        size = len(msg.getBinary())
+        counters.reset()
+        client.sendto(msg, server.address())
+        server.handle_request()
+    finally:
+        client.close()
+        server.close()
+
+    assert received == [[0.5]]
+    assert counters.counts == {"encode": 1, "send": 1, "error": 0, "receive": 1, "decode": 1, "dispatch": 1}
+    assert counters.bytes["send"] == counters.bytes["receive"] == size
+    assert all(seconds >= 0.0 for seconds in counters.seconds.values())
+
+def test_send_errors_are_counted(counters):
+    client = OSC.OSCClient()
+    msg = OSC.OSCMessage("/square1")
+    with pytest.raises((OSC.OSCClientError, OSError)):
+        client.sendto(msg, ("256.0.0.1", 9999))
+    client.close()
+    assert counters.counts["error"] == 1
+    assert counters.counts["send"] == 0
+
+def test_unknown_events_are_rejected():
+    with pytest.raises(ValueError):
+        OSC.addHook("flush", lambda *args: None)
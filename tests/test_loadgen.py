@@ -0,0 +1,37 @@
+import pytest
+
+import bb_loadgen
+import bb_receiver
+
+def test_command_mix_packets_decode_to_their_counts():
+    packets, counts = bb_loadgen.command_mix_packets()
+    assert len(packets) == len(counts) > len(bb_loadgen.COMMAND_MIX)
+    for packet, count in zip(packets, counts):
+        assert len(list(bb_receiver.decode_packet(packet))) == count >= 1
+    # the last packet is a whole bar sent as one bundle
+    assert packets[-1].startswith(b"#bundle\0")
+    assert counts[-1] == 4
+
+def test_stand_in_adapter_counts_messages_and_probes():
+    counter = bb_loadgen._Counter()
+    adapter = bb_loadgen._StandInAdapter(counter)
+    packets, counts = bb_loadgen.command_mix_packets()
+    for packet in packets:
+        adapter.handle_packet(packet, 0.0)
+    adapter.handle_packet(bb_loadgen.probe_packet(), 0.0)
+    messages, latency = counter.snapshot()
+    assert messages == sum(counts) + 1
+    assert latency.count == 1
+    assert adapter.receiver.errors == 0
+    assert counter.messages == 0
+
+@pytest.mark.parametrize("mode", bb_loadgen.MODES)
+def test_a_low_rate_passes_every_receiver(mode):
+    result = bb_loadgen.find_saturation(mode, sessions=2, start_rate=200, max_rate=200, duration=0.3,
+                                        max_latency=1.0, log=lambda line: None)
+    [step] = result["steps"]
+    assert result["saturation_rate"] == 200
+    assert result["reason"] == "max rate reached"
+    assert step["packets"] == 60
+    assert step["received"] == step["messages"]
+    assert step["latency_max"] is not None
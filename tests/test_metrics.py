@@ -0,0 +1,78 @@
+import socket
+import threading
+
+import pytest
+
+import BitBeats
+import bb_metrics
+
+def test_stats_packets_and_errors_are_counted_once():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    stats = BitBeats.SessionStats()
+    stats.record_send("/square1", 0.0)
+    stats.record_send("/square1", 0.0, failed=True)
+    exporter = bb_metrics.MetricsExporter(stats, interval=60, osc_target=receiver.getsockname())
+    exporter.start()
+    exporter.stop()
+    receiver.settimeout(1)
+    assert receiver.recv(1024).startswith(b"/stats")
+    receiver.close()
+
+    metrics = exporter.collect()
+    assert metrics["send_errors"] == 1
+    assert metrics["bytes"] == 0
+    assert exporter.counters.totals().get("send", 0) == 0
+
+def test_prometheus_text_declares_every_series():
+    stats = BitBeats.SessionStats()
+    stats.record("lateness", 0.001)
+    stats.record("lateness", 0.003)
+    text = bb_metrics.format_prometheus(bb_metrics.MetricsExporter(stats).collect())
+    lines = text.splitlines()
+    declared = {line.split()[2]: line.split()[3] for line in lines if line.startswith("# TYPE")}
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        name = line.split("{")[0].split()[0]
+        base = name.rsplit("_", 1)[0] if name.endswith(("_sum", "_count")) else name
+        assert name in declared or declared.get(base) == "summary", name
+    assert "bitbeats_bar_lateness_seconds_sum 0.004000" in lines
+    assert "bitbeats_bar_lateness_seconds_count 2" in lines
+
+def test_collect_while_threads_send():
+    stats = BitBeats.SessionStats()
+    exporter = bb_metrics.MetricsExporter(stats)
+    done = threading.Event()
+
+    def send():
+        i = 0
+        while not done.is_set():
+            stats.record_send(f"/channel{i % 5000}", 0.0)
+            stats.record("lateness", 0.001)
+            i += 1
+
+    threads = [threading.Thread(target=send) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    try:
+        for _ in range(200):
+            metrics = exporter.collect()
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+    assert sum(metrics["addresses"].values()) == metrics["messages"]
+
+def test_receive_queue_of_a_local_port():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.sendto(b"x" * 100, receiver.getsockname())
+    exporter = bb_metrics.MetricsExporter(BitBeats.SessionStats(), queue_port=receiver.getsockname()[1])
+    queue_bytes = exporter.collect()["queue_bytes"]
+    sender.close()
+    receiver.close()
+    if queue_bytes is None:
+        pytest.skip("/proc/net/udp is not available")
+    assert queue_bytes > 0
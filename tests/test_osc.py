@@ -0,0 +1,19 @@
+import pytest
+
+import OSC
+import OSC_server
+
+def test_set_server_checks_the_server_class():
+    server = OSC_server.OSCServer(("127.0.0.1", 0))
+    try:
+        client = OSC.OSCClient()
+        client.setServer(server)
+        assert client.server is server
+        with pytest.raises(ValueError):
+            client.setServer(object())
+    finally:
+        server.close()
+
+def test_builtin_arguments_skip_the_numpy_lookup(monkeypatch):
+    monkeypatch.setattr(OSC, "_addNumpyType", lambda argtype: pytest.fail("looked up %s" % argtype))
+    assert OSC.OSCArgument("hello") == ("s", OSC.OSCString("hello"))
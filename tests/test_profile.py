@@ -0,0 +1,36 @@
+import pstats
+import time
+
+import BitBeats
+
+SONG = "tempo 120\nstart\n" + "play square1 0.7 01010101 e3 1 0.2\nwait 1\nplay square1 0.7 1 g3 1 0.2\nwait 1\n" * 20
+
+def function_names(path):
+    return {name for _, _, name in pstats.Stats(str(path)).stats}
+
+def test_profile_writes_loadable_stats_without_waiting(tmp_path, capsys):
+    script = tmp_path / "song.txt"
+    script.write_text(SONG)
+    transport = BitBeats.MemoryTransport()
+    b = BitBeats.BitBeats(transport=transport)
+    started = time.monotonic()
+    b.onecmd(f"profile {script} --memory")
+    # 40 bars of 2 seconds on the real clock
+    assert time.monotonic() - started < 10.0
+    assert isinstance(b.clock, BitBeats.RealClock)
+
+    names = function_names(tmp_path / "song.pstats")
+    assert {"play_compiled", "_send_packet"} <= names
+    assert "sleep" not in names
+    assert len(transport.packets) > 40
+    output = capsys.readouterr().out
+    assert "Top allocations:" in output
+    assert f"Profile written to {tmp_path / 'song.pstats'}" in output
+
+def test_profile_flag_profiles_the_command_line(tmp_path, monkeypatch):
+    script = tmp_path / "song.txt"
+    script.write_text(SONG)
+    out_file = tmp_path / "out.pstats"
+    monkeypatch.setattr(BitBeats, "OSCTransport", lambda *args, **kwargs: BitBeats.MemoryTransport())
+    BitBeats.main([f"--profile={out_file}", "run_script", str(script)])
+    assert "play_compiled" in function_names(out_file)
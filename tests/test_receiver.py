@@ -0,0 +1,70 @@
+import pytest
+
+import BitBeats
+import bb_receiver
+
+def play(lines):
+    clock = BitBeats.VirtualClock()
+    receiver = bb_receiver.StandInReceiver()
+    b = BitBeats.BitBeats(clock=clock, transport=bb_receiver.ReceiverTransport(receiver, clock))
+    for line in lines:
+        b.onecmd(b.precmd(line))
+    return receiver
+
+def test_receiver_keeps_the_state_set_by_the_commands():
+    receiver = play([
+        "tempo 120",
+        "start",
+        "play square1 0.7 01010101 e3 1 0.2, noise 0.5 1001 lp 3000 10 50 3 50",
+        "set_effect square1 3 P1M3P4",
+        "wait 1",
+        "master_vol 0.5",
+        "wait 1",
+    ])
+    assert receiver.errors == 0
+    assert receiver.tempo == 240.0
+    assert receiver.bar_duration == 2.0
+    assert receiver.running
+    assert receiver.master_vol == 0.5
+
+    square1 = receiver.channels["/square1"]
+    assert square1.vol == pytest.approx(0.7)
+    assert square1.pattern == [0, 1, 0, 1, 0, 1, 0, 1]
+    assert square1.params == [52, 1.0, pytest.approx(0.2)]
+    assert square1.arp_steps == 3
+    assert square1.arp[:3] == [0, 4, 5]
+
+    noise = receiver.channels["/noise"]
+    assert noise.pattern == [1, 0, 0, 1, 0, 0, 0, 0]
+    assert noise.params[:2] == ["0 1 0", 3000.0]
+
+def test_messages_on_the_bar_grid_have_no_offset():
+    receiver = play(["tempo 120", "start", "wait 1", "master_vol 0.5", "wait 2", "master_vol 0.6"])
+    summary = receiver.summary()
+    assert summary["counts"]["/master_vol"] == 2
+    assert len(receiver.bar_offsets) == 2
+    assert summary["bar_offset_max"] < 1e-6
+    assert receiver.bars_at(receiver.arrivals[-1]) == pytest.approx(3.0)
+
+def test_stop_halts_the_sequencer():
+    receiver = play(["tempo 120", "start", "wait 1", "stop"])
+    assert not receiver.running
+    assert receiver.channels["/square1"].vol == 0.0
+
+@pytest.mark.parametrize("msg, error", [
+    (BitBeats.OSC.OSCMessage("/square1", ["values", 0.5, "1 0"]), "values needs 5 arguments"),
+    (BitBeats.OSC.OSCMessage("/square1", ["bogus", 1]), "unknown selector"),
+    (BitBeats.OSC.OSCMessage("/noise", ["values_eff", 3, "0 4 7"]), "unknown selector"),
+    (BitBeats.OSC.OSCMessage("/tempo", 0.0), "tempo must be positive"),
+    (BitBeats.OSC.OSCMessage("/saw", 1), "unknown address /saw"),
+])
+def test_receiver_counts_messages_the_patch_would_reject(msg, error):
+    receiver = bb_receiver.StandInReceiver()
+    receiver.handle_packet(msg.getBinary(), 0.0)
+    assert receiver.errors == 1
+    assert error in receiver.error_messages[0]
+
+def test_truncated_packets_are_errors():
+    receiver = bb_receiver.StandInReceiver()
+    receiver.handle_packet(BitBeats.OSC.OSCMessage("/square1", ["values", 0.5]).getBinary()[:-3], 0.0)
+    assert receiver.errors == 1
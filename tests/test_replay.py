@@ -0,0 +1,58 @@
+import socket
+
+import OSC
+
+import BitBeats
+import bb_replay
+
+def message(address, value):
+    msg = OSC.OSCMessage(address)
+    msg.append(value)
+    return msg.getBinary()
+
+def write_capture(path):
+    with open(path, "wb") as f:
+        f.write(OSC._captureHeader.pack(OSC._captureMagic, 100.0, 0.0))
+    writer = OSC.OSCCaptureWriter(path)
+    writer.write(message("/square1", 1), timestamp=100.0, destination=("127.0.0.1", 9999))
+    writer.write(message("/noise", 2), timestamp=100.5, destination=("127.0.0.1", 9999))
+    writer.write(message("/square1", 3), timestamp=101.0, destination=("127.0.0.1", 10000))
+    writer.write(message("/square2", 4), timestamp=101.5, destination=("127.0.0.1", 9999))
+    writer.write(message("/square1", 5), timestamp=102.0, destination=("127.0.0.1", 9999))
+    writer.close()
+
+def test_replay_keeps_timing_between_start_and_end_for_one_destination(tmp_path):
+    capture_file = str(tmp_path / "show.osccap")
+    write_capture(capture_file)
+    clock = BitBeats.VirtualClock(10.0)
+    sent = []
+    reader = OSC.OSCCaptureReader(capture_file)
+    report = bb_replay.replay(reader, lambda packet: sent.append((clock.now(), OSC.decodeOSC(bytes(packet)))),
+                              speed=2.0, start=0.5, end=1.5, clock=clock, destination="localhost:9999")
+    reader.close()
+
+    assert sent == [(10.0, ["/noise", ",i", 2]), (10.5, ["/square2", ",i", 4])]
+    assert report["packets"] == 2
+    assert report["captured_seconds"] == 1.0
+    assert report["intended_seconds"] == report["achieved_seconds"] == 0.5
+    assert report["lateness_max"] == 0.0
+
+def test_main_filters_addresses_and_destination(tmp_path):
+    capture_file = str(tmp_path / "show.osccap")
+    write_capture(capture_file)
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    port = receiver.getsockname()[1]
+
+    assert bb_replay.main([capture_file, "--target", f"127.0.0.1:{port}", "--max-speed", "--start", "0.2",
+                           "--filter=-/noise", "--destination", "127.0.0.1:9999"]) == 0
+    received = []
+    receiver.settimeout(0.2)
+    try:
+        while True:
+            received.append(OSC.decodeOSC(receiver.recv(1024)))
+    except socket.timeout:
+        pass
+    receiver.close()
+
+    assert received == [["/square2", ",i", 4], ["/square1", ",i", 5]]
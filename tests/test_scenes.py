@@ -0,0 +1,65 @@
+import pytest
+
+import BitBeats
+import bb_receiver
+
+def make_engine():
+    clock = BitBeats.VirtualClock()
+    return BitBeats.Engine(clock=clock, transport=BitBeats.MemoryTransport(clock))
+
+def addresses(packet):
+    return [m.address for m in packet.values()]
+
+def test_stop_is_one_cached_bundle_that_follows_the_channels():
+    engine = make_engine()
+    engine.stop()
+    engine.stop()
+    [(_, first), (_, second)] = engine.transport.packets
+    assert first is second
+    assert addresses(first) == ["/master_vol", "/triangle", "/square1", "/square2", "/noise",
+                                "/triangle", "/square1", "/square2", "/stop"]
+
+    engine.add_channel("square3", "square")
+    engine.stop()
+    assert addresses(engine.transport.packets[-1][1]).count("/square3") == 2
+
+def test_pause_of_several_channels_is_one_cached_bundle():
+    engine = make_engine()
+    engine.play("square1", 0.5, [1], 52, 1, 0.2)
+    engine.pause("noise", "square1")
+    engine.pause("noise", "square1")
+    [_, (_, first), (_, second)] = engine.transport.packets
+    assert first is second
+    assert addresses(first) == ["/noise", "/square1"]
+    assert ("/square1", "values") not in engine.state
+
+def test_scene_switches_the_whole_arrangement_with_one_packet():
+    clock = BitBeats.VirtualClock()
+    receiver = bb_receiver.StandInReceiver()
+    b = BitBeats.BitBeats(clock=clock, transport=bb_receiver.ReceiverTransport(receiver, clock))
+    for line in ["play square1 0.7 01010101 e3 1 0.2, noise 0.5 1001 lp 3000 10 50 3 50",
+                 "set_effect square1 3 P1M3P4",
+                 "scene save verse",
+                 "play square1 0.3 1 a3 2 0.5, square2 0.6 11 c4 1 0.25",
+                 "stop_effect square1"]:
+        b.onecmd(b.precmd(line))
+    packets = receiver.packets
+    b.onecmd("scene verse")
+
+    assert receiver.packets == packets + 1
+    assert receiver.errors == 0
+    square1 = receiver.channels["/square1"]
+    assert (square1.vol, square1.params[0], square1.arp_steps) == (pytest.approx(0.7), 52, 3)
+    assert receiver.channels["/square2"].vol == 0.0
+    assert receiver.channels["/noise"].vol == 0.5
+
+def test_unknown_scenes_are_errors(capsys):
+    engine = make_engine()
+    with pytest.raises(BitBeats.BitBeatsError):
+        engine.recall_scene("chorus")
+    b = BitBeats.BitBeats(clock=BitBeats.VirtualClock(), transport=BitBeats.MemoryTransport())
+    b.onecmd("scene save verse")
+    b.onecmd("scene delete verse")
+    b.onecmd("scene verse")
+    assert "ERROR: No such scene: verse" in capsys.readouterr().out
+    assert b.transport.packets == []
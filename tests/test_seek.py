@@ -0,0 +1,62 @@
+import BitBeats
+import OSC
+import bb_receiver
+
+SONG = """tempo 120
+start
+play square1 0.7 01010101 e3 1 0.2
+wait 1
+play square2 0.5 1 g3 2 0.5
+set_effect square1 3 P1M3P4
+wait 1
+master_vol 0.6
+play square1 0.4 11 a3 1 0.2
+wait 1
+play noise 0.5 1001 lp 3000 10 50 3 50
+wait 1
+"""
+
+def play(tmp_path, lines):
+    script = tmp_path / "song.txt"
+    script.write_text(SONG)
+    clock = BitBeats.VirtualClock()
+    receiver = bb_receiver.StandInReceiver()
+    b = BitBeats.BitBeats(clock=clock, transport=bb_receiver.ReceiverTransport(receiver, clock))
+    for line in lines:
+        b.onecmd(b.precmd(line.format(script=script)))
+    return b, receiver
+
+def state(receiver):
+    channels = {address: (c.vol, c.pattern, c.params, c.arp_steps, c.arp) for address, c in receiver.channels.items()}
+    return receiver.tempo, receiver.master_vol, channels
+
+def test_from_bar_restores_the_state_of_the_bar_in_one_packet(tmp_path):
+    b, whole = play(tmp_path, ["run_script {script}"])
+    b, seeked = play(tmp_path, ["run_script {script} --from-bar 3"])
+    assert seeked.errors == whole.errors == 0
+    assert state(seeked) == state(whole)
+    # two bars of 2 seconds instead of four
+    assert b.clock.now() == 4.0
+    assert b.bars == 2
+    assert seeked.packets < whole.packets
+
+def test_seek_to_the_last_bar_skips_the_earlier_waits(tmp_path):
+    b, receiver = play(tmp_path, ["run_script {script}", "seek 4"])
+    assert b.clock.now() == 8.0 + 2.0
+
+def test_loop_replays_the_bars_from_the_compiled_packets(tmp_path):
+    script = tmp_path / "song.txt"
+    script.write_text(SONG)
+    clock = BitBeats.VirtualClock()
+    transport = BitBeats.MemoryTransport(clock)
+    b = BitBeats.BitBeats(clock=clock, transport=transport)
+    b.onecmd(f"run_script {script}")
+    b.onecmd("stop")
+    del transport.packets[:]
+    b.onecmd("loop 2 3 2")
+
+    assert clock.now() == 8.0 + 4 * 2.0
+    master = [stamp for stamp, msg in transport.packets
+              for m in (msg.values() if isinstance(msg, OSC.OSCBundle) else [msg]) if m.address == "/master_vol"]
+    # bar 3 starts 2 seconds into each of the two loops
+    assert master[-2:] == [10.0, 14.0]
@@ -0,0 +1,31 @@
+import BitBeats
+
+class LateClock(BitBeats.VirtualClock):
+    """Virtual clock reaching every deadline 10 ms late"""
+
+    def sleep_until(self, deadline):
+        super().sleep_until(deadline + 0.01)
+
+def test_late_bars_are_counted_at_bar_starts_only():
+    engine = BitBeats.Engine(clock=LateClock(), transport=BitBeats.MemoryTransport())
+    engine.set_tempo(120)
+    for _ in range(4):
+        engine.advance(0.5)
+    assert engine.stats.histograms["lateness"].count == 4
+    assert engine.stats.late_bars == 2
+
+def test_late_bars_of_a_script(tmp_path):
+    script = tmp_path / "song.txt"
+    script.write_text("tempo 120\nrepeat 2 {\nplay square1 0.5 1 e3 1 0.2\nwait 0.5\nplay square1 0.5 1 g3 1 0.2\nwait 0.5\n}\n")
+    clock = LateClock()
+    b = BitBeats.BitBeats(clock=clock, transport=BitBeats.MemoryTransport(clock))
+    b.onecmd(f"run_script {script}")
+    assert b.stats.late_bars == 2
+
+def test_play_times_validation_encoding_and_channels_separately():
+    b = BitBeats.BitBeats(clock=BitBeats.VirtualClock(), transport=BitBeats.MemoryTransport())
+    b.onecmd("play square1 0.5 1 e3 1 0.2, triangle 0.5 1 e3 1 0")
+    assert b.stats.histograms["validate"].count == 2
+    assert b.stats.histograms["encode"].count == 2
+    assert {"play square1", "play triangle"} <= set(b.stats.histograms)
+    assert "play " not in b.stats.histograms
@@ -0,0 +1,75 @@
+import socket
+
+import pytest
+
+import BitBeats
+import OSC
+
+class DeadClient:
+    """Client of a target whose Pd instance is not running"""
+
+    def __init__(self):
+        self.attempts = 0
+        self.alive = False
+
+    def send(self, msg, timeout=None):
+        self.attempts += 1
+        if not self.alive:
+            raise OSC.OSCClientError("Connection refused")
+        return len(msg.getBinary())
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(1.0)
+    yield sock
+    sock.close()
+
+def make_transport(receiver):
+    clock = BitBeats.VirtualClock()
+    good = "127.0.0.1:%d" % receiver.getsockname()[1]
+    transport = BitBeats.MultiTransport([good, "127.0.0.1:9"], clock)
+    dead = DeadClient()
+    transport.clients[("127.0.0.1", 9)] = dead
+    return transport, clock, dead
+
+def test_dead_target_backs_off_while_the_others_receive_everything(receiver):
+    transport, clock, dead = make_transport(receiver)
+    health = transport.health[("127.0.0.1", 9)]
+    sent_at = [0.0, 0.05, 0.1, 0.25, 0.35, 0.6]
+    for stamp in sent_at:
+        clock.time = stamp
+        transport.send(OSC.OSCMessage("/master_vol", stamp))
+    # retries after 0.1 s, then 0.2 s, then 0.4 s
+    assert dead.attempts == 3
+    assert (health.errors, health.skipped, health.failures) == (3, 3, 3)
+    assert health.retry_at == pytest.approx(0.75)
+    assert health.error_rate() == 1.0
+    received = [OSC.decodeOSC(receiver.recv(1024))[2] for _ in sent_at]
+    assert received == pytest.approx(sent_at)
+
+def test_backoff_is_capped_and_reset_by_a_successful_send(receiver):
+    transport, clock, dead = make_transport(receiver)
+    health = transport.health[("127.0.0.1", 9)]
+    for _ in range(10):
+        clock.time = health.retry_at
+        transport.send(OSC.OSCMessage("/start", 1))
+    assert health.retry_at - clock.time == transport.max_backoff
+    dead.alive = True
+    clock.time = health.retry_at
+    transport.send(OSC.OSCMessage("/start", 1))
+    assert (health.sent, health.failures) == (1, 0)
+    transport.send(OSC.OSCMessage("/stop", 0))
+    assert health.sent == 2
+
+def test_send_fails_only_when_no_target_is_reachable():
+    transport = BitBeats.MultiTransport(["127.0.0.1:9"], BitBeats.VirtualClock())
+    transport.clients[("127.0.0.1", 9)] = DeadClient()
+    with pytest.raises(OSC.OSCClientError):
+        transport.send(OSC.OSCMessage("/start", 1))
+    # skipped while backing off, so nothing fails
+    assert transport.send(OSC.OSCMessage("/start", 1)) == 0
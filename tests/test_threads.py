@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+import BitBeats
+import OSC
+import bb_receiver
+
+CALLS = 300
+
+def drive(engine, calls):
+    """Runs every call in its own thread, all starting at once"""
+    barrier = threading.Barrier(len(calls))
+    def run(call):
+        barrier.wait()
+        for i in range(CALLS):
+            call(engine, i)
+    threads = [threading.Thread(target=run, args=(call,)) for call in calls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def play_square1(engine, i):
+    engine.play("square1", i / CALLS, [1, 0], 40 + i % 40, 1, 0.25)
+
+def play_square2(engine, i):
+    engine.play("square2", i / CALLS, [0, 1], 60 + i % 40, 2, 0.5)
+
+def play_both_in_a_bundle(engine, i):
+    with engine.batch():
+        engine.play("triangle", i / CALLS, [1, 1], 30 + i % 40, 4)
+        engine.set_effect("triangle", 2, [0, i % 12])
+
+def test_threads_keep_their_order_and_messages_stay_whole():
+    engine = BitBeats.Engine(transport=BitBeats.MemoryTransport(), clock=BitBeats.VirtualClock())
+    drive(engine, [play_square1, play_square2, play_both_in_a_bundle])
+
+    decoded = [OSC.decodeOSC(msg.getBinary()) for _, msg in engine.transport.packets]
+    square1 = [m for m in decoded if m[0] == "/square1"]
+    square2 = [m for m in decoded if m[0] == "/square2"]
+    bundles = [m for m in decoded if m[0] == "#bundle"]
+    assert len(decoded) == 3 * CALLS
+    # every thread's messages arrive complete and in the order of its calls
+    assert [m[2:] for m in square1] == [["values", pytest.approx(i / CALLS), "1 0 0 0 0 0 0 0", 40 + i % 40, 1.0, 0.25]
+                                        for i in range(CALLS)]
+    assert [m[2:] for m in square2] == [["values", pytest.approx(i / CALLS), "0 1 0 0 0 0 0 0", 60 + i % 40, 2.0, 0.5]
+                                        for i in range(CALLS)]
+    assert [(play[0], play[5], effect[0], effect[4]) for _, _, play, effect in bundles] == [
+        ("/triangle", 30 + i % 40, "/triangle", f"0 {i % 12} 0 0 0 0 0 0 0 0 0 0") for i in range(CALLS)]
+    assert engine.stats.messages == 3 * CALLS
+
+def test_threads_share_one_udp_transport():
+    receiver = bb_receiver.StandInReceiver()
+    udp = bb_receiver.UDPReceiver(receiver, port=0)
+    udp.start()
+    transport = BitBeats.OSCTransport(*udp.address)
+    engine = BitBeats.Engine(transport=transport, clock=BitBeats.VirtualClock())
+    try:
+        drive(engine, [play_square1, play_square2, play_both_in_a_bundle])
+        deadline = time.monotonic() + 2.0
+        while len(receiver.arrivals) < 4 * CALLS and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        transport.client.close()
+        udp.stop()
+    assert receiver.errors == 0
+    assert receiver.packets == 3 * CALLS
+    assert receiver.channels["/square1"].params[0] == 40 + (CALLS - 1) % 40
+    assert receiver.channels["/square2"].params[0] == 60 + (CALLS - 1) % 40
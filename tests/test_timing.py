@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+import BitBeats
+import bb_timing
+
+def test_constant_error_has_no_drift_or_jitter():
+    result = bb_timing.analyse([0.002] * 10)
+    assert result["bars"] == 10
+    assert result["mean_error"] == pytest.approx(0.002)
+    assert result["max_abs_error"] == pytest.approx(0.002)
+    assert result["drift"] == pytest.approx(0.0, abs=1e-12)
+    assert result["jitter"] == pytest.approx(0.0, abs=1e-12)
+
+def test_growing_error_is_drift_and_alternating_error_is_jitter():
+    assert bb_timing.analyse([k * 0.001 for k in range(11)])["drift"] == pytest.approx(0.01)
+    alternating = bb_timing.analyse([0.001 * (k % 2) for k in range(100)])
+    assert alternating["drift"] == pytest.approx(0.0, abs=1e-4)
+    assert alternating["jitter"] == pytest.approx(0.001, rel=1e-3)
+    assert alternating["p50_abs_error"] == 0.001
+
+def test_reference_script_plays_the_bars_it_reports(tmp_path):
+    path = str(tmp_path / "reference.txt")
+    bars = bb_timing.reference_script(path, 120, 1)
+    assert bars == 30
+    report = BitBeats.check_script(path)
+    assert report["errors"] == []
+    assert report["bars"] == bars
+
+def test_quick_run_writes_a_report(tmp_path):
+    report_file = tmp_path / "timing.json"
+    assert bb_timing.main(["--minutes", "0.01", "--tempos", "960", "--report", str(report_file)]) == 0
+    report = json.loads(report_file.read_text())
+    [result] = report["results"]
+    assert (result["tempo"], result["minutes"], result["bars"]) == (960, 0.01, 2)
+    # a loose bound, the run shares the host with the other tests
+    assert result["max_abs_error"] < 0.1
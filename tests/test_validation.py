@@ -0,0 +1,39 @@
+import pytest
+
+import BitBeats
+
+@pytest.fixture
+def engine():
+    return BitBeats.Engine(transport=BitBeats.MemoryTransport(), clock=BitBeats.VirtualClock())
+
+@pytest.mark.parametrize("call", [
+    lambda e: e.play("square1", 0.5, [1], "e3", 1),
+    lambda e: e.play("square1", 0.5, [1], None, 1),
+    lambda e: e.play("square1", "0.7", [1], 52, 1),
+    lambda e: e.play("square1", 0.5, None, 52, 1),
+    lambda e: e.play("square1", 0.5, [1], 52, 1, duty=None),
+    lambda e: e.play_noise(0.5, [1], "lp", -5),
+    lambda e: e.play_noise(0.5, [1], "lp", "200"),
+    lambda e: e.play_noise(0.5, [1], ["lp"], 200),
+    lambda e: e.set_values("square1", None),
+    lambda e: e.set_tempo("120"),
+    lambda e: e.set_tempo(None),
+    lambda e: e.set_master_vol("0.5"),
+    lambda e: e.set_effect("square1", "3", [0, 4, 7]),
+    lambda e: e.set_effect("square1", 3, 7),
+    lambda e: e.advance("2"),
+])
+def test_wrong_arguments_raise_bitbeats_error(engine, call):
+    engine.set_tempo(120)
+    with pytest.raises(BitBeats.BitBeatsError):
+        call(engine)
+
+def test_error_names_the_argument(engine):
+    with pytest.raises(BitBeats.BitBeatsError) as error:
+        engine.play("square1", 0.5, [1], "e3", 1)
+    assert (error.value.argument, error.value.value) == ("note", "e3")
+
+def test_valid_arguments_are_sent(engine):
+    engine.play_noise(0.5, [1, 0, 1], "lp", 0)
+    engine.play("square1", 0.5, [1], 52, 1)
+    assert len(engine.transport.packets) == 2